@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""行事カレンダーからのURL抽出のベンチマーク
+
+日毎に `soup.find` で正規表現検索する以前の方法と,
+一度の走査で `CalendarIndex` を作る方法を比べる.
+
+usage:
+    python benchmarks/bench_calendar.py
+"""
+import datetime
+import re
+import timeit
+
+from kueventparser.adapters.official import OfficialEventFactory
+from kueventparser.utils import content_to_soup
+
+
+def make_calendar(year: int = 2019, month: int = 2, events_per_day: int = 5) -> bytes:
+    """ベンチマーク用の行事カレンダーのHTMLを作る
+
+    Args:
+        year(int): 年
+        month(int): 月
+        events_per_day(int): 1日あたりのイベント数
+
+    Returns:
+        bytes: HTML
+    """
+    start = datetime.date(year, month, 1)
+    rows = []
+    day = start
+    while day.month == month:
+        links = "".join(
+            '<li><a href="http://www.kyoto-u.ac.jp/ja/social/events_news/department/'
+            'dept{1}/events/{0:%Y}/{0:%y%m%d}_{1}.html">event {1}</a></li>'.format(day, n)
+            for n in range(events_per_day))
+        rows.append('<tr><td class="day">{}</td><td class="week"></td>'
+                    '<td class="event_of_day"><ul>{}</ul></td></tr>'.format(day.day, links))
+        day += datetime.timedelta(1)
+    html = ('<html><head><meta charset="utf-8"></head><body><table class="calendar"><tbody>'
+            '{}</tbody></table></body></html>').format("".join(rows))
+    return html.encode("utf-8")
+
+
+def legacy_urls(soup, start: datetime.date, end: datetime.date):
+    """以前の実装(日毎に全体を正規表現で検索する)"""
+    urls = []
+    for n in range((end - start).days):
+        date = start + datetime.timedelta(n)
+        td_day = soup.find('td', class_='day', string=re.compile(str(date.day)))
+        for e in td_day.parent.find(class_='event_of_day').find_all('a'):
+            urls.append(e.get('href'))
+    return list(dict.fromkeys(urls))
+
+
+def run(number: int = 20) -> dict:
+    """ベンチマークを実行する
+
+    Args:
+        number(int): 繰り返し回数
+
+    Returns:
+        dict: 1回あたりの秒数
+    """
+    soup = content_to_soup(make_calendar())
+    start, end = datetime.date(2019, 2, 1), datetime.date(2019, 2, 28)
+    legacy = timeit.timeit(lambda: legacy_urls(soup, start, end), number=number) / number
+    index = timeit.timeit(lambda: list(OfficialEventFactory._get_events_urls(start, end, soup)),
+                          number=number) / number
+    return {'calendar.legacy': legacy, 'calendar.index': index}
+
+
+def main():
+    results = run()
+    for name, seconds in results.items():
+        print("{:<20} {:>10.3f} ms".format(name, seconds * 1000))
+    print("speedup: {:.1f}x".format(results['calendar.legacy'] / results['calendar.index']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""`Event` のメモリ使用量のベンチマーク
+
+`__dict__` を持っていた以前の `Event` と, `__slots__` を使う今の `Event` で,
+1件あたりのメモリとpickleのサイズ, URLでの重複除去の時間を比べる.
+
+usage:
+    python benchmarks/bench_events.py
+"""
+import datetime
+import pickle
+import timeit
+import tracemalloc
+
+from kueventparser.events import Event
+
+LOCATIONS = ["百周年時計台記念館", "吉田キャンパス 総合研究2号館", "桂キャンパス"]
+
+
+class LegacyEvent:
+    """以前の `Event` (`__dict__` に属性を持つ)"""
+
+    def __init__(self, title, url, location, description, start_date, end_date, start, end):
+        self.title = title
+        self.url = url
+        self.location = location
+        self.description = description
+        self.start_date = start_date
+        self.end_date = end_date
+        self.start = start
+        self.end = end
+
+    def __eq__(self, other):
+        return self.__dict__ == other.__dict__
+
+
+def make_kwargs(n: int):
+    """ベンチマーク用のイベントの引数を作る
+
+    開催地は別々のページから読んだものを想定し, 毎回新しい文字列にする.
+    """
+    date = datetime.date(2019, 2, 1)
+    for i in range(n):
+        yield {'title': "event {}".format(i),
+               'url': "http://www.kyoto-u.ac.jp/ja/events/{}.html".format(i),
+               'location': "".join(list(LOCATIONS[i % len(LOCATIONS)])),
+               'description': "description {}\n".format(i),
+               'start_date': date, 'end_date': date, 'start': None, 'end': None}
+
+
+def _memory(cls, n):
+    kwargs = list(make_kwargs(n))
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    events = [cls(**kw) for kw in kwargs]
+    # 引数の文字列は捨てて, イベントが持っている分だけを数える
+    del kwargs
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return events, size / n
+
+
+def run(n: int = 20000) -> dict:
+    """ベンチマークを実行する
+
+    Args:
+        n(int): イベント数
+
+    Returns:
+        dict: 1件あたりのbytes, 重複除去の秒数
+    """
+    legacy, legacy_size = _memory(LegacyEvent, n)
+    events, size = _memory(Event, n)
+    sample = events[:1000] * 2
+    legacy_sample = legacy[:1000] * 2
+    return {
+        'event.memory.legacy': legacy_size,
+        'event.memory': size,
+        'event.pickle.legacy': len(pickle.dumps(legacy[0], pickle.HIGHEST_PROTOCOL)),
+        'event.pickle': len(pickle.dumps(events[0], pickle.HIGHEST_PROTOCOL)),
+        # 以前は比較しかできなかったので O(n^2)
+        'event.dedupe.legacy': timeit.timeit(
+            lambda: [e for i, e in enumerate(legacy_sample) if e not in legacy_sample[:i]], number=1),
+        'event.dedupe': timeit.timeit(lambda: list(dict.fromkeys(sample)), number=1),
+    }
+
+
+def main():
+    for name, value in run().items():
+        print("{:<24} {:>12.6g}".format(name, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""期間でイベントを引く索引のベンチマーク
+
+`get_all` の結果のリストを毎回走査する方法と, `EventIndex` で引く方法を比べる.
+
+usage:
+    python benchmarks/bench_index.py
+"""
+import datetime
+import random
+import timeit
+
+from kueventparser.events import Event
+from kueventparser.index import EventIndex
+
+
+def make_events(n: int, seed: int = 0):
+    """1年間に散らばったベンチマーク用のイベントを作る"""
+    rand = random.Random(seed)
+    events = []
+    for i in range(n):
+        start = datetime.date(2019, 1, 1) + datetime.timedelta(rand.randrange(365))
+        end = start + datetime.timedelta(rand.choice((0, 0, 0, 1, 7, 60)))
+        hour = rand.randrange(8, 20)
+        events.append(Event("event {}".format(i), "http://example.com/{}.html".format(i), "", "",
+                            start, end, datetime.time(hour), datetime.time(hour + 2)))
+    return events
+
+
+def scan_on(events, date: datetime.date):
+    """索引を使わない方法"""
+    return [event for event in events if event.start_date <= date <= (event.end_date or event.start_date)]
+
+
+def run(n: int = 20000, number: int = 200) -> dict:
+    """ベンチマークを実行する
+
+    Args:
+        n(int): イベント数
+        number(int): クエリの回数
+
+    Returns:
+        dict: 構築と1クエリあたりの秒数
+    """
+    events = make_events(n)
+    days = [datetime.date(2019, 1, 1) + datetime.timedelta(i) for i in range(0, 365, 365 // number + 1)]
+    index = EventIndex(events)
+    return {
+        'index.build': timeit.timeit(lambda: EventIndex(events), number=1),
+        'index.on.scan': timeit.timeit(lambda: [scan_on(events, day) for day in days], number=1) / len(days),
+        'index.on': timeit.timeit(lambda: [index.on(day) for day in days], number=1) / len(days),
+        'index.add_remove': timeit.timeit(lambda: (index.remove(events[0]), index.add(events[0])),
+                                          number=number) / number,
+    }
+
+
+def main():
+    for name, seconds in run().items():
+        print("{:<20} {:>10.3f} ms".format(name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""日付, 時刻文字列の解析のベンチマーク
+
+以前の `parse_str_to_time` , `parse_str_to_date` (呼び出し毎に正規表現を2つ照合する)と,
+一度の走査で済ませる今の実装を, よくある文字列と病的な文字列で比べる.
+
+usage:
+    python benchmarks/bench_parse.py
+"""
+import datetime
+import re
+import timeit
+
+import pytz
+
+from kueventparser import utils
+
+TIMES = ["12時10分～12時50分", "17時30分～19時00分（17時00分受付開始）", "15時00分～"]
+DATES = ["2019年08月08日 木曜日 〜 2019年08月09日 金曜日", "2019年08月06日 火曜日",
+         "2019年07月31日 水曜日 〜 2019年11月03日 日曜日（祝日）"]
+# 以前の実装では長さの2乗に比例する時間がかかる文字列
+PATHOLOGICAL_TIMES = ["1" * 4000, "1時1分～" * 1000, "受付" * 2000 + "1" * 2000 + "時"]
+PATHOLOGICAL_DATES = ["1" * 4000, "2019年1月1日" * 500, "2019年1月1日" + "〜2019年1月" * 400]
+
+
+def legacy_time(time_text: str):
+    """以前の `parse_str_to_time`"""
+    pattern = (r'.*?(?P<hour_start>\d+)時(?P<minute_start>\d+)分～'
+               r'.*?(?P<hour_end>\d+)時(?P<minute_end>\d+)分')
+    pattern2 = r'.*?(?P<hour_start>\d+)時(?P<minute_start>\d+)分'
+    match = re.match(pattern, time_text)
+    match2 = re.match(pattern2, time_text)
+    if match is None:
+        match = match2
+    jst = pytz.timezone('Asia/Tokyo')
+    start = datetime.time(int(match.group('hour_start')), int(match.group('minute_start')), tzinfo=jst)
+    if match is match2:
+        return {'start': start, 'end': start}
+    end = datetime.time(int(match.group('hour_end')), int(match.group('minute_end')), tzinfo=jst)
+    return {'start': start, 'end': end}
+
+
+def legacy_date(date_text: str):
+    """以前の `parse_str_to_date`"""
+    pattern = (r'.*?(?P<year_start>\d+)年(?P<month_start>\d+)月(?P<day_start>\d+)日.*?〜'
+               r'.*?(?P<year_end>\d+)年(?P<month_end>\d+)月(?P<day_end>\d+)日.*')
+    pattern2 = r'.*?(?P<year_start>\d+)年(?P<month_start>\d+)月(?P<day_start>\d+)日.*'
+    match = re.match(pattern, date_text)
+    match2 = re.match(pattern2, date_text)
+    if match is None:
+        match = match2
+        if match is None:
+            raise ValueError
+    start = datetime.date(int(match.group('year_start')), int(match.group('month_start')),
+                          int(match.group('day_start')))
+    if match is match2:
+        return {'start': start, 'end': start}
+    end = datetime.date(int(match.group('year_end')), int(match.group('month_end')), int(match.group('day_end')))
+    return {'start': start, 'end': end}
+
+
+def _attempt(func, text):
+    try:
+        return func(text)
+    except (ValueError, AttributeError):
+        return None
+
+
+def _time_per_call(func, texts, number):
+    return timeit.timeit(lambda: [_attempt(func, text) for text in texts], number=number) / (number * len(texts))
+
+
+def _uncached(func):
+    def call(text):
+        func.cache_clear()
+        return func(text)
+    return call
+
+
+def run(number: int = 2000, pathological_number: int = 3) -> dict:
+    """ベンチマークを実行する
+
+    Args:
+        number(int): よくある文字列の繰り返し回数
+        pathological_number(int): 病的な文字列の繰り返し回数
+
+    Returns:
+        dict: 1文字列あたりの秒数
+    """
+    return {
+        'parse.time.legacy': _time_per_call(legacy_time, TIMES, number),
+        'parse.time.uncached': _time_per_call(_uncached(utils._parse_time), TIMES, number),
+        'parse.time': _time_per_call(utils.parse_str_to_time, TIMES, number),
+        'parse.date.legacy': _time_per_call(legacy_date, DATES, number),
+        'parse.date.uncached': _time_per_call(_uncached(utils._parse_date), DATES, number),
+        'parse.date': _time_per_call(utils.parse_str_to_date, DATES, number),
+        'parse.pathological.legacy': _time_per_call(legacy_time, PATHOLOGICAL_TIMES, pathological_number)
+        + _time_per_call(legacy_date, PATHOLOGICAL_DATES, pathological_number),
+        'parse.pathological': _time_per_call(_uncached(utils._parse_time), PATHOLOGICAL_TIMES, pathological_number)
+        + _time_per_call(_uncached(utils._parse_date), PATHOLOGICAL_DATES, pathological_number),
+    }
+
+
+def main():
+    results = run()
+    for name, seconds in results.items():
+        print("{:<28} {:>12.3f} us".format(name, seconds * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""イベントページの解析方法のベンチマーク
+
+`OfficialEventFactory` の解析方法(soup, strainer, lxml)毎に,
+文字コードを推測する場合と指定する場合の1ページあたりの時間を比べる.
+
+usage:
+    python benchmarks/bench_parsers.py
+"""
+import os
+import timeit
+
+from kueventparser.adapters.official import PARSERS, OfficialEventFactory
+
+DATA = os.path.join(os.path.dirname(__file__), os.pardir, 'tests', 'data', 'test_event1.html')
+
+
+def run(number: int = 200) -> dict:
+    """ベンチマークを実行する
+
+    Args:
+        number(int): 繰り返し回数
+
+    Returns:
+        dict: 1ページあたりの秒数
+    """
+    with open(DATA, 'rb') as f:
+        content = f.read()
+    results = {}
+    for parser in PARSERS:
+        for encoding in (None, 'utf-8'):
+            name = 'parser.{}{}'.format(parser, '' if encoding is None else '.encoding')
+            results[name] = timeit.timeit(
+                lambda: OfficialEventFactory._parse_page('x', content, encoding, parser), number=number) / number
+    return results
+
+
+def main():
+    results = run()
+    for name, seconds in results.items():
+        print("{:<28} {:>10.3f} ms".format(name, seconds * 1000))
+    print("speedup (lxml.encoding vs soup): {:.1f}x".format(
+        results['parser.soup'] / results['parser.lxml.encoding']))
+
+
+if __name__ == '__main__':
+    main()
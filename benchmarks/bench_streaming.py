@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""`generate_all` の最初のイベントが出るまでの時間(time-to-first-event)のベンチマーク
+
+ページ毎に一定の遅延を入れたtransportで, 最初のイベントまでの時間と全体の時間を測る.
+
+usage:
+    python benchmarks/bench_streaming.py
+"""
+import datetime
+import os
+import time
+
+from bench_calendar import make_calendar
+from kueventparser.adapters.official import OfficialEventFactory
+from kueventparser.transports import MemoryTransport
+
+EVENT_PAGE = os.path.join(os.path.dirname(__file__), os.pardir, "tests", "data", "test_event1.html")
+
+
+class LatencyTransport(MemoryTransport):
+    """1リクエスト毎に `latency` 秒待つ `MemoryTransport`"""
+
+    def __init__(self, pages: dict, latency: float):
+        super().__init__(pages)
+        self.latency = latency
+
+    def get(self, url, headers=None):
+        time.sleep(self.latency)
+        return super().get(url, headers)
+
+
+def make_pages(year: int = 2019, month: int = 2, events_per_day: int = 2) -> dict:
+    """1か月分の行事カレンダーとイベントページを作る
+
+    Returns:
+        dict: URL -> bytes
+    """
+    from kueventparser.utils import content_to_soup
+
+    calendar = make_calendar(year, month, events_per_day)
+    with open(EVENT_PAGE, "rb") as f:
+        event = f.read()
+    pages = {OfficialEventFactory._template.format(year, month): calendar}
+    for a in content_to_soup(calendar).select("td.event_of_day a"):
+        pages[a.get("href")] = event
+    return pages
+
+
+def run(latency: float = 0.005, max_workers: int = 4) -> dict:
+    """ベンチマークを実行する
+
+    Args:
+        latency(float): 1リクエストあたりの遅延秒数
+        max_workers(int): イベントページを取得するスレッド数
+
+    Returns:
+        dict: 最初のイベントまでの秒数と全体の秒数
+    """
+    transport = LatencyTransport(make_pages(), latency)
+    start, end = datetime.date(2019, 2, 1), datetime.date(2019, 2, 28)
+    began = time.perf_counter()
+    first = None
+    count = 0
+    for _ in OfficialEventFactory.generate_all(start, end, max_workers=max_workers, transport=transport):
+        if first is None:
+            first = time.perf_counter() - began
+        count += 1
+    total = time.perf_counter() - began
+    return {'streaming.first_event': first, 'streaming.total': total, 'streaming.events': count}
+
+
+def main():
+    results = run()
+    print("{} events".format(results['streaming.events']))
+    print("{:<24} {:>10.3f} ms".format('time to first event', results['streaming.first_event'] * 1000))
+    print("{:<24} {:>10.3f} ms".format('total', results['streaming.total'] * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""ベンチマーク用にページを記録する
+
+指定した月の行事カレンダーとそこに載っているイベントページを取得し,
+`fixtures/<year>-<month>/` に本文と `manifest.json` (URL -> ファイル名)を保存する.
+同じ本文は1つのファイルにまとめる.
+
+usage:
+    python benchmarks/record.py 2019 2
+"""
+import argparse
+import hashlib
+import json
+import os
+
+from kueventparser.adapters.official import OfficialEventFactory
+from kueventparser.transports import HTTPTransport
+from kueventparser.utils import content_to_soup
+
+from server import FIXTURES
+
+
+def record(year: int, month: int, transport, directory: str = FIXTURES) -> str:
+    """1か月分のページを記録する
+
+    Args:
+        year(int): 年
+        month(int): 月
+        transport: 取得に使うtransport
+        directory(str): 記録を置くディレクトリ
+
+    Returns:
+        str: 記録したディレクトリ
+    """
+    root = os.path.join(directory, '{}-{:02d}'.format(year, month))
+    os.makedirs(root, exist_ok=True)
+    calendar_url = OfficialEventFactory._template.format(year, month)
+    calendar = transport.get(calendar_url)
+    calendar.raise_for_status()
+    urls = [calendar_url] + OfficialEventFactory._parse_calendar(content_to_soup(calendar.content),
+                                                                 year, month).urls()
+    pages = {}
+    for url in urls:
+        r = calendar if url == calendar_url else transport.get(url)
+        if r.status_code != 200:
+            continue
+        filename = hashlib.sha1(r.content).hexdigest()[:12] + '.html'
+        with open(os.path.join(root, filename), 'wb') as f:
+            f.write(r.content)
+        pages[url] = filename
+    with open(os.path.join(root, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump({'year': year, 'month': month, 'pages': pages}, f, indent=2, sort_keys=True)
+        f.write('\n')
+    return root
+
+
+def main():
+    parser = argparse.ArgumentParser(description='record pages for benchmarks')
+    parser.add_argument('year', type=int)
+    parser.add_argument('month', type=int)
+    args = parser.parse_args()
+    with HTTPTransport() as transport:
+        print(record(args.year, args.month, transport))
+
+
+if __name__ == '__main__':
+    main()
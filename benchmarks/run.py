@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""ベンチマークをまとめて実行する
+
+ネットワークを使わずに(記録済みのページとローカルのサーバで)以下を測り,
+結果をJSONで書き出す. 別のバージョンの結果と `--compare` で比べられる.
+
+- 行事カレンダーからのURL抽出( `bench_calendar` )
+- イベントページの解析( `bench_parsers` , 記録済みのページ)
+- 日付, 時刻文字列の解析( `bench_parse` )
+- `get_all` の全体の時間(並列数毎, asyncio版, 取得とパースのパイプライン)
+- `get_all` 中のメモリ使用量のピーク
+- `import kueventparser.api` にかかる時間
+
+usage:
+    python benchmarks/run.py --output before.json
+    python benchmarks/run.py --compare before.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+import bench_calendar
+import bench_parse
+import bench_parsers
+from bench_streaming import make_pages
+from kueventparser.__version__ import __version__
+from kueventparser.adapters.official import PARSERS, OfficialEventFactory
+from kueventparser.transports import AsyncHTTPTransport, HTTPTransport
+from server import StandInServer, load_fixtures
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+# `get_all` を測る並列数
+CONCURRENCY = (1, 4, 16)
+# ローカルのサーバで1リクエストあたりに入れる遅延(秒)
+LATENCY = 0.005
+# 記録済みのページ
+FIXTURE = '2017-10'
+# 測定値の単位(名前の接尾辞 -> 単位). どれにも当たらなければ秒
+UNITS = (('.events', 'count'), ('.bytes', 'bytes'))
+
+
+def bench_fixture_parse(number: int = 100) -> dict:
+    """記録済みのイベントページ1件あたりの解析時間"""
+    pages = load_fixtures(FIXTURE)
+    calendar_url = OfficialEventFactory._template.format(2017, 10)
+    contents = [content for url, content in pages.items() if url != calendar_url]
+    results = {}
+    for parser in PARSERS:
+        seconds = timeit.timeit(
+            lambda: [OfficialEventFactory._parse_page('x', content, 'utf-8', parser) for content in contents],
+            number=number)
+        results['fixture.parse.{}'.format(parser)] = seconds / (number * len(contents))
+    return results
+
+
+def bench_end_to_end(latency: float = LATENCY) -> dict:
+    """ローカルのサーバに対する `get_all` の全体の時間とメモリ"""
+    start, end = datetime.date(2019, 2, 1), datetime.date(2019, 2, 28)
+    results = {}
+    with StandInServer(make_pages(events_per_day=4), latency=latency):
+        for workers in CONCURRENCY:
+            with HTTPTransport(pool_size=workers) as transport:
+                began = time.perf_counter()
+                events = OfficialEventFactory.get_all(start, end, max_workers=workers, transport=transport)
+                results['get_all.workers_{}'.format(workers)] = time.perf_counter() - began
+        results['get_all.events'] = len(events)
+        # 取得はスレッド, パースはコア数のプロセス
+        with HTTPTransport(pool_size=CONCURRENCY[-1]) as transport:
+            began = time.perf_counter()
+            OfficialEventFactory.get_all(start, end, max_workers=CONCURRENCY[-1], transport=transport,
+                                         parse_workers=0)
+            results['get_all.pipelined_{}'.format(CONCURRENCY[-1])] = time.perf_counter() - began
+
+        async def fetch():
+            async with AsyncHTTPTransport() as transport:
+                return await OfficialEventFactory.aget_all(start, end, max_workers=CONCURRENCY[-1],
+                                                           transport=transport)
+
+        began = time.perf_counter()
+        asyncio.run(fetch())
+        results['get_all.async_{}'.format(CONCURRENCY[-1])] = time.perf_counter() - began
+
+        with HTTPTransport() as transport:
+            tracemalloc.start()
+            OfficialEventFactory.get_all(start, end, max_workers=4, transport=transport)
+            results['get_all.peak.bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return results
+
+
+def bench_import(repeat: int = 5) -> dict:
+    """別のプロセスで `import kueventparser.api` にかかる時間(中央値)"""
+    code = 'import time; t = time.perf_counter(); import kueventparser.api; print(time.perf_counter() - t)'
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(ROOT))
+    samples = [float(subprocess.check_output([sys.executable, '-c', code], env=env, cwd=ROOT))
+               for _ in range(repeat)]
+    return {'import.api': statistics.median(samples)}
+
+
+def run() -> dict:
+    """全てのベンチマークを実行する
+
+    Returns:
+        dict: 測定値の名前 -> 値
+    """
+    results = {}
+    results.update(bench_calendar.run())
+    results.update(bench_parsers.run())
+    results.update(bench_fixture_parse())
+    results.update(bench_parse.run())
+    results.update(bench_end_to_end())
+    results.update(bench_import())
+    return results
+
+
+def unit(name: str) -> str:
+    for suffix, _unit in UNITS:
+        if name.endswith(suffix):
+            return _unit
+    return 's'
+
+
+def report(results: dict) -> dict:
+    """結果を比較しやすい形(環境の情報付き)にする"""
+    return {
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'results': {name: {'value': value, 'unit': unit(name)} for name, value in sorted(results.items())},
+    }
+
+
+def compare(old: dict, new: dict):
+    """2つの結果の差を表にして返す"""
+    lines = ['{:<32} {:>14} {:>14} {:>9}'.format('benchmark', old['version'], new['version'], 'change')]
+    for name, result in new['results'].items():
+        before = old['results'].get(name, {}).get('value')
+        after = result['value']
+        change = '' if not before else '{:+.1%}'.format(after / before - 1)
+        lines.append('{:<32} {:>14.6g} {:>14.6g} {:>9}'.format(
+            name, before if before is not None else float('nan'), after, change))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='run offline benchmarks of kueventparser')
+    parser.add_argument('--output', '-o', type=str, help="write results as JSON to this file")
+    parser.add_argument('--compare', '-c', type=str, help="JSON file of previous results to compare with")
+    args = parser.parse_args()
+    result = report(run())
+    text = json.dumps(result, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print(compare(json.load(f), result))
+    elif not args.output:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""ベンチマーク用のローカルHTTPサーバと記録済みページ
+
+京大HPの代わりに, 記録しておいたページ( `fixtures/` )等をローカルで配信する.
+ネットワークの状態に左右されずに `get_all` 等を最後まで測るために使う.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from kueventparser.adapters.official import OfficialEventFactory
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+ORIGIN = 'http://www.kyoto-u.ac.jp'
+
+
+def load_fixtures(name: str, directory: str = FIXTURES) -> dict:
+    """記録済みのページを読み込む
+
+    Args:
+        name(str): 記録の名前( `fixtures` 以下のディレクトリ名)
+        directory(str): 記録を置いているディレクトリ
+
+    Returns:
+        dict: URL -> bytes
+    """
+    root = os.path.join(directory, name)
+    with open(os.path.join(root, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    pages = {}
+    for url, filename in manifest['pages'].items():
+        with open(os.path.join(root, filename), 'rb') as f:
+            pages[url] = f.read()
+    return pages
+
+
+class StandInServer:
+    """京大HPの代わりにページを配信するサーバ
+
+    `with` の中では `OfficialEventFactory._template` がこのサーバを向く.
+    ページ中の京大HPのURLもこのサーバのURLに置き換えて配信する.
+
+    Example:
+
+        >>> with StandInServer(load_fixtures('2017-10')) as server:
+        ...     OfficialEventFactory.get_all(...)
+    """
+
+    def __init__(self, pages: dict, latency: float = 0.0):
+        """イニシャライザー
+
+        Args:
+            pages(dict): URL -> bytes
+            latency(float): 1リクエストあたりに入れる遅延秒数
+        """
+        self.latency = latency
+        self.requests = 0
+        self._pages = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self.base = 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+        for url, body in pages.items():
+            parts = urlsplit(url)
+            key = parts.path + ('?' + parts.query if parts.query else '')
+            self._pages[key] = body.replace(ORIGIN.encode(), self.base.encode())
+        self._template = None
+        self._thread = None
+
+    def url(self, url: str) -> str:
+        """京大HPのURLをこのサーバのURLにする"""
+        return url.replace(ORIGIN, self.base)
+
+    def __enter__(self):
+        self._template = OfficialEventFactory._template
+        OfficialEventFactory._template = self.url(self._template)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        OfficialEventFactory._template = self._template
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # ヘッダと本文を別々に送るので, Nagleのアルゴリズムで遅延しないようにする
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                with server._lock:
+                    server.requests += 1
+                body = server._pages.get(self.path)
+                status = 200 if body is not None else 404
+                body = body if body is not None else b'not found'
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
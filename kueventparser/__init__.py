@@ -12,3 +12,22 @@ is got by sphinx .
 :copyright: (c) 2019 by kkiyama117.
 :license: MIT, see LICENSE for more details.
 """
+from kueventparser.__version__ import __version__  # noqa: F401 (公開する)
+
+# `kueventparser.get_all` 等で使える `api` の関数
+_API = ('get_all', 'get', 'get_many', 'invalidate', 'generate_all', 'sync', 'aget_all', 'aget', 'agenerate_all')
+
+
+def __getattr__(name):
+    # `import kueventparser` だけでは重い依存(bs4, lxml, requests, pytz)を読み込まない(PEP 562)
+    if name in _API:
+        from kueventparser import api
+        return getattr(api, name)
+    if name == 'api':
+        import importlib
+        return importlib.import_module('kueventparser.api')
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_API) + ['api'])
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""複数のfactoryのイベントをまとめるfactory
+
+`AggregateEventFactory.of` で作ったfactoryは, 同じ期間の各factory( `sources` )の
+`generate_all` をそれぞれ別のスレッドで同時に動かし, 届いた順にイベントを返す.
+同じURLのイベントは最初に届いたものだけを返す.
+
+あるfactoryが遅くても, 他のfactoryのイベントは待たずに返す.
+失敗したfactory(と `timeout` 秒以内に終わらなかったfactory)は :obj:`SourceWarning` で知らせ,
+残りのfactoryのイベントだけを返す. 全てのfactoryが失敗した場合は最初の例外を送出する.
+
+Example:
+
+    >>> from kueventparser import api
+    >>> events = api.get_all('official,bungaku', year=2019, month=2)
+"""
+import queue
+import threading
+import time
+import warnings
+from functools import lru_cache
+
+from kueventparser.adapters import registry
+from kueventparser.adapters.base import EventFactoryMixin
+from kueventparser.stats import NULL_STATS, Stats
+from kueventparser.utils import DONE, Failure, put_until_stopped
+
+# factory毎に, 返されずに溜めておけるイベント数
+_BUFFER = 64
+
+
+class SourceWarning(RuntimeWarning):
+    """まとめているfactoryの1つが失敗したことを知らせる警告"""
+
+
+class AggregateEventFactory(EventFactoryMixin):
+    """複数のfactoryのイベントをまとめるfactoryの基底クラス
+
+    直接は使わず, `of` で `sources` を決めたサブクラスを作る.
+
+    Attributes:
+        sources(:obj:`tuple`): まとめるfactoryのクラス
+        timeout(:obj:`float`): factoryを待つ秒数. Noneなら終わるまで待つ
+    """
+    sources = ()
+    timeout = None
+
+    @classmethod
+    def of(cls, *sources, timeout: float = None) -> type:
+        """ `sources` をまとめるfactoryを作る
+
+        同じ引数なら同じクラスを返す.
+
+        Args:
+            *sources: factoryの名前か `EventFactoryMixin` を継承したクラス
+            timeout(float): 最初のイベントを要求してから, factoryを待つ秒数. Noneなら終わるまで待つ
+
+        Returns:
+            type: `AggregateEventFactory` のサブクラス
+
+        Raises:
+            ValueError: factoryが無いか, 名前が登録されていない場合.
+        """
+        if not sources:
+            raise ValueError('no factory to aggregate')
+        return _aggregate(cls, tuple(registry.load(source) if isinstance(source, str) else source
+                                     for source in sources), timeout)
+
+    @classmethod
+    def get(cls, url: str, **kwargs):
+        """ `sources` の順に `get` を呼び, 最初に見つかったイベントを返す
+
+        Args:
+            url (str): イベントページのURL
+            **kwargs: 各factoryの `get` に渡す引数(受け取らないものは渡さない)
+
+        Returns:
+            :obj:`kueventparser.events.Event`: イベント. どのfactoryでも見つからなければNone
+        """
+        errors = []
+        for source in cls.sources:
+            try:
+                event = source.get(url, **_accepted(source.get, kwargs))
+            except Exception as e:
+                errors.append(e)
+                _warn(source, e)
+                continue
+            if event is not None:
+                return event
+        if errors and len(errors) == len(cls.sources):
+            raise errors[0]
+        return None
+
+    @classmethod
+    def get_all(cls, start_date, end_date, ordered: bool = False, **kwargs) -> list:
+        """ `generate_all` のリスト版
+
+        Args:
+            start_date: 期間の開始日
+            end_date: 期間の終了日(この日を含む)
+            ordered (bool): Trueなら開始日時順に並べる
+            **kwargs: `generate_all` と同じ
+
+        Returns:
+            list: `events.Event`
+        """
+        events = list(cls.generate_all(start_date, end_date, **kwargs))
+        return sorted(events) if ordered else events
+
+    @classmethod
+    def generate_all(cls, start_date, end_date, stats: Stats = None, **kwargs):
+        """各factoryの `generate_all` を同時に動かし, 届いた順にイベントを返す
+
+        `generate_all` を持たないfactoryは `get_all` を使う.
+        途中でやめれば各factoryも止める.
+
+        Args:
+            start_date: 期間の開始日
+            end_date: 期間の終了日(この日を含む)
+            stats (Stats): 計測を記録する先. 'sources.failed' , 'events.duplicate' も数える
+            **kwargs: 各factoryに渡す引数(max_workers, transport, parser 等. 受け取らないものは渡さない)
+
+        Returns:
+            generator: `events.Event` (URLの重複を除く)
+
+        Raises:
+            Exception: 全てのfactoryが失敗し, イベントが1件もなかった場合, 最初の例外.
+                一部でもイベントを返せていれば例外にせず, 失敗は 'sources.failed' と `SourceWarning` で知らせる.
+        """
+        stats = stats or NULL_STATS
+        kwargs['stats'] = stats
+        results = queue.Queue(maxsize=_BUFFER * len(cls.sources))
+        stop = threading.Event()
+        for index, source in enumerate(cls.sources):
+            threading.Thread(target=_produce, args=(index, source, start_date, end_date, kwargs, results, stop),
+                             name='aggregate-{}'.format(source.__name__), daemon=True).start()
+        deadline = None if cls.timeout is None else time.monotonic() + cls.timeout
+        pending = set(range(len(cls.sources)))
+        errors = []
+        seen = set()
+        try:
+            while pending:
+                try:
+                    index, item = results.get(timeout=None if deadline is None else
+                                              max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    # 待ちきれなかったfactoryは諦める
+                    for index in sorted(pending):
+                        error = TimeoutError('no response in {:g} seconds'.format(cls.timeout))
+                        errors.append(error)
+                        stats.count('sources.failed')
+                        _warn(cls.sources[index], error)
+                    break
+                if item is DONE:
+                    pending.discard(index)
+                elif isinstance(item, Failure):
+                    pending.discard(index)
+                    errors.append(item.error)
+                    stats.count('sources.failed')
+                    _warn(cls.sources[index], item.error)
+                elif item.url in seen:
+                    stats.count('events.duplicate')
+                else:
+                    seen.add(item.url)
+                    yield item
+        finally:
+            stop.set()
+        if errors and len(errors) == len(cls.sources) and not seen:
+            raise errors[0]
+
+
+@lru_cache(maxsize=None)
+def _aggregate(base: type, sources: tuple, timeout) -> type:
+    name = '{}[{}]'.format(base.__name__, ','.join(source.__name__ for source in sources))
+    return type(name, (base,), {'sources': sources, 'timeout': timeout, '__module__': base.__module__})
+
+
+def _produce(index: int, source: type, start_date, end_date, kwargs: dict, results: queue.Queue,
+             stop: threading.Event):
+    """ `source` のイベントを `results` に入れる(スレッドで動かす)"""
+    method = getattr(source, 'generate_all', None) or source.get_all
+    try:
+        events = method(start_date, end_date, **_accepted(method, kwargs))
+        try:
+            for event in events:
+                if not put_until_stopped(results, (index, event), stop):
+                    return
+        finally:
+            if hasattr(events, 'close'):
+                events.close()
+    except Exception as e:
+        put_until_stopped(results, (index, Failure(e)), stop)
+        return
+    put_until_stopped(results, (index, DONE), stop)
+
+
+def _accepted(method, kwargs: dict) -> dict:
+    """ `method` が受け取る引数だけを選ぶ. Noneのものは渡さない"""
+    import inspect
+
+    parameters = inspect.signature(method).parameters
+    if any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters.values()):
+        return {key: value for key, value in kwargs.items() if value is not None}
+    return {key: value for key, value in kwargs.items() if key in parameters and value is not None}
+
+
+def _warn(source: type, error: BaseException):
+    warnings.warn('{} failed: {!r}'.format(source.__name__, error), SourceWarning, stacklevel=3)
@@ -1,7 +1,24 @@
 import datetime
 from abc import ABCMeta, abstractmethod
+from functools import partial
 
-from kueventparser.events import Event
+from kueventparser.events import FAILED, OK, SKIPPED, Event, Outcome
+from kueventparser.utils import imap_bounded
+
+# イベントページの解析方法(CLIがアダプタを読み込まずに選べるようにここに置く)
+#   soup: BeautifulSoupで全体をパースする
+#   strainer: BeautifulSoupで見出しと表(dl, table)だけをパースする
+#   lxml: lxml.htmlでパースしてXPathで抽出する
+#   stream: 受信しながらlxmlでパースし, 要るフィールドを読み終えたら受信をやめる
+PARSERS = ('soup', 'strainer', 'lxml', 'stream')
+
+
+class EventPageError(AttributeError):
+    """イベントページにイベント名が無い(エラーページ等)ときの例外
+
+    どの解析方法でも同じ例外を送出する.
+    soupで `AttributeError` が起きていた頃と同じく `AttributeError` としても捕まえられる.
+    """
 
 
 class EventFactoryMixin(metaclass=ABCMeta):
@@ -9,6 +26,8 @@ class EventFactoryMixin(metaclass=ABCMeta):
 
     後ほど京大公式以外のHPからスクレイビングする時は,
     このクラスの関数にHP毎の処理を追加する.
+    asyncio版のメソッド( `aget_all` , `aget` , `agenerate_all` )は
+    デフォルトでは同期版をexecutorで実行する. ネイティブに対応するなら上書きする.
     """
 
     @classmethod
@@ -20,3 +39,49 @@ class EventFactoryMixin(metaclass=ABCMeta):
     @abstractmethod
     def get(cls, url) -> list:
         return []
+
+    @classmethod
+    def get_many(cls, urls, max_workers: int = None, **kwargs) -> list:
+        """複数のURLのイベントをまとめて取得する
+
+        重複したURLは1回だけ取得する. 例外が起きても止めずに, URL毎の結果として返す.
+
+        Args:
+            urls: イベントページのURLのiterable
+            max_workers (int): 並列に取得するスレッド数. Noneなら逐次実行
+            **kwargs: `get` に渡す引数
+
+        Returns:
+            list: :obj:`kueventparser.events.Outcome` のリスト(重複を除いた `urls` の順)
+        """
+        return list(imap_bounded(partial(_outcome, cls, kwargs), list(dict.fromkeys(urls)),
+                                 max_workers=max_workers, ordered=True))
+
+    @classmethod
+    async def aget_all(cls, start_date, end_date, **kwargs) -> list:
+        # asyncioは読み込みが重いので, 使う時(既に読み込まれている)に参照する
+        import asyncio
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, partial(cls.get_all, start_date, end_date, **kwargs))
+
+    @classmethod
+    async def aget(cls, url, **kwargs):
+        import asyncio
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, partial(cls.get, url, **kwargs))
+
+    @classmethod
+    async def agenerate_all(cls, start_date, end_date, **kwargs):
+        for event in await cls.aget_all(start_date, end_date, **kwargs):
+            yield event
+
+
+def _outcome(factory, kwargs: dict, url: str) -> Outcome:
+    """ `factory.get` を呼び, 結果か例外を :obj:`Outcome` にする"""
+    try:
+        event = factory.get(url, **kwargs)
+    except Exception as e:
+        return Outcome(url, FAILED, error=e)
+    if event is None:
+        return Outcome(url, SKIPPED)
+    return Outcome(url, OK, event)
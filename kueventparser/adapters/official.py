@@ -1,14 +1,44 @@
+import asyncio
 import calendar
+import codecs
 import datetime
+import os
 import re
-from itertools import chain
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Optional
 
 import bs4
+import lxml.html
+from bs4.dammit import EncodingDetector, UnicodeDammit
+from lxml import etree
 
-from kueventparser.adapters.base import EventFactoryMixin
-from kueventparser.events import Event
-from kueventparser.utils import url_to_soup, parse_str_to_time, parse_str_to_date
+from kueventparser.adapters.base import PARSERS, EventFactoryMixin, EventPageError
+from kueventparser.archive import get_replay_transport
+from kueventparser.events import FAILED, FIELDS, Event, LazyEvent
+from kueventparser.index import CalendarIndex
+from kueventparser.stats import NULL_STATS, Stats
+from kueventparser.sync import ADDED, CHANGED, DEFAULT_RECHECK, REMOVED, Delta, Record, StateStore, content_hash
+from kueventparser.transports import AsyncHTTPTransport, BaseTransport, get_default_transport
+from kueventparser.utils import url_to_soup, content_to_soup, parse_str_to_time, parse_str_to_date, \
+    months_between, imap_bounded, imap_pipelined, date_to_month
+
+
+# 行事カレンダーの日付欄
+_DAY = re.compile(r'\s*(\d+)')
+# 行事カレンダーを同時に取得するスレッド数の上限
+_CALENDAR_WORKERS = 12
+_STRAINER = bs4.SoupStrainer(['h1', 'dl', 'table'])
+_XPATH_TITLE = etree.XPath("(//h1[contains(concat(' ', normalize-space(@class), ' '), ' title ')])[1]")
+_XPATH_LABEL_SPAN = etree.XPath("(//text()[. = $label])[1]/following::span[1]")
+_XPATH_DATE_ROW = etree.XPath("(//text()[. = '開催日'])[1]/../../..")
+_XPATH_TEXT = etree.XPath(".//text()")
+# `fields` で省略できるフィールド. それ以外(title, url, 日付と時刻)は常に取り出す
+OPTIONAL_FIELDS = ('location', 'description')
+# `lazy=True` の時に, 参照されるまで取り出さないフィールド
+LAZY_FIELDS = ('description',)
 
 
 class OfficialEventFactory(EventFactoryMixin):
@@ -20,104 +50,910 @@ class OfficialEventFactory(EventFactoryMixin):
     _event_urls = []
 
     @classmethod
-    def get(cls, url: str):
-        date = datetime.date.today()
-        return cls._get_event(url=url)
+    def get(cls, url: str, transport: BaseTransport = None, parser: str = 'soup', stats: Stats = None,
+            fields=None, lazy: bool = False, max_bytes: int = None, max_parse_time: float = None):
+        """ get event from url
+
+        Args:
+            url (str): イベントページのURL
+            transport (BaseTransport): 通信に使うtransport. Noneならデフォルトのもの
+            parser (str): イベントページの解析方法. `PARSERS` のいずれか
+            stats (Stats): 計測を記録する先. Noneなら記録しない
+            fields: 取り出すフィールド名のiterable( `events.FIELDS` のいずれか). Noneなら全て.
+                title, url, 日付と時刻は常に取り出す
+            lazy (bool): Trueなら `LAZY_FIELDS` を参照された時に取り出す( `events.LazyEvent` )
+            max_bytes (int): parserが 'stream' の時, 1ページから受け取る本文のbytes数の上限
+            max_parse_time (float): parserが 'stream' の時, 1ページの受信とパースにかける秒数の上限
+
+        Raises:
+            ValueError: 未知のフィールド名の場合.
+
+        Returns:
+            Optional[Event]: Event
+        """
+        extract, deferred = _projection(fields, lazy)
+        return cls._get_event(url=url, transport=transport, parser=parser, stats=stats, extract=extract,
+                              deferred=deferred, max_bytes=max_bytes, max_parse_time=max_parse_time)
 
     @classmethod
-    def get_all(cls, start_date: datetime.date, end_date: datetime.date):
+    def get_many(cls, urls, max_workers: int = None, transport: BaseTransport = None, parser: str = 'soup',
+                 stats: Stats = None, fields=None, lazy: bool = False, max_bytes: int = None,
+                 max_parse_time: float = None) -> list:
+        """複数のURLのイベントをまとめて取得する
+
+        重複したURLは1回だけ, `max_workers` 個のスレッドで取得する.
+        取得やパースで例外が起きても止めずに, URL毎の結果( :obj:`kueventparser.events.Outcome` )として返す.
+
+        Args:
+            urls: イベントページのURLのiterable
+            max_workers (int): 並列に取得するスレッド数. Noneなら逐次実行
+            transport (BaseTransport): 通信に使うtransport. Noneならデフォルトのもの
+            parser (str): イベントページの解析方法. `PARSERS` のいずれか
+            stats (Stats): 計測を記録する先. 失敗したURLの数は 'events.failed' に数える
+            fields: 取り出すフィールド名のiterable. `get` を参照
+            lazy (bool): Trueなら `LAZY_FIELDS` を参照された時に取り出す
+            max_bytes (int): 1ページから受け取る本文のbytes数の上限. `get` を参照
+            max_parse_time (float): 1ページの受信とパースにかける秒数の上限. `get` を参照
+
+        Returns:
+            list: :obj:`kueventparser.events.Outcome` のリスト(重複を除いた `urls` の順)
+
+        Raises:
+            ValueError: 未知のフィールド名の場合(取得を始める前に投げる).
+        """
+        _projection(fields, lazy)
+        if transport is None:
+            transport = get_default_transport()
+        outcomes = super().get_many(urls, max_workers=max_workers, transport=transport, parser=parser,
+                                    stats=stats, fields=fields, lazy=lazy, max_bytes=max_bytes,
+                                    max_parse_time=max_parse_time)
+        failed = sum(1 for outcome in outcomes if outcome.status == FAILED)
+        if failed and stats is not None:
+            stats.count('events.failed', failed)
+        return outcomes
+
+    @classmethod
+    def get_all(cls, start_date: datetime.date, end_date: datetime.date, max_workers: int = 1,
+                ordered: bool = False, transport: BaseTransport = None, parser: str = 'soup',
+                stats: Stats = None, parse_workers: int = None, fields=None, lazy: bool = False,
+                max_bytes: int = None, max_parse_time: float = None):
         """ get events in month containing date
 
         Args:
             start_date (datetime.date): date to get events including year and month
             end_date (datetime.date): date to get events including year and month
+            max_workers (int): イベントページを並列に取得するスレッド数. 1なら逐次実行
+            ordered (bool): Trueならカレンダー上の順序を保つ
+            transport (BaseTransport): 通信に使うtransport. Noneならデフォルトのもの
+            parser (str): イベントページの解析方法. `PARSERS` のいずれか
+            stats (Stats): 計測を記録する先. Noneなら記録しない
+            parse_workers (int): イベントページをパースするプロセス数. `generate_all` を参照
+            fields: 取り出すフィールド名のiterable( `events.FIELDS` のいずれか). Noneなら全て.
+                title, url, 日付と時刻は常に取り出す
+            lazy (bool): Trueなら `LAZY_FIELDS` を参照された時に取り出す( `events.LazyEvent` )
+            max_bytes (int): 1ページから受け取る本文のbytes数の上限. `generate_all` を参照
+            max_parse_time (float): 1ページの受信とパースにかける秒数の上限. `generate_all` を参照
 
         Returns:
             list: `events.Event'
         """
-        return list(cls.generate_all(start_date, end_date))
+        return list(cls.generate_all(start_date, end_date, max_workers=max_workers, ordered=ordered,
+                                     transport=transport, parser=parser, stats=stats,
+                                     parse_workers=parse_workers, fields=fields, lazy=lazy, max_bytes=max_bytes,
+                                     max_parse_time=max_parse_time))
 
     @classmethod
-    def generate_all(cls, start_date: datetime.date, end_date: datetime.date):
-        url = cls._template.format(start_date.year, start_date.month)
-        # get beautifulsoup object from url
-        session = url_to_soup(url)
-        # return values
-        answer = []
+    def generate_all(cls, start_date: datetime.date, end_date: datetime.date, max_workers: int = 1,
+                     ordered: bool = False, transport: BaseTransport = None, parser: str = 'soup',
+                     stats: Stats = None, parse_workers: int = None, fields=None, lazy: bool = False,
+                     max_bytes: int = None, max_parse_time: float = None):
+        """ get events between start_date and end_date
+
+        期間に含まれる月の行事カレンダーを全て(並列に)取得し,
+        月をまたいで重複を除いたイベントURLについてだけイベントページを取得する.
+
+        `parse_workers` を指定すると, 取得( `max_workers` 個のスレッド)とパース( `parse_workers` 個のプロセス)を
+        別々の段として動かす( `utils.imap_pipelined` ). パースがGILに縛られないので, 多くのページを取得する時に
+        全てのコアを使える.
+
+        `fields` に要らないフィールドを含めなければ, そのフィールドを抽出する処理を省く.
+        `lazy=True` なら, 説明文(description)等は参照された時にページを取得し直して取り出す.
+
+        `parser='stream'` なら, イベントページを受信しながらパースし, 要るフィールドを読み終えた所で受信をやめる.
+        `max_bytes` , `max_parse_time` を超えたページもそこでやめ, それまでに読めた所からイベントを作る.
+        この時 `parse_workers` は使わない(取得したスレッドでパースする).
+
+        Args:
+            start_date (datetime.date): 開始日
+            end_date (datetime.date): 終了日(この日を含む)
+            max_workers (int): イベントページを並列に取得するスレッド数. 1なら逐次実行
+            ordered (bool): Trueならカレンダー上の順序を保つ.
+                Falseなら取得が終わった順に並ぶ.
+            transport (BaseTransport): 通信に使うtransport. Noneならデフォルトのもの
+            parser (str): イベントページの解析方法. `PARSERS` のいずれか
+            stats (Stats): 計測を記録する先. Noneなら記録しない
+            parse_workers (int): イベントページをパースするプロセス数. 0ならコア数.
+                Noneなら取得したスレッドでそのままパースする
+            fields: 取り出すフィールド名のiterable( `events.FIELDS` のいずれか). Noneなら全て.
+                title, url, 日付と時刻は常に取り出す
+            lazy (bool): Trueなら `LAZY_FIELDS` を参照された時に取り出す( `events.LazyEvent` )
+            max_bytes (int): parserが 'stream' の時, 1ページから受け取る本文のbytes数の上限
+            max_parse_time (float): parserが 'stream' の時, 1ページの受信とパースにかける秒数の上限
+
+        Yields:
+            Event: イベントページをパースし終わったものから順に返す.
+            途中でやめれば残りのイベントページは取得しない.
+
+        Raises:
+            ValueError: 未知のフィールド名の場合.
+        """
+        extract, deferred = _projection(fields, lazy)
+        if transport is None:
+            transport = get_default_transport()
+        index = cls._get_calendars(start_date, end_date, transport=transport, stats=stats)
+        urls = index.urls(start_date, end_date)
         # TODO: python3.8 PEP572
-        for _url in cls._get_events_urls(start_date, end_date, session):
-            event = cls._get_event(url=_url)
+        for event in cls._map_events(urls, max_workers=max_workers, ordered=ordered, transport=transport,
+                                     parser=parser, stats=stats, parse_workers=parse_workers, extract=extract,
+                                     deferred=deferred, max_bytes=max_bytes, max_parse_time=max_parse_time):
             if event is not None:
-                answer.append(event)
-        return answer
+                yield event
+
+    @classmethod
+    def _get_calendars(cls, start_date: datetime.date, end_date: datetime.date,
+                       transport: BaseTransport = None, stats: Stats = None, failed: list = None) -> CalendarIndex:
+        """期間に含まれる月の行事カレンダーを並列に取得し, 1つの索引にまとめる
+
+        Args:
+            start_date (datetime.date): 開始日
+            end_date (datetime.date): 終了日(この日を含む)
+            transport (BaseTransport): 通信に使うtransport
+            stats (Stats): 計測を記録する先
+            failed (list): 指定すれば, 取得できなかった月を例外を送出せずに (年, 月, 例外) として加える.
+                ただし全ての月が取得できなければ最初の例外を送出する
+
+        Returns:
+            :obj:`kueventparser.index.CalendarIndex`: 索引
+        """
+        months = months_between(start_date, end_date)
+
+        def get(month):
+            if failed is None:
+                return cls.get_calendar(*month, transport=transport, stats=stats)
+            try:
+                return cls.get_calendar(*month, transport=transport, stats=stats)
+            except Exception as e:
+                return e
+
+        index = CalendarIndex()
+        if len(months) == 1:
+            results = [get(months[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(months), _CALENDAR_WORKERS)) as executor:
+                results = list(executor.map(get, months))
+        errors = [(month, result) for month, result in zip(months, results) if isinstance(result, Exception)]
+        if errors and len(errors) == len(months):
+            raise errors[0][1]
+        for (year, month), error in errors:
+            failed.append((year, month, error))
+        for result in results:
+            if not isinstance(result, Exception):
+                index.update(result)
+        return index
+
+    @classmethod
+    def _map_events(cls, urls, max_workers: int = 1, ordered: bool = False, transport: BaseTransport = None,
+                    parser: str = 'soup', stats: Stats = None, parse_workers: int = None, extract=None,
+                    deferred=frozenset(), max_bytes: int = None, max_parse_time: float = None):
+        """URLのリストからイベントを作る.
+
+        `max_workers` が1以下ならスレッドを使わずに順番に取得する.
+        途中でgeneratorを閉じれば未着手の取得はキャンセルされる( `utils.imap_bounded` ).
+        `parse_workers` が指定されればパースはプロセスプールで行う( `utils.imap_pipelined` ).
+        ただし `parser` が 'stream' なら受信しながらパースするので使わない.
+
+        Args:
+            urls: イベントページのURLのiterable
+            max_workers (int): 同時に取得するスレッド数の上限
+            ordered (bool): Trueなら `urls` の順序で返す
+            transport (BaseTransport): 通信に使うtransport
+            parser (str): イベントページの解析方法
+            stats (Stats): 計測を記録する先
+            parse_workers (int): パースするプロセス数. 0ならコア数
+            extract: 取り出す `OPTIONAL_FIELDS` の集合. Noneなら全て
+            deferred: 参照された時に取り出すフィールドの集合
+            max_bytes (int): 1ページから受け取る本文のbytes数の上限( `parser` が 'stream' の時)
+            max_parse_time (float): 1ページの受信とパースにかける秒数の上限( `parser` が 'stream' の時)
+
+        Returns:
+            generator of Optional[Event]
+        """
+        if parse_workers is None or parser == 'stream':
+            return imap_bounded(partial(cls._get_event, transport=transport, parser=parser, stats=stats,
+                                        extract=extract, deferred=deferred, max_bytes=max_bytes,
+                                        max_parse_time=max_parse_time), urls,
+                                max_workers=max_workers, ordered=ordered)
+        return cls._pipeline_events(urls, max_workers, parse_workers or os.cpu_count() or 1, ordered,
+                                    transport, parser, stats, extract, deferred)
+
+    @classmethod
+    def _pipeline_events(cls, urls, fetch_workers: int, parse_workers: int, ordered: bool,
+                         transport: BaseTransport = None, parser: str = 'soup', stats: Stats = None,
+                         extract=None, deferred=frozenset()):
+        """取得とパースを別々の段で動かしてイベントを作る"""
+        if transport is None:
+            transport = get_default_transport()
+        stats = stats or NULL_STATS
+        results = imap_pipelined(partial(cls._fetch_page, transport=transport, stats=stats),
+                                 partial(_parse_fetched, cls, parser, stats.enabled, extract), urls,
+                                 fetch_workers=fetch_workers, parse_workers=parse_workers, ordered=ordered)
+        for result in results:
+            if result is None:
+                yield None
+                continue
+            url, event, timings, status_code = result
+            # パースしたプロセスで計った時間
+            for name, seconds in timings:
+                stats.record(name, seconds)
+            yield cls._defer(cls._finish(url, event, transport, stats, status_code), deferred, transport, parser)
+
+    @classmethod
+    def generate_replayed(cls, archive: str, start_date: datetime.date, end_date: datetime.date,
+                          max_workers: int = None, ordered: bool = False, parser: str = 'soup',
+                          stats: Stats = None, fields=None, lazy: bool = False):
+        """記録したページ( `kueventparser.archive` )からイベントを作り直す. 通信はしない
+
+        行事カレンダーはこのプロセスで読み, イベントページは `max_workers` 個のプロセスで並列にパースする.
+        各プロセスはアーカイブを自分でmmapするので, プロセス間で受け渡すのはURLとEventだけ.
+
+        Args:
+            archive (str): アーカイブのファイル
+            start_date (datetime.date): 開始日
+            end_date (datetime.date): 終了日(この日を含む)
+            max_workers (int): パースするプロセス数. Noneならコア数, 1ならこのプロセスで逐次実行
+            ordered (bool): Trueならカレンダー上の順序を保つ
+            parser (str): イベントページの解析方法. `PARSERS` のいずれか
+            stats (Stats): 計測を記録する先. 複数のプロセスで実行した場合,
+                イベントページの段階の時間は記録しない(カウンタは記録する)
+            fields: 取り出すフィールド名のiterable( `events.FIELDS` のいずれか). Noneなら全て.
+                title, url, 日付と時刻は常に取り出す
+            lazy (bool): Trueなら `LAZY_FIELDS` を参照された時に取り出す( `events.LazyEvent` )
+
+        Yields:
+            Event: イベント
+        """
+        extract, deferred = _projection(fields, lazy)
+        transport = get_replay_transport(archive)
+        index = cls._get_calendars(start_date, end_date, transport=transport, stats=stats)
+        urls = index.urls(start_date, end_date)
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        if max_workers <= 1:
+            events = cls._map_events(urls, transport=transport, parser=parser, stats=stats, extract=extract,
+                                     deferred=deferred)
+        else:
+            stats = stats or NULL_STATS
+            events = (cls._defer(cls._counted(event, stats), deferred, transport, parser) for event in imap_bounded(
+                partial(_replay_event, cls, archive, parser, extract), urls, max_workers=max_workers,
+                ordered=ordered, processes=True))
+        for event in events:
+            if event is not None:
+                yield event
+
+    @classmethod
+    def sync(cls, start_date: datetime.date, end_date: datetime.date, state, max_workers: int = 1,
+             recheck: float = DEFAULT_RECHECK, transport: BaseTransport = None, parser: str = 'soup',
+             stats: Stats = None):
+        """前回の同期からの差分を返す
+
+        行事カレンダーを取得し, 新しいURLと, 前回の確認から `recheck` 秒以上経ったURLだけを
+        条件付きGETで確認する. 本文のハッシュが変わったページだけをパースし直す.
+        イベント情報の無いページも記録しておき, 毎回取得し直さない.
+        行事カレンダーが取得できなかった月は 'calendar.failed' に数え, その月のイベントは削除しない
+        (全ての月が取得できなければ例外を送出する).
+
+        Args:
+            start_date (datetime.date): 開始日
+            end_date (datetime.date): 終了日(この日を含む)
+            state: :obj:`kueventparser.sync.StateStore` またはそのファイルのパス
+            max_workers (int): イベントページを並列に取得するスレッド数
+            recheck (float): 前回の確認からこの秒数が経つまではページを確認しない
+            transport (BaseTransport): 通信に使うtransport. Noneならデフォルトのもの
+            parser (str): イベントページの解析方法. `PARSERS` のいずれか
+            stats (Stats): 計測を記録する先. Noneなら記録しない
+
+        Yields:
+            :obj:`kueventparser.sync.Delta`: 追加, 変更, 削除されたイベント
+        """
+        store = state if isinstance(state, StateStore) else StateStore(state)
+        if transport is None:
+            transport = get_default_transport()
+        stats = stats or NULL_STATS
+        try:
+            failed = []
+            index = cls._get_calendars(start_date, end_date, transport=transport, stats=stats,
+                                       failed=failed).slice(start_date, end_date)
+            if failed:
+                stats.count('calendar.failed', len(failed))
+            # 取得できなかった月. この月に載っていたイベントは消えたか分からない
+            unknown = [tuple(day.isoformat() for day in date_to_month(datetime.date(year, month, 1)))
+                       for year, month, _ in failed]
+            days = {}
+            for date, urls in index.items():
+                for url in urls:
+                    first, _ = days.get(url, (date, date))
+                    days[url] = (first, date)
+            now = time.time()
+            records = {url: store.get(url) for url in days}
+            due = []
+            for url, (first, last) in days.items():
+                record = records[url]
+                if record is None or now - record.last_checked >= recheck:
+                    due.append(url)
+                else:
+                    _extend(record, first, last, now)
+                    store.put(record)
+
+            def check(_url):
+                _record = records[_url]
+                with stats.stage('event.fetch'):
+                    r = transport.get(_url, headers=_record.validators() if _record is not None else None)
+                stats.fetched(r)
+                if r.status_code == 304 or r.status_code >= 500 or r.status_code == 429:
+                    return r, None, None
+                digest = content_hash(r.content)
+                if _record is not None and digest == _record.hash:
+                    return r, digest, _record.event
+                if r.status_code != 200:
+                    return r, digest, None
+                return r, digest, cls._counted(cls._parse_page(_url, r.content, r.encoding, parser, stats), stats)
+
+            for url, (r, digest, event) in zip(due, imap_bounded(check, due, max_workers=max_workers,
+                                                                 ordered=True)):
+                record = records[url]
+                first, last = days[url]
+                if digest is None:
+                    # 変更無し(304)か一時的なエラー. エラーなら次回確認し直す
+                    if record is not None:
+                        _extend(record, first, last, now, checked=r.status_code == 304)
+                        store.put(record)
+                    continue
+                kind = None
+                if record is None:
+                    kind = ADDED if event is not None else None
+                    record = Record(url, digest, None, None, event, first.isoformat(), last.isoformat(), now, now)
+                elif record.event is None:
+                    kind = ADDED if event is not None else None
+                elif event is None:
+                    # イベント情報が無くなった
+                    kind = REMOVED
+                    event = record.event
+                    record.event = None
+                elif event != record.event:
+                    kind = CHANGED
+                record.hash = digest
+                if kind != REMOVED:
+                    record.event = event
+                record.etag = r.headers.get('etag')
+                record.last_modified = r.headers.get('last-modified')
+                _extend(record, first, last, now, checked=True)
+                store.put(record)
+                if kind is not None:
+                    yield Delta(kind, url, event)
+
+            # カレンダーから消えたイベント
+            for record in store.in_range(start_date.isoformat(), end_date.isoformat()):
+                if any(record.first_day <= last and record.last_day >= first for first, last in unknown):
+                    continue
+                if record.url not in days:
+                    store.remove(record.url)
+                    if record.event is not None:
+                        yield Delta(REMOVED, record.url, record.event)
+        finally:
+            if store is not state:
+                store.close()
+
+    @classmethod
+    async def aget(cls, url: str, transport: AsyncHTTPTransport = None, parser: str = 'soup',
+                   stats: Stats = None, fields=None):
+        """ `get` のasyncio版
+
+        Args:
+            url (str): イベントページのURL
+            transport (AsyncHTTPTransport): 通信に使うtransport. Noneなら新しく作る
+            parser (str): イベントページの解析方法. `PARSERS` のいずれか
+            stats (Stats): 計測を記録する先. Noneなら記録しない
+            fields: 取り出すフィールド名のiterable. `get` を参照
+
+        Returns:
+            Optional[Event]: Event
+        """
+        extract = _projection(fields)[0]
+        if transport is None:
+            async with AsyncHTTPTransport() as transport:
+                return await cls._aget_event(url, transport, parser, stats, extract)
+        return await cls._aget_event(url, transport, parser, stats, extract)
+
+    @classmethod
+    async def aget_all(cls, start_date: datetime.date, end_date: datetime.date, max_workers: int = None,
+                       ordered: bool = False, transport: AsyncHTTPTransport = None, parser: str = 'soup',
+                       stats: Stats = None, fields=None):
+        """ `get_all` のasyncio版
+
+        Args:
+            start_date (datetime.date): date to get events including year and month
+            end_date (datetime.date): date to get events including year and month
+            max_workers (int): 同時に取得するイベントページ数の上限. Noneならtransportの上限のみ
+            ordered (bool): Trueならカレンダー上の順序を保つ
+            transport (AsyncHTTPTransport): 通信に使うtransport. Noneなら新しく作る
+            parser (str): イベントページの解析方法. `PARSERS` のいずれか
+            stats (Stats): 計測を記録する先. Noneなら記録しない
+            fields: 取り出すフィールド名のiterable. `get` を参照
+
+        Returns:
+            list: `events.Event'
+        """
+        return [event async for event in cls.agenerate_all(
+            start_date, end_date, max_workers=max_workers, ordered=ordered, transport=transport, parser=parser,
+            stats=stats, fields=fields)]
+
+    @classmethod
+    async def agenerate_all(cls, start_date: datetime.date, end_date: datetime.date, max_workers: int = None,
+                            ordered: bool = False, transport: AsyncHTTPTransport = None, parser: str = 'soup',
+                            stats: Stats = None, fields=None):
+        """ `generate_all` のasyncio版
+
+        イベントページは並行して取得し, パースが終わったものから順にyieldする.
+        パースはイベントループのデフォルトのスレッドプールで行う.
+
+        Args:
+            start_date (datetime.date): date to get events including year and month
+            end_date (datetime.date): date to get events including year and month
+            max_workers (int): 同時に取得するイベントページ数の上限. Noneならtransportの上限のみ
+            ordered (bool): Trueならカレンダー上の順序でyieldする
+            transport (AsyncHTTPTransport): 通信に使うtransport. Noneなら新しく作る
+            parser (str): イベントページの解析方法. `PARSERS` のいずれか
+            stats (Stats): 計測を記録する先. Noneなら記録しない
+            fields: 取り出すフィールド名のiterable. `get` を参照
+
+        Yields:
+            Event: Event
+        """
+        if transport is None:
+            async with AsyncHTTPTransport() as transport:
+                async for event in cls.agenerate_all(start_date, end_date, max_workers=max_workers,
+                                                     ordered=ordered, transport=transport, parser=parser,
+                                                     stats=stats, fields=fields):
+                    yield event
+            return
+        extract = _projection(fields)[0]
+        stats = stats or NULL_STATS
+        index = CalendarIndex()
+        months = months_between(start_date, end_date)
+        with stats.stage('calendar.fetch'):
+            responses = await asyncio.gather(*[transport.get(cls._template.format(*month)) for month in months])
+        for month, response in zip(months, responses):
+            stats.fetched(response)
+            # エラーページを空のカレンダーとして扱わない
+            response.raise_for_status()
+            with stats.stage('calendar.parse'):
+                soup = content_to_soup(response.content)
+            with stats.stage('calendar.index'):
+                index.update(cls._parse_calendar(soup, *month))
+        urls = index.urls(start_date, end_date)
+        semaphore = asyncio.Semaphore(max_workers) if max_workers else None
+
+        async def fetch(_url):
+            if semaphore is None:
+                return await cls._aget_event(_url, transport, parser, stats, extract)
+            async with semaphore:
+                return await cls._aget_event(_url, transport, parser, stats, extract)
+
+        tasks = [asyncio.ensure_future(fetch(_url)) for _url in urls]
+        try:
+            for task in (tasks if ordered else asyncio.as_completed(tasks)):
+                event = await task
+                if event is not None:
+                    yield event
+        finally:
+            # 途中でやめた場合は残りの取得を止める
+            for task in tasks:
+                task.cancel()
+
+    @classmethod
+    async def _aget_event(cls, url: str, transport: AsyncHTTPTransport, parser: str = 'soup',
+                          stats: Stats = None, extract=None) -> Optional[Event]:
+        """イベントページを取得し, イベントループを止めないようにパースはスレッドプールで行う"""
+        stats = stats or NULL_STATS
+        with stats.stage('event.fetch'):
+            response = await transport.get(url)
+        stats.fetched(response)
+        event = await asyncio.get_event_loop().run_in_executor(
+            None, partial(cls._parse_page, url, response.content, response.encoding, parser, stats, extract))
+        return cls._counted(event, stats)
+
+    @classmethod
+    def get_calendar(cls, year: int, month: int, transport: BaseTransport = None,
+                     stats: Stats = None) -> CalendarIndex:
+        """行事カレンダーを取得して 日付 -> イベントURL の索引を作る
+
+        Args:
+            year (int): 年
+            month (int): 月
+            transport (BaseTransport): 通信に使うtransport. Noneならデフォルトのもの
+            stats (Stats): 計測を記録する先. Noneなら記録しない
+
+        Returns:
+            :obj:`kueventparser.index.CalendarIndex`: 索引
+
+        Raises:
+            kueventparser.transports.HTTPError: 行事カレンダーがエラー(400以上)で返った場合.
+        """
+        stats = stats or NULL_STATS
+        soup = url_to_soup(cls._template.format(year, month), transport=transport, stats=stats, stage='calendar')
+        with stats.stage('calendar.index'):
+            return cls._parse_calendar(soup, year, month)
+
+    @classmethod
+    def _parse_calendar(cls, soup: bs4.BeautifulSoup, year: int, month: int) -> CalendarIndex:
+        """行事カレンダーのsoupを一度だけ走査して索引を作る
+
+        Args:
+            soup: 行事カレンダーのBeautifulSoupのオブジェクト
+            year (int): カレンダーの年
+            month (int): カレンダーの月
+
+        Returns:
+            :obj:`kueventparser.index.CalendarIndex`: 索引
+        """
+        index = CalendarIndex()
+        for td_day in soup.find_all('td', class_='day'):
+            match = _DAY.match(td_day.get_text())
+            if match is None:
+                continue
+            try:
+                date = datetime.date(year, month, int(match.group(1)))
+            except ValueError:
+                continue
+            event_of_day = td_day.parent.find(class_='event_of_day')
+            if event_of_day is None:
+                continue
+            for e in event_of_day.find_all('a'):
+                url = e.get('href')
+                if url is not None:
+                    index.add(date, url)
+        return index
 
     @classmethod
     def _get_events_urls(cls, start, end: datetime.date, session=None):
-        urls = None
-        for n in range((end - start).days):
-            day = start + datetime.timedelta(n)
-            _url = cls._get_events_url_daily(day, session=session)
-            if urls is None:
-                urls = _url
-            else:
-                urls = chain(urls, _url)
-        yield from set(urls)
+        """期間内のイベントURLを, 重複を除いてカレンダー順に返す
+
+        Args:
+            start: 開始日
+            end: 終了日(この日を含む)
+            session: `start` の月の行事カレンダーのsoup. Noneなら取得する
+
+        Returns:
+            generator of url
+        """
+        if session is None:
+            index = cls.get_calendar(start.year, start.month)
+        else:
+            index = cls._parse_calendar(session, start.year, start.month)
+        yield from index.urls(start, end)
 
     @classmethod
     def _get_events_url_daily(cls, date: datetime.date, session=None):
-        """京大の行事カレンダーから指定した月のイベントURLリストを作成する
+        """京大の行事カレンダーから指定した日のイベントURLリストを作成する
 
         Args:
-            date : 取得するイベントの月(日付は参照されない)
+            date : 取得するイベントの日付
 
         Returns:
-            指定のイベントURL (HTML取得に失敗した時はNoneが返ってくる)
+            指定のイベントURL
         """
-        url = cls._template.format(date.year, date.month)
-        # get beautifulsoup object from url or given args
-        soup = url_to_soup(url) if session is None else session
-        # get event data from table in HTML
-        td_day = soup.find('td', class_='day', text=re.compile(str(date.day)))
-        for e in td_day.parent.find(class_='event_of_day').find_all('a'):
-            url = e.get('href')
-            if url is not None:
-                yield url
+        yield from cls._get_events_urls(date, date, session=session)
 
     @classmethod
-    def _get_event(cls, url: str) -> Optional[Event]:
+    def _get_event(cls, url: str, transport: BaseTransport = None, parser: str = 'soup',
+                   stats: Stats = None, extract=None, deferred=frozenset(), max_bytes: int = None,
+                   max_parse_time: float = None) -> Optional[Event]:
         """日付とURLからイベントを作る.
 
         日付を引数に取るのは,HPの日付の表記がバラバラすぎるため.
 
         Args:
             url: URL
+            transport: 通信に使うtransport
+            parser: イベントページの解析方法
+            stats: 計測を記録する先
+            extract: 取り出す `OPTIONAL_FIELDS` の集合. Noneなら全て
+            deferred: 参照された時に取り出すフィールドの集合
+            max_bytes: 受け取る本文のbytes数の上限( `parser` が 'stream' の時)
+            max_parse_time: 受信とパースにかける秒数の上限( `parser` が 'stream' の時)
 
         Returns:
             Event: Event class
 
         """
+        if transport is None:
+            transport = get_default_transport()
+        if parser == 'stream':
+            event = cls._stream_event(url, transport, stats, extract, max_bytes, max_parse_time)
+            return cls._defer(event, deferred, transport, parser)
+        fetched = cls._fetch_page(url, transport, stats)
+        if fetched is None:
+            return None
+        url, content, encoding, status_code = fetched
+        event = cls._finish(url, cls._parse_page(url, content, encoding, parser, stats, extract), transport, stats,
+                            status_code)
+        return cls._defer(event, deferred, transport, parser)
+
+    @classmethod
+    def _fetch_page(cls, url: str, transport: BaseTransport, stats: Stats = None) -> Optional[tuple]:
+        """イベントページを取得する(パースはしない)
+
+        Args:
+            url: URL
+            transport: 通信に使うtransport
+            stats: 計測を記録する先
+
+        Returns:
+            tuple: (URL, 本文, 文字コード, ステータスコード). イベント情報が無いと分かっているページならNone
+        """
+        stats = stats or NULL_STATS
+        # イベント情報が無いと分かっているページは取得しない
+        cache = getattr(transport, 'cache', None)
+        if cache is not None and cache.is_negative(url):
+            stats.count('events.none')
+            return None
+        with stats.stage('event.fetch'):
+            r = transport.get(url)
+        stats.fetched(r)
+        return url, r.content, r.encoding, r.status_code
+
+    @classmethod
+    def _stream_event(cls, url: str, transport: BaseTransport, stats: Stats = None, extract=None,
+                      max_bytes: int = None, max_parse_time: float = None) -> Optional[Event]:
+        """イベントページを受信しながらパースし, 要るフィールドを読み終えたら受信をやめる
+
+        上限( `max_bytes` , `max_parse_time` )を超えたページもそこで受信をやめ, 読めた所からイベントを作る.
+        作れなくても, イベント情報が無いページとしてnegative cacheには記録しない.
+        `max_parse_time` は読み込みのタイムアウトにも使うので, 応答の無いサーバを待つのも
+        (応答を待つ分と最後の読み込みの分を合わせて)その数倍までになる.
+
+        Args:
+            url: URL
+            transport: 通信に使うtransport
+            stats: 計測を記録する先. 途中でやめたページを 'stream.stopped' ,
+                上限を超えたページを 'stream.truncated' に数える
+            extract: 取り出す `OPTIONAL_FIELDS` の集合. Noneなら全て
+            max_bytes: 受け取る本文のbytes数の上限. Noneなら制限しない
+            max_parse_time: 受信とパースにかける秒数の上限. Noneなら制限しない
+
+        Returns:
+            Event: Event class (イベント情報が見つからなければNone)
+        """
+        stats = stats or NULL_STATS
+        cache = getattr(transport, 'cache', None)
+        if cache is not None and cache.is_negative(url):
+            stats.count('events.none')
+            return None
+        with stats.stage('event.fetch'):
+            r = transport.stream(url, timeout=max_parse_time)
+        try:
+            with stats.stage('event.parse'):
+                extracted, received, state = _stream_fields(r.iter_content(), r.encoding, extract, max_bytes,
+                                                            max_parse_time)
+        finally:
+            r.close()
+        stats.fetched(r, size=received)
+        if state != _STREAM_DONE:
+            stats.count(state)
+        event = None
+        if extracted is not None:
+            with stats.stage('event.strings'):
+                event = cls._make_event(url, *extracted)
+        if state == _STREAM_TRUNCATED:
+            return cls._counted(event, stats)
+        return cls._finish(url, event, transport, stats, r.status_code)
 
-        soup = url_to_soup(url)
+    @classmethod
+    def _finish(cls, url: str, event: Optional[Event], transport: BaseTransport, stats: Stats = None,
+                status_code: int = 200):
+        """作ったイベントを数え, イベント情報が無かったページはnegative cacheに記録する
+
+        記録するのは200で返ったページだけ. エラーやメンテナンス中のページは次回も取得する.
+        """
+        cls._counted(event, stats or NULL_STATS)
+        cache = getattr(transport, 'cache', None)
+        if event is None and cache is not None and status_code == 200:
+            cache.mark_negative(url)
+        return event
+
+    @classmethod
+    def _defer(cls, event: Optional[Event], deferred, transport: BaseTransport, parser: str) -> Optional[Event]:
+        """ `deferred` のフィールドを参照された時に取り出す :obj:`LazyEvent` にする"""
+        if event is None or not deferred:
+            return event
+        return LazyEvent(event, deferred, partial(cls._load_fields, names=deferred, transport=transport,
+                                                  parser=parser))
+
+    @classmethod
+    def _load_fields(cls, url: str, names, transport: BaseTransport, parser: str = 'soup') -> dict:
+        """ページを取得し直して, 指定したフィールドだけを取り出す
+
+        Returns:
+            dict: フィールド名 -> 値. イベント情報が無くなっていれば空
+        """
+        r = transport.get(url)
+        extracted = cls._extract(r.content, r.encoding, parser, names)
+        return {name: extracted[1].get(name) for name in names} if extracted is not None else {}
+
+    @staticmethod
+    def _counted(event: Optional[Event], stats: Stats) -> Optional[Event]:
+        """作れたイベント数とイベント情報の無かったページ数を数える"""
+        stats.count('events' if event is not None else 'events.none')
+        return event
+
+    @classmethod
+    def _parse_page(cls, url: str, content: bytes, encoding: str = None, parser: str = 'soup',
+                    stats: Stats = None, extract=None) -> Optional[Event]:
+        """イベントページのHTMLからイベントを作る.
+
+        Args:
+            url: URL
+            content: イベントページのHTML
+            encoding: HTMLの文字コード. 分かっていれば文字コードの推測を省く
+            parser: 解析方法. `PARSERS` のいずれか
+            stats: 計測を記録する先
+            extract: 取り出す `OPTIONAL_FIELDS` の集合. Noneなら全て
+
+        Returns:
+            Event: Event class (イベント情報が見つからなければNone)
+
+        Raises:
+            EventPageError: イベント名が無い(イベントページでない)場合.
+            ValueError: 未知の解析方法の場合.
+        """
+        stats = stats or NULL_STATS
+        with stats.stage('event.parse'):
+            extracted = cls._extract(content, encoding, parser, extract)
+        if extracted is None:
+            return None
+        with stats.stage('event.strings'):
+            return cls._make_event(url, *extracted)
+
+    @classmethod
+    def _extract(cls, content: bytes, encoding: str = None, parser: str = 'soup',
+                 extract=None) -> Optional[tuple]:
+        """イベントページのHTMLからイベント名とイベント情報の文字列を抜き出す.
+
+        Args:
+            content: イベントページのHTML
+            encoding: HTMLの文字コード
+            parser: 解析方法. `PARSERS` のいずれか
+            extract: 取り出す `OPTIONAL_FIELDS` の集合. Noneなら全て
+
+        Returns:
+            tuple: (イベント名, date, time と `extract` のフィールドの文字列の辞書).
+            イベント情報が見つからなければNone
+
+        Raises:
+            EventPageError: イベント名が無い(イベントページでない)場合. どの解析方法でも同じ.
+            ValueError: 未知の解析方法の場合.
+        """
+        if parser == 'soup':
+            return cls._soup_fields(bs4.BeautifulSoup(content, "lxml", from_encoding=encoding), extract)
+        if parser == 'strainer':
+            return cls._soup_fields(bs4.BeautifulSoup(content, "lxml", parse_only=_STRAINER,
+                                                      from_encoding=encoding), extract)
+        if parser == 'lxml':
+            return _lxml_fields(_lxml_document(content, encoding), extract)
+        if parser == 'stream':
+            return _stream_fields((content,), encoding, extract)[0]
+        raise ValueError("unknown parser: '{}' (choose from {})".format(parser, ', '.join(PARSERS)))
+
+    @classmethod
+    def _parse_event(cls, url: str, soup: bs4.BeautifulSoup) -> Optional[Event]:
+        """イベントページのsoupからイベントを作る.
+
+        Args:
+            url: URL
+            soup: イベントページのBeautifulSoupのオブジェクト
+
+        Returns:
+            Event: Event class (イベント情報が見つからなければNone)
+        """
+        extracted = cls._soup_fields(soup)
+        return cls._make_event(url, *extracted) if extracted is not None else None
+
+    @classmethod
+    def _soup_fields(cls, soup: bs4.BeautifulSoup, extract=None) -> Optional[tuple]:
+        """イベントページのsoupからイベント名とイベント情報の文字列を抜き出す"""
+        if extract is None:
+            extract = OPTIONAL_FIELDS
         # リストに実際のイベントの情報を取り込む
-        title = soup.find(
-            "h1", class_="title").stripped_strings.__next__()
+        heading = soup.find("h1", class_="title")
+        if heading is None:
+            raise EventPageError('no event title in the page')
+        title = heading.stripped_strings.__next__()
         try:
-            location = cls.__find_location(soup)
-            description = cls.__find_description(soup)
-            date_data = parse_str_to_date(cls.__find_date(soup))
-            time_data = parse_str_to_time(cls.__find_time(soup))
+            fields = {}
+            if 'location' in extract:
+                fields['location'] = cls.__find_location(soup)
+            if 'description' in extract:
+                fields['description'] = cls.__find_description(soup)
+            fields['date'] = cls.__find_date(soup)
+            fields['time'] = cls.__find_time(soup)
+        except AttributeError:
+            return None
+        return title, fields
+
+    @staticmethod
+    def _make_event(url: str, title: str, fields: dict) -> Optional[Event]:
+        """ページから抜き出した文字列からイベントを作る.
+
+        Args:
+            url: URL
+            title: イベント名
+            fields: date, time と(取り出していれば) location, description の文字列
+
+        Returns:
+            Event: Event class (日付, 時刻が読めなければNone)
+        """
+        try:
+            date_data = parse_str_to_date(fields['date'])
+            time_data = parse_str_to_time(fields['time'])
             start_ = date_data.get('start')
             end_ = date_data.get('end')
             start = time_data.get('start')
             end = time_data.get('end')
-        except AttributeError:
+        except (AttributeError, ValueError):
             return None
 
         # create event instance
-        event = Event(title=title, url=url, location=location,
-                      description=description, start_date=start_, end_date=end_, start=start, end=end)
+        event = Event(title=title, url=url, location=fields.get('location'),
+                      description=fields.get('description'), start_date=start_, end_date=end_, start=start, end=end)
         return event
 
+    @staticmethod
+    def _xpath_fields(root, extract=None) -> dict:
+        """lxmlの木からイベント情報の文字列を抽出する
+
+        BeautifulSoup版( `__find_location` 等)と同じ文字列になるようにしている.
+
+        Args:
+            root(:obj:`lxml.html.HtmlElement`): イベントページ
+            extract: 取り出す `OPTIONAL_FIELDS` の集合. Noneなら全て
+
+        Returns:
+            dict: date, time と `extract` のフィールドの文字列
+
+        Raises:
+            AttributeError: 見出しが見つからない場合.
+        """
+        if extract is None:
+            extract = OPTIONAL_FIELDS
+        fields = {}
+        if 'location' in extract:
+            location = []
+            for string in _stripped_strings(_label_span(root, "開催地")):
+                # 構内マップが出てきたらそれ以降は除く
+                if "マップ" in string:
+                    break
+                location.append(string)
+            fields['location'] = "".join(location)
+        if 'description' in extract:
+            fields['description'] = "".join(string + "\n" for string in _stripped_strings(_label_span(root, "要旨")))
+        rows = _XPATH_DATE_ROW(root)
+        if not rows:
+            raise AttributeError("開催日")
+        dates = _stripped_strings(rows[0])
+        fields['date'] = dates[-1] if dates else None
+        fields['time'] = "".join(_stripped_strings(_label_span(root, "時間")))
+        return fields
+
     @staticmethod
     def __find_location(elem):
         """HTML要素から場所名を抽出する
@@ -132,15 +968,15 @@ class OfficialEventFactory(EventFactoryMixin):
             str: 場所名
         """
 
-        location = ""
+        location = []
         for string in elem.find(string="開催地") \
                 .find_next("span").stripped_strings:
             # 構内マップが出てきたらそれ以降は除く
             if "マップ" in string:
                 break
             # それ以外
-            location += string
-        return location
+            location.append(string)
+        return "".join(location)
 
     @staticmethod
     def __find_description(elem):
@@ -155,12 +991,8 @@ class OfficialEventFactory(EventFactoryMixin):
         Returns:
             str: イベント詳細
         """
-        description = ""
-        for string in elem.find(string="要旨") \
-                .find_next("span").stripped_strings:
-            description += string
-            description += "\n"
-        return description
+        return "".join(string + "\n" for string in elem.find(string="要旨")
+                       .find_next("span").stripped_strings)
 
     @staticmethod
     def __find_time(elem: bs4.element.Tag):
@@ -198,3 +1030,236 @@ class OfficialEventFactory(EventFactoryMixin):
         for item in elem.find(string="開催日").parent.parent.parent.stripped_strings:
             pass
         return item
+
+
+def _projection(fields=None, lazy: bool = False) -> tuple:
+    """ `fields` と `lazy` から, すぐに取り出すフィールドと参照された時に取り出すフィールドを決める
+
+    Args:
+        fields: 要るフィールド名のiterable. Noneなら全て
+        lazy(bool): `LAZY_FIELDS` を参照された時に取り出すかどうか
+
+    Returns:
+        tuple: (すぐに取り出す `OPTIONAL_FIELDS` の集合, 参照された時に取り出すフィールドの集合)
+
+    Raises:
+        ValueError: 未知のフィールド名の場合.
+    """
+    if fields is None:
+        wanted = frozenset(OPTIONAL_FIELDS)
+    else:
+        fields = frozenset(fields)
+        unknown = fields.difference(FIELDS)
+        if unknown:
+            raise ValueError("unknown fields: {} (choose from {})".format(', '.join(sorted(unknown)),
+                                                                          ', '.join(FIELDS)))
+        wanted = fields.intersection(OPTIONAL_FIELDS)
+    deferred = wanted.intersection(LAZY_FIELDS) if lazy else frozenset()
+    return wanted - deferred, deferred
+
+
+def _parse_fetched(factory, parser: str, timed: bool, extract, fetched: Optional[tuple]):
+    """パースするプロセスで, 取得したページからイベントを作る
+
+    Returns:
+        tuple: (URL, イベント, [(段階名, 秒数)], ステータスコード). `fetched` がNoneならNone
+    """
+    if fetched is None:
+        return None
+    timings = []
+    stats = Stats(on_end=lambda name, seconds: timings.append((name, seconds))) if timed else NULL_STATS
+    url, content, encoding, status_code = fetched
+    return url, factory._parse_page(url, content, encoding, parser, stats, extract), timings, status_code
+
+
+def _replay_event(factory, archive: str, parser: str, extract, url: str) -> Optional[Event]:
+    """プロセスプールのワーカーで, 記録したページからイベントを作る"""
+    return factory._get_event(url, transport=get_replay_transport(archive), parser=parser, extract=extract)
+
+
+def _extend(record, first: datetime.date, last: datetime.date, now: float, checked: bool = False):
+    """同期の記録にカレンダーで見た日付と時刻を反映する"""
+    record.first_day = min(record.first_day, first.isoformat())
+    record.last_day = max(record.last_day, last.isoformat())
+    record.last_seen = now
+    if checked:
+        record.last_checked = now
+
+
+_lxml_parsers = threading.local()
+
+
+def _lxml_document(content: bytes, encoding: str = None):
+    """HTMLをlxmlでパースする. 文字コードが分かっていれば推測を省く"""
+    if encoding is None:
+        encoding = EncodingDetector.find_declared_encoding(content, is_html=True)
+    try:
+        codecs.lookup(encoding or '')
+    except LookupError:
+        encoding = None
+    if encoding is None:
+        return lxml.html.document_fromstring(UnicodeDammit(content, is_html=True).unicode_markup)
+    # lxmlのパーサはスレッド間で共有できないのでスレッド毎に作って使い回す
+    parsers = _lxml_parsers.__dict__
+    if encoding not in parsers:
+        parsers[encoding] = lxml.html.HTMLParser(encoding=encoding)
+    return lxml.html.document_fromstring(content, parser=parsers[encoding])
+
+
+def _lxml_fields(root, extract=None) -> Optional[tuple]:
+    """lxmlの木からイベント名とイベント情報の文字列を抜き出す( `OfficialEventFactory._extract` を参照)"""
+    titles = _XPATH_TITLE(root)
+    if not titles:
+        raise EventPageError('no event title in the page')
+    try:
+        return _stripped_strings(titles[0])[0], OfficialEventFactory._xpath_fields(root, extract)
+    except AttributeError:
+        return None
+
+
+# `_stream_fields` の終わり方. 最後まで読んだ, 要るフィールドを読み終えてやめた, 上限を超えてやめた
+_STREAM_DONE = 'stream.done'
+_STREAM_STOPPED = 'stream.stopped'
+_STREAM_TRUNCATED = 'stream.truncated'
+# 文字コードが分からない時に, 推測のために溜めるbytes数(HTMLのmetaのprescanと同じ)
+_SNIFF_SIZE = 1024
+# `_xpath_fields` が読む見出し
+_DATE_LABEL = '開催日'
+_FIELD_LABELS = (('location', '開催地'), ('description', '要旨'))
+
+
+def _stream_fields(chunks, encoding: str = None, extract=None, max_bytes: int = None,
+                   max_parse_time: float = None) -> tuple:
+    """本文を少しずつlxmlに渡してパースし, 要るフィールドを読み終えたらやめる
+
+    やめた所までの木から `_lxml_fields` で抜き出すので, 結果は 'lxml' と同じになる.
+
+    Args:
+        chunks: 本文を少しずつ返すiterable
+        encoding: HTMLの文字コード. Noneなら先頭から推測する
+        extract: 取り出す `OPTIONAL_FIELDS` の集合. Noneなら全て
+        max_bytes: 読むbytes数の上限. Noneなら制限しない
+        max_parse_time: 読み込みとパースにかける秒数の上限. Noneなら制限しない.
+            上限を過ぎてから読み込みが失敗した(タイムアウト等)場合も, 読めた所までで終える
+
+    Returns:
+        tuple: ( `_lxml_fields` の返り値, 読んだbytes数, 終わり方).
+        終わり方は `_STREAM_DONE` , `_STREAM_STOPPED` , `_STREAM_TRUNCATED` のいずれか
+    """
+    began = time.perf_counter()
+    watcher = _FieldWatcher(extract)
+    parser = None
+    head = b''
+    received = 0
+    state = _STREAM_DONE
+    chunks = iter(chunks)
+    while True:
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            break
+        except Exception:
+            if max_parse_time is None or time.perf_counter() - began < max_parse_time:
+                raise
+            state = _STREAM_TRUNCATED
+            break
+        if max_bytes is not None and received + len(chunk) > max_bytes:
+            chunk = chunk[:max_bytes - received]
+            state = _STREAM_TRUNCATED
+        received += len(chunk)
+        if parser is None:
+            head += chunk
+            if encoding is None and len(head) < _SNIFF_SIZE and state == _STREAM_DONE:
+                continue
+            parser, chunk = _pull_parser(head, encoding), head
+        parser.feed(chunk)
+        if watcher.update(parser.read_events()):
+            state = _STREAM_STOPPED
+            break
+        if state == _STREAM_TRUNCATED:
+            break
+        if max_parse_time is not None and time.perf_counter() - began > max_parse_time:
+            state = _STREAM_TRUNCATED
+            break
+    if parser is None:
+        parser = _pull_parser(head, encoding)
+        parser.feed(head)
+    root = parser.close()
+    if state == _STREAM_TRUNCATED:
+        try:
+            return _lxml_fields(root, extract), received, state
+        except EventPageError:
+            return None, received, state
+    return _lxml_fields(root, extract), received, state
+
+
+def _pull_parser(head: bytes, encoding: str = None):
+    """ `head` (本文の先頭)から文字コードを決めて `etree.HTMLPullParser` を作る"""
+    if encoding is None:
+        encoding = EncodingDetector.find_declared_encoding(head, is_html=True)
+    try:
+        codecs.lookup(encoding or '')
+    except LookupError:
+        encoding = None
+    if encoding is None:
+        encoding = UnicodeDammit(head, is_html=True).original_encoding
+    return etree.HTMLPullParser(events=('start', 'end'), encoding=encoding)
+
+
+class _FieldWatcher:
+    """ `etree.HTMLPullParser` のイベントから, 要るフィールドの要素を読み終えたかを調べる
+
+    `_XPATH_TITLE` , `_XPATH_DATE_ROW` , `_label_span` と同じ要素を待つ.
+    見出しが要素の最初の文字列でない等, 見つけられない場合は最後まで読む.
+    """
+
+    def __init__(self, extract=None):
+        if extract is None:
+            extract = OPTIONAL_FIELDS
+        self.title = False
+        # まだ見ていない見出し
+        self._labels = {'時間'}.union(label for name, label in _FIELD_LABELS if name in extract)
+        self._date = True
+        # 次に始まるspanを待っている見出しの数
+        self._waiting = 0
+        # 読み終えるのを待っている要素
+        self._open = []
+        self._remaining = len(self._labels) + 1
+
+    def update(self, events) -> bool:
+        """イベントを読み, 要る要素を全て読み終えていればTrue"""
+        for action, element in events:
+            if action == 'start':
+                if self._waiting and element.tag == 'span':
+                    self._open.extend([element] * self._waiting)
+                    self._waiting = 0
+                continue
+            if not self.title and element.tag == 'h1' and 'title' in (element.get('class') or '').split():
+                self.title = True
+            while element in self._open:
+                self._open.remove(element)
+                self._remaining -= 1
+            text = element.text
+            if text in self._labels:
+                self._labels.discard(text)
+                self._waiting += 1
+            elif self._date and text == _DATE_LABEL:
+                self._date = False
+                parent = element.getparent()
+                row = parent.getparent() if parent is not None else None
+                if row is not None:
+                    self._open.append(row)
+        return self.title and self._remaining == 0
+
+
+def _label_span(root, label: str):
+    """見出し `label` の次のspan要素. bs4の `find(string=label).find_next("span")` に当たる"""
+    spans = _XPATH_LABEL_SPAN(root, label=label)
+    if not spans:
+        raise AttributeError(label)
+    return spans[0]
+
+
+def _stripped_strings(element) -> list:
+    """要素内の空でない文字列. bs4の `stripped_strings` に当たる"""
+    return [string for string in (text.strip() for text in _XPATH_TEXT(element)) if string]
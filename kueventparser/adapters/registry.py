@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""factoryの登録
+
+`core.select_factory` は名前からここに登録されたfactoryを選ぶ.
+factoryは次の順に探し, 使われる時に初めて読み込む.
+
+1. `register` で登録したもの(組み込みの 'official' を含む)
+2. entry point( `ENTRY_POINT_GROUP` )で公開されたもの
+
+他のパッケージのfactoryは `setup.py` に次のように書けば名前で選べる.
+
+    entry_points={
+        'kueventparser.adapters': ['bungaku = kueventparser_bungaku:BungakuEventFactory'],
+    },
+"""
+import importlib
+import threading
+
+from kueventparser.adapters.base import EventFactoryMixin
+
+# factoryを公開するentry pointのグループ
+ENTRY_POINT_GROUP = 'kueventparser.adapters'
+
+# 名前 -> factoryのクラス, 'module:attr' の文字列またはentry point
+_registry = {
+    'official': 'kueventparser.adapters.official:OfficialEventFactory',
+}
+_discovered = False
+_lock = threading.Lock()
+
+
+def is_factory(value) -> bool:
+    """ `EventFactoryMixin` を継承したクラスかどうか"""
+    return isinstance(value, type) and issubclass(value, EventFactoryMixin)
+
+
+def register(name: str, factory):
+    """factoryを名前で登録する. 同じ名前のものがあれば置き換える
+
+    Args:
+        name(str): 名前. ',' は使えない
+        factory: `EventFactoryMixin` を継承したクラスか, それを指す 'module:attr' の文字列
+
+    Raises:
+        ValueError: 名前かfactoryが正しくない場合.
+    """
+    if not name or ',' in name:
+        raise ValueError('invalid factory name: {!r}'.format(name))
+    if not is_factory(factory) and not (isinstance(factory, str) and ':' in factory):
+        raise ValueError('not an event factory: {!r}'.format(factory))
+    with _lock:
+        _registry[name] = factory
+
+
+def unregister(name: str):
+    """登録を取り消す. 無ければ何もしない"""
+    with _lock:
+        _registry.pop(name, None)
+
+
+def names() -> list:
+    """選べる名前(entry pointで公開されたものを含む)"""
+    _discover()
+    with _lock:
+        return sorted(_registry)
+
+
+def load(name: str) -> type:
+    """名前のfactoryを返す. 初めてならモジュールを読み込む
+
+    Args:
+        name(str): 名前
+
+    Returns:
+        type: `EventFactoryMixin` を継承したクラス
+
+    Raises:
+        ValueError: 登録されていないか, 読み込んだものがfactoryでない場合.
+    """
+    with _lock:
+        factory = _registry.get(name)
+    if factory is None:
+        _discover()
+        with _lock:
+            factory = _registry.get(name)
+    if factory is None:
+        raise ValueError("unknown factory: '{}' (choose from {})".format(name, ', '.join(names())))
+    if is_factory(factory):
+        return factory
+    if isinstance(factory, str):
+        module, _, attr = factory.partition(':')
+        loaded = getattr(importlib.import_module(module), attr)
+    else:
+        loaded = factory.load()
+    if not is_factory(loaded):
+        raise ValueError("'{}' is not an event factory: {!r}".format(name, loaded))
+    with _lock:
+        _registry[name] = loaded
+    return loaded
+
+
+def _discover():
+    """entry pointを一度だけ探して登録する. 既に登録された名前は上書きしない"""
+    global _discovered
+    if _discovered:
+        return
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        found = []
+    else:
+        eps = entry_points()
+        found = eps.select(group=ENTRY_POINT_GROUP) if hasattr(eps, 'select') else eps.get(ENTRY_POINT_GROUP, [])
+    with _lock:
+        for ep in found:
+            _registry.setdefault(ep.name, ep)
+        _discovered = True
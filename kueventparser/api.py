@@ -12,10 +12,15 @@ Example:
     >>> api.get_all()
     []
 
+asyncioから使う場合は `aget_all` , `aget` , `agenerate_all` を利用する.
+
+    >>> events = await api.aget_all(year=2019, month=2)
+
 詳細は各関数のdocstringを参照.
 """
 
 from kueventparser.core import event_parser
+from kueventparser.core import invalidate as _invalidate
 
 
 def kueventparser(factory, method, **kwargs):
@@ -28,17 +33,43 @@ def get_all(factory='official', **kwargs):
     hookを呼び出す.
 
     Args:
-        factory: `Event` の取得用マネージャ 今のところ,京大公式HP用のみ.
-            EventFactoryMixin classを継承したクラスか 'official' に対応
+        factory: `Event` の取得用マネージャ. EventFactoryMixin classを継承したクラスか,
+            登録された名前('official' 等. `kueventparser.adapters.registry` を参照).
+            ',' で区切った名前かlistなら, 複数のfactoryのイベントをまとめる
+        timeout (float, optional): 複数のfactoryをまとめる時, 各factoryを待つ秒数.
+            待ちきれなかったfactoryは諦め, 残りのfactoryのイベントを返す.
         date (:obj:`datetime`, optional): 欲しいイベントのdatetime.
             `month` , `year` とどちらかを選択.両方指定した場合,こちらが優先される.
         year (int, optional): イベントを取得する年.
             両方指定した場合, `date` が優先される.
         month (int, optional): イベントを取得する月.
             両方指定した場合, `date` が優先される.
+        day (int, optional): イベントを取得する日. `year` , `month` と一緒に使う.
+        start_date (:obj:`datetime.date`, optional): 期間の開始日.
+            `end_date` と一緒に指定すると月をまたぐ期間を取得できる.
+        end_date (:obj:`datetime.date`, optional): 期間の終了日(この日を含む).
+        max_workers (int, optional): イベントページを並列に取得するスレッド数.
+            1(デフォルト)なら逐次実行.
+        parse_workers (int, optional): イベントページをパースするプロセス数(0ならコア数).
+            指定すると取得とパースを別々の段で並列に動かす.
+        ordered (bool, optional): Trueならカレンダー上の順序を保つ.
+        cache_dir (str, optional): 取得したページをキャッシュするディレクトリ.
+            `kueventparser.cache` を参照.
+        parser (str, optional): イベントページの解析方法. 'soup'(デフォルト), 'strainer', 'lxml', 'stream'.
+            'lxml' が最も速い. 'stream' は受信しながらパースし, 要るフィールドを読み終えたら受信をやめる.
+        max_bytes (int, optional): parserが 'stream' の時, 1ページから受け取る本文のbytes数の上限.
+        max_parse_time (float, optional): parserが 'stream' の時, 1ページの受信とパースにかける秒数の上限.
+        stats (:obj:`kueventparser.stats.Stats`, optional): 段階毎の時間とカウンタを記録する先.
+        max_rate (float, optional): ホスト毎の1秒あたりのリクエスト数の上限.
+            `kueventparser.ratelimit` を参照.
+        fields (optional): 取り出すフィールド名のiterable( `kueventparser.events.FIELDS` のいずれか).
+            指定しなかったフィールドは抽出せずNoneになる. title, url, 日付と時刻は常に取り出す.
+        lazy (bool, optional): Trueなら description を参照された時にページを取得し直して取り出す.
+        memo (optional): Trueか :obj:`kueventparser.memo.ResultCache` なら結果を保持し,
+            同じ期間の呼び出しには取得せずにその写しを返す. `invalidate` で捨てられる.
 
     Returns:
-        generator of Events
+        list of Events
     """
     return kueventparser(factory=factory, method='get_all', **kwargs)
 
@@ -49,9 +80,22 @@ def get(factory='official', **kwargs):
     hookを呼び出す.
 
     Args:
-        factory: `Event` の取得用マネージャ 今のところ,京大公式HP用のみ.
-            EventFactoryMixin classを継承したクラスか 'official' に対応
+        factory: `Event` の取得用マネージャ. EventFactoryMixin classを継承したクラスか,
+            登録された名前('official' 等. `kueventparser.adapters.registry` を参照).
+            ',' で区切った名前かlistなら, 複数のfactoryのイベントをまとめる
         url: url of event
+        cache_dir (str, optional): 取得したページをキャッシュするディレクトリ.
+        parser (str, optional): イベントページの解析方法. 'soup'(デフォルト), 'strainer', 'lxml', 'stream'.
+        max_bytes (int, optional): parserが 'stream' の時, 受け取る本文のbytes数の上限.
+        max_parse_time (float, optional): parserが 'stream' の時, 受信とパースにかける秒数の上限.
+        stats (:obj:`kueventparser.stats.Stats`, optional): 段階毎の時間とカウンタを記録する先.
+        max_rate (float, optional): ホスト毎の1秒あたりのリクエスト数の上限.
+            `kueventparser.ratelimit` を参照.
+        fields (optional): 取り出すフィールド名のiterable( `kueventparser.events.FIELDS` のいずれか).
+            指定しなかったフィールドは抽出せずNoneになる. title, url, 日付と時刻は常に取り出す.
+        lazy (bool, optional): Trueなら description を参照された時にページを取得し直して取り出す.
+        memo (optional): Trueか :obj:`kueventparser.memo.ResultCache` なら結果を保持し,
+            同じURLの呼び出しには取得せずにその写しを返す.
 
     Returns:
         :obj:`kueventparser.events.Event`: Event
@@ -59,22 +103,152 @@ def get(factory='official', **kwargs):
     return kueventparser(factory=factory, method='get', **kwargs)
 
 
+def get_many(urls, factory='official', **kwargs):
+    """複数のURLのイベントをまとめて取得する.
+
+    hookを呼び出す.
+    重複したURLは1回だけ取得し, 例外が起きても止めずにURL毎の結果として返す.
+
+    Args:
+        urls: イベントページのURLのiterable
+        factory: `get` と同じ
+        max_workers (int, optional): 並列に取得するスレッド数. 指定しなければ逐次実行.
+        **kwargs: cache_dir, parser, stats, fields 等は `get` と同じ
+
+    Returns:
+        list of :obj:`kueventparser.events.Outcome` : 重複を除いた `urls` の順.
+        `status` が 'ok' なら `event` , 'failed' なら `error` を持つ.
+    """
+    return kueventparser(factory=factory, method='get_many', urls=urls, **kwargs)
+
+
+def invalidate(factory=None, **kwargs):
+    """ `memo` で保持した結果を捨てる.
+
+    Args:
+        factory: このfactoryの結果だけを捨てる. 指定しなければ全てのfactory
+        memo (:obj:`kueventparser.memo.ResultCache`, optional): 捨てる先.
+            指定しなければ `memo=True` で使われるもの
+        url (str, optional): このURLの結果と, このURLのイベントを含む期間の結果を捨てる
+        **kwargs: 期間の指定( `get_all` と同じ). 重なる期間の結果を捨てる.
+            `url` も期間も指定しなければ全て捨てる
+
+    Returns:
+        int: 捨てた件数
+    """
+    return _invalidate(factory=factory, **kwargs)
+
+
 def generate_all(factory='official', **kwargs):
-    """Construct and return an list of Class `Event`.
+    """Construct and return a generator of Class `Event`.
 
     hookを呼び出す.
+    イベントはパースし終わったものから順に返され, 途中でやめれば残りは取得しない.
 
     Args:
-        factory: `Event` の取得用マネージャ 今のところ,京大公式HP用のみ.
-            EventFactoryMixin classを継承したクラスか 'official' に対応
+        factory: `Event` の取得用マネージャ. EventFactoryMixin classを継承したクラスか,
+            登録された名前('official' 等. `kueventparser.adapters.registry` を参照).
+            ',' で区切った名前かlistなら, 複数のfactoryのイベントをまとめる
+        timeout (float, optional): 複数のfactoryをまとめる時, 各factoryを待つ秒数.
+            待ちきれなかったfactoryは諦め, 残りのfactoryのイベントを返す.
         date (:obj:`datetime`, optional): 欲しいイベントのdatetime.
             `month` , `year` とどちらかを選択.両方指定した場合,こちらが優先される.
         year (int, optional): イベントを取得する年.
             両方指定した場合, `date` が優先される.
         month (int, optional): イベントを取得する月.
             両方指定した場合, `date` が優先される.
+        day (int, optional): イベントを取得する日. `year` , `month` と一緒に使う.
+        start_date (:obj:`datetime.date`, optional): 期間の開始日.
+            `end_date` と一緒に指定すると月をまたぐ期間を取得できる.
+        end_date (:obj:`datetime.date`, optional): 期間の終了日(この日を含む).
+        max_workers (int, optional): イベントページを並列に取得するスレッド数.
+            1(デフォルト)なら逐次実行.
+        parse_workers (int, optional): イベントページをパースするプロセス数(0ならコア数).
+            指定すると取得とパースを別々の段で並列に動かす.
+        ordered (bool, optional): Trueならカレンダー上の順序を保つ.
+        cache_dir (str, optional): 取得したページをキャッシュするディレクトリ.
+            `kueventparser.cache` を参照.
+        parser (str, optional): イベントページの解析方法. 'soup'(デフォルト), 'strainer', 'lxml', 'stream'.
+            'lxml' が最も速い. 'stream' は受信しながらパースし, 要るフィールドを読み終えたら受信をやめる.
+        max_bytes (int, optional): parserが 'stream' の時, 1ページから受け取る本文のbytes数の上限.
+        max_parse_time (float, optional): parserが 'stream' の時, 1ページの受信とパースにかける秒数の上限.
+        stats (:obj:`kueventparser.stats.Stats`, optional): 段階毎の時間とカウンタを記録する先.
+        max_rate (float, optional): ホスト毎の1秒あたりのリクエスト数の上限.
+            `kueventparser.ratelimit` を参照.
+        fields (optional): 取り出すフィールド名のiterable( `kueventparser.events.FIELDS` のいずれか).
+            指定しなかったフィールドは抽出せずNoneになる. title, url, 日付と時刻は常に取り出す.
+        lazy (bool, optional): Trueなら description を参照された時にページを取得し直して取り出す.
 
     Returns:
-        generator of Events
+        generator of Events (遅延評価)
     """
     return kueventparser(factory=factory, method='generate_all', **kwargs)
+
+
+def sync(factory='official', **kwargs):
+    """前回の同期からの差分(追加, 変更, 削除)を返す.
+
+    hookを呼び出す.
+    状態は `state` のSQLiteファイルに保存され, 次回の同期で使われる.
+
+    Args:
+        factory: `get_all` と同じ
+        state (str): 状態を保存するSQLiteファイルのパス
+            (または :obj:`kueventparser.sync.StateStore` )
+        recheck (float, optional): 前回の確認からこの秒数が経つまではページを確認しない.
+        **kwargs: 期間の指定等は `get_all` と同じ
+
+    Returns:
+        generator of :obj:`kueventparser.sync.Delta`
+    """
+    return kueventparser(factory=factory, method='sync', **kwargs)
+
+
+def aget_all(factory='official', **kwargs):
+    """ `get_all` のasyncio版.
+
+    Args:
+        factory: `get_all` と同じ
+        transport (:obj:`kueventparser.transports.AsyncHTTPTransport`, optional):
+            通信に使うtransport. 指定しなければ呼び出し毎に作る.
+        **kwargs: 期間の指定と max_workers, ordered, parser, stats, fields は `get_all` と同じ.
+            lazy, parse_workers, max_bytes, max_parse_time は使えない(ValueError)
+
+    Returns:
+        coroutine: list of Events を返すcoroutine
+    """
+    return kueventparser(factory=factory, method='aget_all', **kwargs)
+
+
+def aget(factory='official', **kwargs):
+    """ `get` のasyncio版.
+
+    Args:
+        factory: `get` と同じ
+        url: url of event
+        transport (:obj:`kueventparser.transports.AsyncHTTPTransport`, optional):
+            通信に使うtransport. 指定しなければ呼び出し毎に作る.
+        **kwargs: parser, stats, fields は `get` と同じ.
+            lazy, max_bytes, max_parse_time は使えない(ValueError)
+
+    Returns:
+        coroutine: :obj:`kueventparser.events.Event` を返すcoroutine
+    """
+    return kueventparser(factory=factory, method='aget', **kwargs)
+
+
+def agenerate_all(factory='official', **kwargs):
+    """ `generate_all` のasyncio版.
+
+    イベントページは並行して取得され, パースが終わった順にyieldされる.
+
+    Args:
+        factory: `generate_all` と同じ
+        transport (:obj:`kueventparser.transports.AsyncHTTPTransport`, optional):
+            通信に使うtransport. 指定しなければ呼び出し毎に作る.
+        **kwargs: `aget_all` と同じ
+
+    Returns:
+        async generator of Events
+    """
+    return kueventparser(factory=factory, method='agenerate_all', **kwargs)
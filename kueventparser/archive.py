@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""取得したページの記録と再生
+
+`RecordingTransport` は取得したページをURL, ヘッダ, 取得時刻と一緒に追記専用のアーカイブに書き込み,
+`ReplayTransport` はそのアーカイブからページを返す.
+抽出の処理を変えた時に, サイトを取得し直さずに過去のページをパースし直せる.
+
+アーカイブは1ファイルで, 先頭の `MAGIC` に続けて次のレコードを追記していく.
+途中で書き込みが止まった場合, 末尾の不完全なレコードは読み飛ばす.
+
+    >II    メタデータの長さ, 本文の長さ
+    メタデータ  url, status_code, headers, fetched_at のJSON(UTF-8)
+    本文    zlibで圧縮した本文
+
+読み込みはmmapで行い, 本文は要求された時に展開する.
+同じURLのレコードが複数あれば最後のものを使う.
+
+Example:
+
+    >>> from kueventparser.archive import RecordingTransport, ReplayTransport
+    >>> from kueventparser.transports import HTTPTransport
+    >>> with RecordingTransport(HTTPTransport(), 'pages.kuea') as transport:
+    ...     events = api.get_all(year=2019, month=2, transport=transport)
+    >>> events = api.get_all(year=2019, month=2, transport=ReplayTransport('pages.kuea'))
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Optional
+
+from kueventparser.transports import BaseTransport, Response
+
+# アーカイブの先頭
+MAGIC = b'KUEA\x00\x01'
+_HEADER = struct.Struct('>II')
+
+
+class ArchiveError(ValueError):
+    """アーカイブの形式が正しくないときの例外"""
+
+
+class ArchiveRecord:
+    """アーカイブの1件. 本文は `content` で初めて展開する
+
+    Attributes:
+        url(:obj:`str`): 要求したURL
+        status_code(:obj:`int`): ステータスコード
+        headers(:obj:`dict`): ヘッダ
+        fetched_at(:obj:`float`): 取得した時刻
+    """
+    __slots__ = ('url', 'status_code', 'headers', 'fetched_at', '_buffer', '_offset', '_size')
+
+    def __init__(self, url, status_code, headers, fetched_at, buffer, offset, size):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.fetched_at = fetched_at
+        self._buffer = buffer
+        self._offset = offset
+        self._size = size
+
+    def __repr__(self):
+        return '<ArchiveRecord [{}] {}>'.format(self.status_code, self.url)
+
+    @property
+    def content(self) -> bytes:
+        """展開した本文"""
+        return zlib.decompress(self._buffer[self._offset:self._offset + self._size])
+
+    def response(self) -> Response:
+        """ :obj:`kueventparser.transports.Response` にする"""
+        return Response(self.url, self.status_code, self.headers, self.content)
+
+
+class ArchiveWriter:
+    """アーカイブに追記する
+
+    スレッドセーフ. 1件毎にflushするので, 途中で止まってもそれまでのレコードは残る.
+    複数のプロセスから同じファイルに書き込んではいけない.
+    """
+
+    def __init__(self, path: str, level: int = 6):
+        """イニシャライザー
+
+        Args:
+            path(str): アーカイブのファイル. 無ければ作り, あれば追記する
+            level(int): zlibの圧縮レベル
+
+        Raises:
+            ArchiveError: 既存のファイルがアーカイブでない場合.
+        """
+        self.path = path
+        self.level = level
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+            self._file.flush()
+        else:
+            with open(path, 'rb') as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    self._file.close()
+                    raise ArchiveError('not an archive: {}'.format(path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, url: str, response: Response, fetched_at: float = None):
+        """レスポンスを1件追記する
+
+        Args:
+            url(str): 要求したURL(リダイレクト前)
+            response(Response): レスポンス
+            fetched_at(float): 取得した時刻. Noneなら現在時刻
+        """
+        meta = json.dumps({'url': url, 'status_code': response.status_code, 'headers': response.headers,
+                           'fetched_at': time.time() if fetched_at is None else fetched_at},
+                          ensure_ascii=False).encode('utf-8')
+        body = zlib.compress(response.content, self.level)
+        record = _HEADER.pack(len(meta), len(body)) + meta + body
+        with self._lock:
+            self._file.write(record)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Archive:
+    """mmapで読み込んだアーカイブ
+
+    開いた時点までに書き込まれたレコードを読む.
+    """
+
+    def __init__(self, path: str):
+        """イニシャライザー
+
+        Args:
+            path(str): アーカイブのファイル
+
+        Raises:
+            ArchiveError: アーカイブでない場合.
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ArchiveError('not an archive: {}'.format(path))
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._records = list(self._scan())
+        # URL -> 最後のレコード
+        self._latest = {record.url: record for record in self._records}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        """書き込まれた順に全てのレコードを返す"""
+        return iter(self._records)
+
+    def __contains__(self, url):
+        return url in self._latest
+
+    def get(self, url: str) -> Optional[ArchiveRecord]:
+        """URLの最後のレコードを返す. 無ければNone"""
+        return self._latest.get(url)
+
+    def urls(self):
+        """記録されているURL(重複を除いて, 最初に記録された順)"""
+        return list(self._latest)
+
+    def close(self):
+        self._records = []
+        self._latest = {}
+        self._buffer.close()
+
+    def _scan(self):
+        buffer = self._buffer
+        size = len(buffer)
+        position = len(MAGIC)
+        while position + _HEADER.size <= size:
+            meta_size, body_size = _HEADER.unpack_from(buffer, position)
+            body = position + _HEADER.size + meta_size
+            if body + body_size > size:
+                # 書き込み途中で止まったレコード
+                break
+            meta = json.loads(buffer[position + _HEADER.size:body].decode('utf-8'))
+            yield ArchiveRecord(meta['url'], meta['status_code'], meta['headers'], meta['fetched_at'],
+                                buffer, body, body_size)
+            position = body + body_size
+
+
+class RecordingTransport(BaseTransport):
+    """取得したページをアーカイブに記録するtransport
+
+    304(本文の無いレスポンス)以外を全て記録する.
+
+    Attributes:
+        transport(:obj:`BaseTransport`): 実際に通信するtransport
+        writer(:obj:`ArchiveWriter`): 書き込み先
+    """
+
+    def __init__(self, transport: BaseTransport, archive):
+        """イニシャライザー
+
+        Args:
+            transport(BaseTransport): 実際に通信するtransport
+            archive: :obj:`ArchiveWriter` またはアーカイブのファイルのパス
+        """
+        self.transport = transport
+        self.writer = archive if isinstance(archive, ArchiveWriter) else ArchiveWriter(archive)
+
+    def get(self, url: str, headers: Optional[dict] = None) -> Response:
+        r = self.transport.get(url, headers=headers)
+        if r.status_code != 304:
+            self.writer.write(url, r)
+        return r
+
+    def close(self):
+        self.writer.close()
+        self.transport.close()
+
+
+class ReplayTransport(BaseTransport):
+    """アーカイブに記録されたページを返すtransport. 通信はしない
+
+    記録されていないURLは404を返す.
+
+    Attributes:
+        archive(:obj:`Archive`): 読み込んだアーカイブ
+    """
+
+    def __init__(self, archive):
+        """イニシャライザー
+
+        Args:
+            archive: :obj:`Archive` またはアーカイブのファイルのパス
+        """
+        self.archive = archive if isinstance(archive, Archive) else Archive(archive)
+
+    def get(self, url: str, headers: Optional[dict] = None) -> Response:
+        record = self.archive.get(url)
+        if record is None:
+            return Response(url, 404, {}, b'')
+        return record.response()
+
+    def close(self):
+        self.archive.close()
+
+
+_replays = {}
+_replays_lock = threading.Lock()
+
+
+def get_replay_transport(path: str) -> ReplayTransport:
+    """ファイル毎に(プロセス内で)共有される `ReplayTransport` を返す
+
+    プロセスプールの各ワーカーがアーカイブを一度だけ開くために使う.
+
+    Args:
+        path(str): アーカイブのファイル
+
+    Returns:
+        :obj:`ReplayTransport`: transport
+    """
+    key = (os.getpid(), os.path.abspath(path))
+    with _replays_lock:
+        if key not in _replays:
+            _replays[key] = ReplayTransport(path)
+        return _replays[key]
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""ディスク上のHTTPキャッシュ
+
+取得したページをETag/Last-Modifiedと一緒に保存し, 期限が切れたら条件付きGETで再検証する.
+本文はファイルに, メタデータはSQLiteに保存する.
+合計サイズが上限を超えたら最後に使われた時刻が古いものから消す(LRU).
+
+Example:
+
+    >>> from kueventparser.cache import CachingTransport, get_cache
+    >>> from kueventparser.transports import HTTPTransport
+    >>> transport = CachingTransport(HTTPTransport(), get_cache('~/.cache/kueventparser'))
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from kueventparser.transports import BaseTransport, Response
+
+# URLの種類毎の有効期限(秒). 上から順に最初にマッチしたものを使う
+DEFAULT_TTL_RULES = (
+    (r'/calendar/', 60 * 60),
+)
+# どのルールにもマッチしない(イベントページ等)の有効期限(秒)
+DEFAULT_TTL = 7 * 24 * 60 * 60
+# 中身の無かったURL(negative cache)の有効期限(秒)
+DEFAULT_NEGATIVE_TTL = 24 * 60 * 60
+# キャッシュの合計サイズの上限(bytes)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    url TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    headers TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+CREATE TABLE IF NOT EXISTS negatives (
+    url TEXT PRIMARY KEY,
+    created_at REAL NOT NULL
+);
+"""
+# 保存しないヘッダ(本文は展開して保存するため)
+_DROP_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection')
+
+
+class HTTPCache:
+    """ディスク上のHTTPキャッシュ
+
+    スレッドセーフ. 同じディレクトリを使うなら `get_cache` で共有するとよい.
+
+    Attributes:
+        hits(:obj:`int`): キャッシュから返した回数(304での再検証を含む)
+        misses(:obj:`int`): 本文を取得し直した回数
+        revalidated(:obj:`int`): 304で再検証できた回数
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES, ttl_rules=DEFAULT_TTL_RULES,
+                 default_ttl: float = DEFAULT_TTL, negative_ttl: float = DEFAULT_NEGATIVE_TTL):
+        """イニシャライザー
+
+        Args:
+            cache_dir(str): キャッシュを置くディレクトリ. 無ければ作る
+            max_bytes(int): 本文の合計サイズの上限
+            ttl_rules: (URLの正規表現, 有効期限秒) のiterable
+            default_ttl(float): どのルールにもマッチしないURLの有効期限
+            negative_ttl(float): negative cacheの有効期限
+        """
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_bytes = max_bytes
+        self.ttl_rules = [(re.compile(pattern), ttl) for pattern, ttl in ttl_rules]
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(self.cache_dir, 'index.sqlite3'), check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def ttl(self, url: str) -> float:
+        """URLの有効期限(秒)を返す"""
+        for pattern, ttl in self.ttl_rules:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def lookup(self, url: str):
+        """キャッシュを探す
+
+        Args:
+            url(str): URL
+
+        Returns:
+            tuple: ( :obj:`Response` , 期限内かどうか). 無ければNone
+        """
+        with self._lock:
+            row = self._db.execute('SELECT filename, headers, fetched_at FROM entries WHERE url = ?',
+                                   (url,)).fetchone()
+            if row is None:
+                return None
+            filename, headers, fetched_at = row
+            try:
+                with open(os.path.join(self.cache_dir, filename), 'rb') as f:
+                    content = f.read()
+            except OSError:
+                self._delete(url, filename)
+                return None
+            self._db.execute('UPDATE entries SET accessed_at = ? WHERE url = ?', (time.time(), url))
+            self._db.commit()
+        fresh = time.time() - fetched_at < self.ttl(url)
+        return Response(url, 200, json.loads(headers), content, from_cache=True), fresh
+
+    def store(self, url: str, response: Response):
+        """レスポンスを保存する
+
+        Args:
+            url(str): URL
+            response(Response): 保存するレスポンス(200のもの)
+        """
+        filename = _filename(url)
+        path = os.path.join(self.cache_dir, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        headers = {k: v for k, v in response.headers.items() if k not in _DROP_HEADERS}
+        with self._lock:
+            # 書き込み途中のファイルを読まれないように置き換える
+            tmp = '{}.{}.tmp'.format(path, threading.get_ident())
+            with open(tmp, 'wb') as f:
+                f.write(response.content)
+            os.replace(tmp, path)
+            now = time.time()
+            self._db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                             (url, filename, json.dumps(headers), len(response.content), now, now))
+            self._db.commit()
+            self._evict()
+
+    def refresh(self, url: str, headers: Optional[dict] = None):
+        """304で再検証できたエントリの取得時刻を更新する
+
+        Args:
+            url(str): URL
+            headers(dict): 304レスポンスのヘッダ. ETag等が変わっていれば反映する
+        """
+        with self._lock:
+            row = self._db.execute('SELECT headers FROM entries WHERE url = ?', (url,)).fetchone()
+            if row is None:
+                return
+            stored = json.loads(row[0])
+            for key in ('etag', 'last-modified'):
+                if headers and key in headers:
+                    stored[key] = headers[key]
+            self._db.execute('UPDATE entries SET headers = ?, fetched_at = ? WHERE url = ?',
+                             (json.dumps(stored), time.time(), url))
+            self._db.commit()
+
+    def is_negative(self, url: str) -> bool:
+        """イベント情報が無かったURLとして記録されているか
+
+        Args:
+            url(str): URL
+
+        Returns:
+            bool: 期限内の記録があればTrue
+        """
+        with self._lock:
+            row = self._db.execute('SELECT created_at FROM negatives WHERE url = ?', (url,)).fetchone()
+        return row is not None and time.time() - row[0] < self.negative_ttl
+
+    def mark_negative(self, url: str):
+        """イベント情報が無かったURLとして記録する
+
+        Args:
+            url(str): URL
+        """
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO negatives VALUES (?, ?)', (url, time.time()))
+            self._db.commit()
+
+    def size(self) -> int:
+        """保存している本文の合計サイズ(bytes)"""
+        with self._lock:
+            return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def clear(self):
+        """全て消す"""
+        with self._lock:
+            for url, filename in self._db.execute('SELECT url, filename FROM entries').fetchall():
+                self._delete(url, filename)
+            self._db.execute('DELETE FROM negatives')
+            self._db.commit()
+
+    def record(self, hit: bool, revalidated: bool = False):
+        """ヒット/ミスを数える
+
+        Args:
+            hit(bool): キャッシュから返したかどうか
+            revalidated(bool): 304で再検証したかどうか
+        """
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            if revalidated:
+                self.revalidated += 1
+
+    @property
+    def hit_rate(self) -> float:
+        """ヒット率. まだ一度も使われていなければ0"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        """統計情報
+
+        Returns:
+            dict: hits, misses, revalidated, hit_rate, size
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'revalidated': self.revalidated,
+                'hit_rate': self.hit_rate, 'size': self.size()}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _evict(self):
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute('SELECT url, filename, size FROM entries ORDER BY accessed_at').fetchall()
+        for url, filename, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._delete(url, filename)
+            total -= size
+        self._db.commit()
+
+    def _delete(self, url, filename):
+        self._db.execute('DELETE FROM entries WHERE url = ?', (url,))
+        try:
+            os.remove(os.path.join(self.cache_dir, filename))
+        except OSError:
+            pass
+
+
+def _filename(url: str) -> str:
+    digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return os.path.join(digest[:2], digest)
+
+
+class CachingTransport(BaseTransport):
+    """`HTTPCache` を挟むtransport
+
+    期限内のキャッシュはそのまま返し, 期限切れのものは
+    If-None-Match / If-Modified-Since を付けて再検証する.
+
+    Attributes:
+        transport(:obj:`BaseTransport`): 実際に通信するtransport
+        cache(:obj:`HTTPCache`): キャッシュ
+    """
+
+    def __init__(self, transport: BaseTransport, cache: HTTPCache):
+        self.transport = transport
+        self.cache = cache
+
+    def get(self, url: str, headers: Optional[dict] = None) -> Response:
+        cached = self.cache.lookup(url)
+        if cached is not None and cached[1]:
+            self.cache.record(hit=True)
+            return cached[0]
+        _headers = dict(headers or {})
+        if cached is not None:
+            if 'etag' in cached[0].headers:
+                _headers['If-None-Match'] = cached[0].headers['etag']
+            if 'last-modified' in cached[0].headers:
+                _headers['If-Modified-Since'] = cached[0].headers['last-modified']
+        r = self.transport.get(url, headers=_headers)
+        if r.status_code == 304 and cached is not None:
+            self.cache.refresh(url, r.headers)
+            self.cache.record(hit=True, revalidated=True)
+            return cached[0]
+        self.cache.record(hit=False)
+        if r.status_code == 200:
+            self.cache.store(url, r)
+        return r
+
+    def close(self):
+        self.transport.close()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(cache_dir: str, **kwargs) -> HTTPCache:
+    """ディレクトリ毎に共有される `HTTPCache` を返す
+
+    Args:
+        cache_dir(str): キャッシュを置くディレクトリ
+        **kwargs: 初めて作る時に `HTTPCache` に渡す引数
+
+    Returns:
+        :obj:`HTTPCache`: キャッシュ
+    """
+    key = os.path.abspath(os.path.expanduser(cache_dir))
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = HTTPCache(key, **kwargs)
+        return _caches[key]
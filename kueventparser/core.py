@@ -5,11 +5,39 @@
 
 京大の行事カレンダーから指定日のイベントを作成する.
 """
+import argparse
 import datetime
+import sys
 
-from kueventparser.adapters.base import EventFactoryMixin
-from kueventparser.adapters.official import OfficialEventFactory
+from kueventparser.adapters import registry
+from kueventparser.adapters.aggregate import AggregateEventFactory
+from kueventparser.adapters.base import PARSERS, EventFactoryMixin
+from kueventparser.archive import RecordingTransport, get_replay_transport
+from kueventparser.cache import CachingTransport, get_cache
+from kueventparser.events import FAILED, FIELDS
+from kueventparser.ratelimit import RateLimitedTransport, RateLimiter
+from kueventparser.stats import Stats
+from kueventparser.transports import get_default_transport
 from kueventparser.utils import date_to_month
+from kueventparser.writers import WRITERS, get_writer
+
+# URLを1つ取る取得方法
+_GET_METHODS = ('get', 'aget')
+# asyncio版の取得方法
+_ASYNC_METHODS = ('aget', 'aget_all', 'agenerate_all')
+# `get_all` , `generate_all` にそのまま渡すオプション
+_OPTIONS = ('max_workers', 'ordered', 'transport', 'parser', 'stats', 'parse_workers', 'fields', 'lazy',
+            'max_bytes', 'max_parse_time')
+# `get` にそのまま渡すオプション
+_GET_OPTIONS = ('transport', 'parser', 'stats', 'fields', 'lazy', 'max_bytes', 'max_parse_time')
+# `get_many` にそのまま渡すオプション
+_MANY_OPTIONS = ('max_workers', 'transport', 'parser', 'stats', 'fields', 'lazy', 'max_bytes', 'max_parse_time')
+# `sync` にそのまま渡すオプション
+_SYNC_OPTIONS = ('state', 'max_workers', 'recheck', 'transport', 'parser', 'stats')
+# `aget_all` , `agenerate_all` にそのまま渡すオプション
+_ASYNC_OPTIONS = ('max_workers', 'ordered', 'transport', 'parser', 'stats', 'fields')
+# `aget` にそのまま渡すオプション
+_AGET_OPTIONS = ('transport', 'parser', 'stats', 'fields')
 
 
 def prepare(factory, method, **kwargs):
@@ -22,14 +50,53 @@ def prepare(factory, method, **kwargs):
 
     Returns:
 
+    Raises:
+        ValueError: asyncio版の取得方法に replay, record, cache_dir, max_rate を指定した場合.
     """
-    _factory = select_factory(factory)
-    if method is 'get_all':
-        _kwargs: dict = select_date(**kwargs)
-    elif method is 'get':
+    _factory = select_factory(factory, timeout=kwargs.get('timeout'))
+    if method in _GET_METHODS:
         _kwargs: dict = {'url': kwargs.get('url')}
+    elif method == 'get_many':
+        _kwargs: dict = {'urls': kwargs.get('urls')}
     else:
         _kwargs: dict = select_date(**kwargs)
+    _kwargs.update(select_options(method, **kwargs))
+    if method in _ASYNC_METHODS:
+        # transportを包むオプションは同期版のtransportにしか使えない
+        unsupported = [key for key in ('replay', 'record', 'cache_dir', 'max_rate') if kwargs.get(key) is not None]
+        if unsupported:
+            raise ValueError("{} not supported by '{}'".format(', '.join(repr(key) for key in unsupported), method))
+        return _factory, method, _kwargs
+    if kwargs.get('replay') is not None:
+        if method == 'generate_all' and hasattr(_factory, 'generate_replayed'):
+            # イベントページはプロセスプールでパースする
+            method = 'generate_replayed'
+            _kwargs.pop('transport', None)
+            parse_workers = _kwargs.pop('parse_workers', None)
+            if parse_workers is not None:
+                _kwargs['max_workers'] = parse_workers or None
+            _kwargs['archive'] = kwargs['replay']
+        else:
+            _kwargs['transport'] = get_replay_transport(kwargs['replay'])
+        return _factory, method, _kwargs
+    if kwargs.get('max_rate') is not None:
+        transport = _kwargs.get('transport') or get_default_transport()
+        if isinstance(transport, RateLimitedTransport):
+            transport = transport.transport
+        _kwargs['transport'] = RateLimitedTransport(transport, RateLimiter(max_rate=kwargs['max_rate']),
+                                                    stats=kwargs.get('stats'))
+    elif kwargs.get('stats') is not None:
+        transport = _kwargs.get('transport') or get_default_transport()
+        if isinstance(transport, RateLimitedTransport):
+            # 流量は共有したまま, 今回の計測に記録する
+            _kwargs['transport'] = RateLimitedTransport.observed(transport, kwargs['stats'])
+    # キャッシュから返したページは記録しないよう, 記録はキャッシュの内側で行う
+    if kwargs.get('record') is not None:
+        transport = _kwargs.get('transport') or get_default_transport()
+        _kwargs['transport'] = RecordingTransport(transport, kwargs['record'])
+    if kwargs.get('cache_dir') is not None:
+        transport = _kwargs.get('transport') or get_default_transport()
+        _kwargs['transport'] = CachingTransport(transport, get_cache(kwargs['cache_dir']))
 
     return _factory, method, _kwargs
 
@@ -41,72 +108,242 @@ def event_parser(factory, method: str, **kwargs):
 
     Args:
         factory: :obj:`kueventparser.events.EventManager` or :obj:`str`
-        method (str): 取得の仕方. 'get' or 'get_all'
+        method (str): 取得の仕方. 'get' or 'get_all' (asyncio版は 'aget' , 'aget_all' 等)
         kwargs (dict): kwargs for method selected by args
             date or (year and month) ... get_all method
             url ... get
+            cache_dir ... ページをキャッシュするディレクトリ(同期版のみ)
+            parser ... イベントページの解析方法('soup', 'strainer', 'lxml', 'stream')
+            max_bytes, max_parse_time ... parserが 'stream' の時の, 1ページの本文のbytes数と秒数の上限(同期版のみ)
+            record ... 取得したページを記録するアーカイブ(同期版のみ)
+            replay ... 記録したアーカイブからページを読む. 通信はしない(同期版のみ).
+                'generate_all' ならイベントページをプロセスプールでパースする
+            stats ... 計測を記録する :obj:`kueventparser.stats.Stats`
+            max_rate ... ホスト毎の1秒あたりのリクエスト数の上限(同期版のみ).
+                `kueventparser.ratelimit` を参照
+            fields ... 取り出すフィールド名のiterable( `kueventparser.events.FIELDS` のいずれか)
+            lazy ... Trueなら description を参照された時に取り出す(同期版のみ)
+            timeout ... 複数のfactoryをまとめる時, 各factoryを待つ秒数.
+                `kueventparser.adapters.aggregate` を参照
+            memo ... Trueか :obj:`kueventparser.memo.ResultCache` なら 'get_all' , 'get' の結果を保持し,
+                同じ期間(URL)の呼び出しには取得せずにその写しを返す. Trueならプロセス内で共有するものを使う
 
     Returns:
         method selected by args
     """
     _factory, _method, _kwargs = prepare(factory, method, **kwargs)
+    memo = kwargs.get('memo')
+    # 空の `ResultCache` は偽になるので, None, False と比べる
+    if memo is not None and memo is not False and kwargs.get('record') is None:
+        from kueventparser.memo import get_memo, key
+        _key = key(_factory, _method, _kwargs, replay=kwargs.get('replay'))
+        if _key is not None:
+            memo = get_memo() if memo is True else memo
+            return memo.fetch(_key, lambda: getattr(_factory, _method)(**_kwargs), stats=kwargs.get('stats'))
     return getattr(_factory, _method)(**_kwargs)
 
 
-def select_factory(factory):
+def invalidate(factory=None, memo=None, url: str = None, **kwargs) -> int:
+    """保持している結果を捨てる( `event_parser` の `memo` を参照)
+
+    Args:
+        factory: このfactory(名前かクラス)の結果だけを捨てる. Noneなら全てのfactory
+        memo: :obj:`kueventparser.memo.ResultCache` . Noneならプロセス内で共有するもの
+        url(str): このURLの `get` の結果と, このURLのイベントを含む `get_all` の結果を捨てる
+        **kwargs: 期間( `select_date` と同じ). 重なる `get_all` の結果を捨てる
+
+    Returns:
+        int: 捨てた件数. `url` も期間も指定しなければ(そのfactoryの)全てを捨てる
+    """
+    from kueventparser.memo import get_memo
+
+    memo = memo if memo is not None else get_memo()
+    _factory = select_factory(factory) if factory is not None else None
+    dates = {}
+    if any(kwargs.get(name) is not None for name in ('start_date', 'end_date', 'date', 'year', 'month')):
+        dates = select_date(**kwargs)
+    return memo.invalidate(_factory, url=url, **dates)
+
+
+def select_factory(factory, timeout: float = None):
     """Choose EventFactory class
 
-    param: factory: str or Class of EventFactory
+    名前は `kueventparser.adapters.registry` から探す(モジュールは選ばれた時に読み込む).
+    ',' で区切った名前か, 名前(クラス)のlist, tupleなら :obj:`AggregateEventFactory` でまとめる.
+
+    param: factory: str, Class of EventFactory or list of them
+    param: timeout: まとめる時, 各factoryを待つ秒数. Noneなら終わるまで待つ. 1つのfactoryなら使わない
     return: Class of EventFactory
+
+    Raises:
+        ValueError: 名前が登録されていないか, factoryでない場合.
     """
-    if type(factory) is str:
-        if factory == 'official':
-            return OfficialEventFactory
-    elif isinstance(factory, EventFactoryMixin):
+    if isinstance(factory, str):
+        names = [name.strip() for name in factory.split(',') if name.strip()]
+        if len(names) > 1:
+            return AggregateEventFactory.of(*names, timeout=timeout)
+        return registry.load(factory.strip())
+    if isinstance(factory, (list, tuple)):
+        return AggregateEventFactory.of(*factory, timeout=timeout)
+    if registry.is_factory(factory) or isinstance(factory, EventFactoryMixin):
         return factory
-    else:
-        raise ValueError
+    raise ValueError('not an event factory: {!r}'.format(factory))
 
 
 def select_date(**kwargs):
     """select date from kwargs
 
+    `start_date` と `end_date` が両方指定されればその期間(月をまたいでもよい),
+    `day` も指定されればその日, それ以外は月全体を返す.
+
     Args:
+        start_date (:obj:`datetime.date`, optional): 期間の開始日.
+        end_date (:obj:`datetime.date`, optional): 期間の終了日(この日を含む).
         date (:obj:`datetime`, optional): 欲しいイベントのdatetime.
             `month` , `year` とどちらかを選択.両方指定した場合,こちらが優先される.
         year (int, optional): イベントを取得する年.
             両方指定した場合, `date` が優先される.
         month (int, optional): イベントを取得する月.
             両方指定した場合, `date` が優先される
+        day (int, optional): イベントを取得する日. `year` , `month` と一緒に使う.
 
     Returns:
-        dict:  (HTML取得に失敗した時はStopIteration例外)
+        dict: start_date, end_date
+
+    Raises:
+        ValueError: `start_date` が `end_date` より後の場合.
     """
+    start = kwargs.get('start_date', None)
+    end = kwargs.get('end_date', None)
+    if start is not None and end is not None:
+        if start > end:
+            raise ValueError('start_date must not be after end_date')
+        return {'start_date': start, 'end_date': end}
     year = kwargs.get('year', None)
     month = kwargs.get('month', None)
-    if year is not None and month is not None:
-        kwargs.setdefault("start_date", datetime.date(year, month, 1))
-    else:
-        kwargs.setdefault("start_date", datetime.date.today())
-    start, end = date_to_month(kwargs.get('start_date'))
+    day = kwargs.get('day', None)
+    if start is None:
+        start = end
+    if kwargs.get('date') is not None:
+        start = kwargs.get('date')
+    elif year is not None and month is not None:
+        if day is not None:
+            date = datetime.date(year, month, day)
+            return {'start_date': date, 'end_date': date}
+        start = datetime.date(year, month, 1)
+    elif start is None:
+        start = datetime.date.today()
+    start, end = date_to_month(start)
     _kwargs = {'start_date': start, 'end_date': end}
     return _kwargs
 
 
+def select_options(method: str, **kwargs):
+    """select options for method from kwargs
+
+    Noneのものは渡さない(各factoryのデフォルト値を使う).
+
+    Args:
+        method (str): 取得の仕方
+        max_workers (int, optional): 並列に取得するスレッド数
+        parse_workers (int, optional): イベントページをパースするプロセス数(0ならコア数)
+        ordered (bool, optional): カレンダー上の順序を保つかどうか
+        transport (optional): 通信に使うtransport
+        parser (str, optional): イベントページの解析方法. 'soup', 'strainer', 'lxml', 'stream' のいずれか
+        max_bytes (int, optional): 1ページから受け取る本文のbytes数の上限( `parser` が 'stream' の時)
+        max_parse_time (float, optional): 1ページの受信とパースにかける秒数の上限( `parser` が 'stream' の時)
+        stats (optional): 計測を記録する :obj:`kueventparser.stats.Stats`
+        fields (optional): 取り出すフィールド名のiterable
+        lazy (bool, optional): Trueなら description を参照された時に取り出す
+        state (optional): `sync` の状態を保存するファイル
+        recheck (float, optional): `sync` でページを確認し直すまでの秒数
+
+    Returns:
+        dict: options
+
+    Raises:
+        ValueError: asyncio版の取得方法に, 同期版にしか無いオプション(lazy, parse_workers,
+            max_bytes, max_parse_time)を指定した場合.
+    """
+    if method in _ASYNC_METHODS:
+        keys = _AGET_OPTIONS if method in _GET_METHODS else _ASYNC_OPTIONS
+        # Falseは指定しなかったのと同じ
+        unsupported = [key for key in _OPTIONS
+                       if key not in keys and kwargs.get(key) is not None and kwargs.get(key) is not False]
+        if unsupported:
+            raise ValueError("{} not supported by '{}'".format(', '.join(repr(key) for key in unsupported), method))
+    elif method in _GET_METHODS:
+        keys = _GET_OPTIONS
+    elif method == 'get_many':
+        keys = _MANY_OPTIONS
+    elif method == 'sync':
+        keys = _SYNC_OPTIONS
+    else:
+        keys = _OPTIONS
+    return {key: kwargs[key] for key in keys if kwargs.get(key) is not None}
+
+
+def _read_urls(f) -> list:
+    """1行に1つのURLを読む. 空行と '#' で始まる行は飛ばす"""
+    return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+def _parse_fields(text: str) -> tuple:
+    """'title,url,start_date' をフィールド名のtupleにする(argparse用)"""
+    fields = tuple(field.strip() for field in text.split(',') if field.strip())
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown or not fields:
+        raise argparse.ArgumentTypeError("invalid fields: '{}' (choose from {})".format(text, ','.join(FIELDS)))
+    return fields
+
+
+def _parse_date(text: str) -> datetime.date:
+    """'YYYY-MM-DD' を `datetime.date` にする(argparse用)"""
+    try:
+        return datetime.datetime.strptime(text, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid date: '{}' (use YYYY-MM-DD)".format(text))
+
+
 def main():
     """スクリプトとして実行したとき,実際に実行される関数
 
     `argparse` を用いた.
     """
-    import argparse
-
     # templates
     parent_parser = argparse.ArgumentParser(add_help=False)
     parent_parser.add_argument('factory', default='official', nargs='?',
                                const="official", type=str, choices=None,
                                action='store',
-                               help="Manager for parsing Events from any homepages 'official' etc",
+                               help="Manager for parsing Events from any homepages 'official' etc; "
+                                    "comma separated names to merge several ones",
                                metavar=None)
+    # options for sub commands
+    common_parser = argparse.ArgumentParser(add_help=False)
+    common_parser.add_argument('--cache-dir', type=str, action='store', dest="cache_dir",
+                               help="directory to cache fetched pages", metavar='dir')
+    common_parser.add_argument('--parser', type=str, action='store', dest="parser", choices=PARSERS,
+                               help="backend to parse event pages (default: soup); "
+                                    "'stream' parses while receiving and stops once the fields are read")
+    common_parser.add_argument('--max-bytes', type=int, action='store', dest="max_bytes",
+                               help="stop reading an event page after this many bytes (with --parser stream)",
+                               metavar='bytes')
+    common_parser.add_argument('--max-parse-time', type=float, action='store', dest="max_parse_time",
+                               help="stop reading an event page after this many seconds (with --parser stream)",
+                               metavar='seconds')
+    common_parser.add_argument('--timeout', type=float, action='store', dest="timeout",
+                               help="seconds to wait for each factory when merging several ones "
+                                    "(default: wait until they finish)", metavar='seconds')
+    common_parser.add_argument('--record', type=str, action='store', dest="record",
+                               help="append fetched pages to an archive", metavar='archive')
+    common_parser.add_argument('--replay', type=str, action='store', dest="replay",
+                               help="read pages from an archive instead of the network", metavar='archive')
+    common_parser.add_argument('--stats', action='store_true', dest="stats",
+                               help="print timings of each stage and counters to stderr")
+    common_parser.add_argument('--max-rate', type=float, action='store', dest="max_rate",
+                               help="limit requests per second to each host (default: no limit); "
+                                    "the actual rate adapts to the server",
+                               metavar='rps')
     # main parser
     parser = argparse.ArgumentParser(
         description='event parser of kyoto Univ.',
@@ -117,30 +354,117 @@ def main():
     # `get` or `get_all`
     subparsers = parser.add_subparsers(dest="method", help='sub-commands. for detail, see "subcommand -h".',
                                        title='commands')
+    # options for output
+    output_parser = argparse.ArgumentParser(add_help=False)
+    output_parser.add_argument('--format', '-f', type=str, action='store', dest="format", default='text',
+                               choices=list(WRITERS), help="output format (default: text)")
+    output_parser.add_argument('--fields', type=_parse_fields, action='store', dest="fields",
+                               help="comma separated fields to extract and output "
+                                    "(default: all of {})".format(','.join(FIELDS)), metavar='fields')
     # GET
-    get_parser = subparsers.add_parser("get")
+    get_parser = subparsers.add_parser("get", parents=[common_parser, output_parser])
     get_parser.set_defaults(method="get")
-    get_parser.add_argument('--url', '-u', type=str, action='store', required=True,
-                            help="url for event", metavar='url')
+    get_urls = get_parser.add_mutually_exclusive_group(required=True)
+    get_urls.add_argument('--url', '-u', type=str, action='store',
+                          help="url for event", metavar='url')
+    get_urls.add_argument('--urls-file', type=argparse.FileType('r', encoding='utf-8'), action='store',
+                          dest="urls_file", help="file of urls for events, one per line ('-' for stdin)",
+                          metavar='file')
+    get_parser.add_argument('--jobs', '-j', type=int, action='store', dest="max_workers",
+                            help="number of workers to fetch event pages with --urls-file (default: 1)")
+    # options for date range
+    range_parser = argparse.ArgumentParser(add_help=False)
+    range_parser.add_argument('--year', '-y', type=int, action='store', dest="year",
+                              help="year for get_events")
+    range_parser.add_argument('--month', '-m', type=int, action='store', dest="month",
+                              help="month for get_events")
+    range_parser.add_argument('--day', '-d', type=int, action='store', dest="day",
+                              help="day for get_events")
+    range_parser.add_argument('--from', type=_parse_date, action='store', dest="start_date",
+                              help="first day for get_events (YYYY-MM-DD)", metavar='date')
+    range_parser.add_argument('--to', type=_parse_date, action='store', dest="end_date",
+                              help="last day for get_events (YYYY-MM-DD)", metavar='date')
+    range_parser.add_argument('--jobs', '-j', type=int, action='store', dest="max_workers",
+                              help="number of workers to fetch event pages (default: 1), "
+                                   "or processes to parse them with --replay (default: number of CPUs)")
+    range_parser.add_argument('--parse-jobs', '-P', type=int, action='store', dest="parse_workers",
+                              help="parse event pages in this many processes while --jobs threads fetch "
+                                   "(0 for the number of CPUs)")
     # GET_ALL
-    get_all_parser = subparsers.add_parser("get_all")
+    get_all_parser = subparsers.add_parser("get_all", parents=[common_parser, range_parser, output_parser])
     get_all_parser.set_defaults(method="get_all")
-    get_all_parser.add_argument('--year', '-y', type=int, action='store', dest="year",
-                                help="year for get_events")
-    get_all_parser.add_argument('--month', '-m', type=int, action='store', dest="month",
-                                help="month for get_events")
-    # get_all_parser.add_argument('--day', '-d', type=int, action='store', dest="day",
-    #                             help="day for get_events")
+    get_all_parser.add_argument('--ordered', action='store_true', dest="ordered",
+                                help="keep order of events in calendar")
+    # SYNC
+    sync_parser = subparsers.add_parser("sync", parents=[common_parser, range_parser])
+    sync_parser.set_defaults(method="sync")
+    sync_parser.add_argument('--state', '-s', type=str, action='store', required=True,
+                             help="sqlite file to keep state between syncs", metavar='file')
+    sync_parser.add_argument('--recheck', type=float, action='store', dest="recheck",
+                             help="seconds before rechecking an unchanged event page")
+    # SERVE
+    serve_parser = subparsers.add_parser("serve", parents=[common_parser])
+    serve_parser.set_defaults(method="serve")
+    serve_parser.add_argument('--host', type=str, action='store', dest="host", default='127.0.0.1',
+                              help="address to listen on (default: 127.0.0.1)")
+    serve_parser.add_argument('--port', '-p', type=int, action='store', dest="port", default=8080,
+                              help="port to listen on (default: 8080)")
+    serve_parser.add_argument('--ttl', type=float, action='store', dest="ttl", default=60 * 60,
+                              help="seconds to keep events of a month in memory (default: 3600)")
+    serve_parser.add_argument('--jobs', '-j', type=int, action='store', dest="max_workers",
+                              help="number of workers to fetch event pages (default: 1)")
+    serve_parser.add_argument('--quiet', '-q', action='store_true', dest="quiet",
+                              help="do not log requests")
 
     args = parser.parse_args()
     kwargs = vars(args)
+    output_format = kwargs.pop('format', 'text')
+    fields = kwargs.get('fields')
+    kwargs['stats'] = Stats() if kwargs.get('stats') else None
+    exit_code = 0
     # call event_parser
     # print(kwargs)
-    if args.method is 'get':
-        print(event_parser(**kwargs))
+    if args.method == 'serve':
+        # 重い依存はサーバを起動する時に読み込む
+        from kueventparser.server import serve
+        serve(**kwargs)
+    elif args.method == 'get' and kwargs.get('urls_file') is not None:
+        with kwargs.pop('urls_file') as f:
+            kwargs['urls'] = _read_urls(f)
+        kwargs['method'] = 'get_many'
+        failed = 0
+        outcomes = event_parser(**kwargs)
+        with get_writer(output_format, sys.stdout, fields=fields) as writer:
+            for outcome in outcomes:
+                if outcome.ok:
+                    writer.write(outcome.event)
+                else:
+                    # 取得できなかったURLはstderrに書き, 最後に終了コードで知らせる
+                    failed += outcome.status == FAILED
+                    print(outcome, file=sys.stderr)
+        if failed:
+            print("{} of {} urls failed".format(failed, len(outcomes)), file=sys.stderr)
+            exit_code = 1
+    elif args.method == 'get':
+        with get_writer(output_format, sys.stdout, fields=fields) as writer:
+            writer.write(event_parser(**kwargs))
+    elif args.method == 'sync':
+        for delta in event_parser(**kwargs):
+            print(delta, flush=True)
     else:
-        for event in event_parser(**kwargs):
-            print(event)
+        # 1件ずつ出力するため `generate_all` を使う
+        kwargs['method'] = 'generate_all'
+        with get_writer(output_format, sys.stdout, fields=fields) as writer:
+            for event in event_parser(**kwargs):
+                writer.write(event)
+    if kwargs.get('cache_dir') is not None:
+        stats = get_cache(args.cache_dir).stats()
+        print("cache: {hits} hits, {misses} misses ({revalidated} revalidated), "
+              "hit rate {hit_rate:.1%}".format(**stats), file=sys.stderr)
+    if kwargs['stats'] is not None:
+        print(kwargs['stats'].format(), file=sys.stderr)
+    if exit_code:
+        sys.exit(exit_code)
 
 
 if __name__ == '__main__':
@@ -1,5 +1,21 @@
 import datetime
-from functools import total_ordering
+import sys
+from functools import lru_cache, total_ordering
+
+# Eventのフィールド(この順に並べる)
+FIELDS = ('title', 'url', 'location', 'description', 'start_date', 'end_date', 'start', 'end')
+
+# `Outcome.status`
+OK = 'ok'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+
+@lru_cache(maxsize=None)
+def _jst():
+    """'Asia/Tokyo' のtzinfo. pytzは読み込みが重いので初めて使う時に読み込む"""
+    import pytz
+    return pytz.timezone('Asia/Tokyo')
 
 
 @total_ordering
@@ -17,6 +33,8 @@ class Event:
         end (:obj:`datetime.time`): 終了時間
     """
 
+    __slots__ = FIELDS
+
     def __init__(self, title: str, url: str, location: str, description: str,
                  start_date: datetime.date, end_date: datetime.date, start: datetime.time,
                  end: datetime.time):
@@ -32,10 +50,11 @@ class Event:
             start: 開始時間
             end: 終了時間
         """
-        self.title = title
-        self.url = url
-        self.location = location
-        self.description = description
+        self.title = _text(title)
+        self.url = _text(url)
+        # 開催地は同じものが何度も出てくるので共有する
+        self.location = sys.intern(_text(location)) if location is not None else None
+        self.description = _text(description)
         self.start_date = start_date
         self.end_date = end_date
         self.start = start
@@ -50,15 +69,70 @@ class Event:
         return self.title
 
     def __eq__(self, other):
-        if other is None or type(self) != type(other):
+        if not isinstance(other, Event):
             return NotImplemented
-        # __dict__メソッドを使ってattributesを比較
-        return self.__dict__ == other.__dict__
+        # 全てのattributesを比較
+        return self._values() == other._values()
+
+    def __hash__(self):
+        # 同じイベントは同じURLを持つので, URLだけでハッシュする
+        return hash(self.url)
 
     def __lt__(self, other):
-        if other is None or type(self) is not type(other):
+        if not isinstance(other, Event):
             return NotImplemented
-        return self.start < other.start
+        # 日付, 時刻の順に比べる(時刻だけでは日をまたいで並ばない)
+        return self._sort_key() < other._sort_key()
+
+    @property
+    def start_datetime(self):
+        """開始日時( `start_date` と `start` ). 時刻が無ければその日の始め
+
+        Returns:
+            :obj:`datetime.datetime`: 'Asia/Tokyo' の日時. `start_date` が無ければNone
+        """
+        if self.start_date is None:
+            return None
+        # pytzのtzinfoはlocalizeしないと正しいオフセットにならない
+        return _jst().localize(self._span()[0])
+
+    @property
+    def end_datetime(self):
+        """終了日時( `end_date` と `end` ). 時刻が無ければその日の終わり
+
+        `end_date` が無ければ `start_date` を使う. 開始日時より前にはならない.
+
+        Returns:
+            :obj:`datetime.datetime`: 'Asia/Tokyo' の日時. `start_date` が無ければNone
+        """
+        if self.start_date is None:
+            return None
+        return _jst().localize(self._span()[1])
+
+    def __reduce__(self):
+        return self.__class__, self._values()
+
+    def __setstate__(self, state):
+        # `__dict__` を持っていた頃のpickleを読み込む
+        if isinstance(state, tuple):
+            state = state[-1]
+        for key, value in state.items():
+            setattr(self, key, value)
+
+    def __repr__(self):
+        return '<Event {!r} {}>'.format(self.title, self.url)
+
+    def _span(self) -> tuple:
+        """(開始日時, 終了日時). 日本時間のnaiveな日時"""
+        start = datetime.datetime.combine(self.start_date, _wall(self.start, datetime.time.min))
+        end = datetime.datetime.combine(self.end_date or self.start_date, _wall(self.end, datetime.time.max))
+        return start, max(start, end)
+
+    def _sort_key(self) -> tuple:
+        return self.start_date or datetime.date.min, _wall(self.start, datetime.time.min)
+
+    def _values(self) -> tuple:
+        return tuple(getattr(self, key) for key in FIELDS)
 
     def dict(self):
         """ to Dictionary
@@ -66,9 +140,9 @@ class Event:
         event == Event(**event.dict())
 
         Returns:
-            dict: self.__dict__
+            dict: attribute名 -> 値
         """
-        return self.__dict__.copy()
+        return dict(zip(FIELDS, self._values()))
 
     def is_same_event(self, others):
         """
@@ -80,3 +154,123 @@ class Event:
             bool: others has same url or not
         """
         return self.url == others.url
+
+
+def _lazy_field(name: str) -> property:
+    """ `LazyEvent` のフィールド. 値が無ければ読み込む"""
+    slot = getattr(Event, name)
+
+    def get(self):
+        try:
+            return slot.__get__(self, Event)
+        except AttributeError:
+            self._load()
+            return slot.__get__(self, Event)
+
+    return property(get, slot.__set__, doc=slot.__doc__)
+
+
+class LazyEvent(Event):
+    """一部のフィールドを初めて参照した時に読み込む :obj:`Event`
+
+    `OfficialEventFactory` の `lazy=True` で作られる.
+    読み込む時はページを取得し直すので, キャッシュやアーカイブのtransportと一緒に使うとよい.
+    比較やpickle等で全てのフィールドが必要になった時にも読み込む.
+    pickleすると普通の :obj:`Event` になる.
+
+    Attributes:
+        LAZY(:obj:`tuple`): 後から読み込めるフィールド
+    """
+    __slots__ = ('_loader',)
+    LAZY = ('location', 'description')
+
+    location = _lazy_field('location')
+    description = _lazy_field('description')
+
+    def __init__(self, event: Event, lazy, loader):
+        """イニシャライザー
+
+        Args:
+            event(Event): 読み込まなかったフィールド以外の値を持つイベント
+            lazy: 後から読み込むフィールド名のiterable. `LAZY` のいずれか
+            loader: `loader(url)` で 読み込んだフィールド名 -> 値 のdictを返す関数
+        """
+        lazy = set(lazy)
+        for key in FIELDS:
+            if key not in lazy:
+                getattr(Event, key).__set__(self, getattr(event, key))
+        self._loader = loader
+
+    def __reduce__(self):
+        return Event, self._values()
+
+    def __repr__(self):
+        return '<LazyEvent {!r} {}>'.format(self.title, self.url)
+
+    @property
+    def loaded(self) -> bool:
+        """全てのフィールドを読み込んだかどうか"""
+        return self._loader is None
+
+    def _load(self):
+        values = self._loader(self.url) if self._loader is not None else {}
+        for key in self.LAZY:
+            slot = getattr(Event, key)
+            try:
+                slot.__get__(self, Event)
+            except AttributeError:
+                value = values.get(key)
+                if key == 'location' and value is not None:
+                    value = sys.intern(_text(value))
+                slot.__set__(self, _text(value))
+        self._loader = None
+
+
+class Outcome:
+    """ `get_many` の1URL分の結果
+
+    Attributes:
+        url(:obj:`str`): URL
+        status(:obj:`str`): 'ok'(イベントを作れた), 'skipped'(イベント情報が無かった),
+            'failed'(取得かパースで例外が起きた) のいずれか
+        event(:obj:`Event`): 'ok' ならイベント. それ以外はNone
+        error(:obj:`Exception`): 'failed' なら起きた例外. それ以外はNone
+    """
+    __slots__ = ('url', 'status', 'event', 'error')
+
+    def __init__(self, url: str, status: str, event: Event = None, error: Exception = None):
+        self.url = url
+        self.status = status
+        self.event = event
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        """イベントを作れたかどうか"""
+        return self.status == OK
+
+    def __repr__(self):
+        return '<Outcome {} {}>'.format(self.status, self.url)
+
+    def __str__(self):
+        detail = self.event if self.status == OK else self.error if self.status == FAILED else ''
+        return '{}\t{}\t{}'.format(self.status, self.url, detail)
+
+    def __eq__(self, other):
+        if not isinstance(other, Outcome):
+            return NotImplemented
+        return (self.url, self.status, self.event) == (other.url, other.status, other.event)
+
+
+def _text(value):
+    """bs4の `NavigableString` 等をただの `str` にする(パースした木を参照し続けないように)"""
+    if value is None or type(value) is str:
+        return value
+    return str(value)
+
+
+def _wall(time: datetime.time, default: datetime.time) -> datetime.time:
+    """tzinfoを除いた時刻. Noneなら `default`"""
+    if time is None:
+        return default
+    return time.replace(tzinfo=None) if time.tzinfo is not None else time
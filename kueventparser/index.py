@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""イベントの索引
+
+行事カレンダーを一度だけ走査して作る, 日付からイベントURLを引く索引と,
+イベントの開催期間で引く索引.
+"""
+import datetime
+import random
+from itertools import chain
+from typing import Dict, List
+
+from kueventparser.events import Event, _jst
+
+
+class CalendarIndex:
+    """日付 -> イベントURLのリスト の索引
+
+    行事カレンダーのページを一度パースして作る.
+    期間を指定してURLを取り出したり, 複数の月の索引をまとめたりできる.
+    picklableなのでキャッシュしておいて使い回せる.
+
+    Example:
+
+        >>> index = CalendarIndex({datetime.date(2019, 2, 1): ['http://example.com/a.html']})
+        >>> index.urls(datetime.date(2019, 2, 1), datetime.date(2019, 2, 28))
+        ['http://example.com/a.html']
+    """
+    __slots__ = ('_days',)
+
+    def __init__(self, days: Dict[datetime.date, List[str]] = None):
+        """イニシャライザー
+
+        Args:
+            days(dict): 日付 -> その日のイベントURLのリスト
+        """
+        self._days = {}
+        if days:
+            self.update(days)
+
+    def __getitem__(self, date: datetime.date) -> List[str]:
+        return self._days.get(date, [])
+
+    def __iter__(self):
+        return iter(sorted(self._days))
+
+    def __len__(self):
+        return len(self._days)
+
+    def __eq__(self, other):
+        if not isinstance(other, CalendarIndex):
+            return NotImplemented
+        return self._days == other._days
+
+    def __getstate__(self):
+        return self._days
+
+    def __setstate__(self, state):
+        self._days = state
+
+    def __repr__(self):
+        return '<CalendarIndex {} days>'.format(len(self._days))
+
+    def add(self, date: datetime.date, url: str):
+        """日付にURLを追加する. 同じ日に同じURLは一度しか入らない
+
+        Args:
+            date(datetime.date): 日付
+            url(str): イベントURL
+        """
+        urls = self._days.setdefault(date, [])
+        if url not in urls:
+            urls.append(url)
+
+    def update(self, other):
+        """他の索引(またはdict)の内容を取り込む
+
+        Args:
+            other: :obj:`CalendarIndex` または 日付 -> URLのリスト のdict
+        """
+        items = other.items() if isinstance(other, (CalendarIndex, dict)) else other
+        for date, urls in items:
+            for url in urls:
+                self.add(date, url)
+
+    def items(self):
+        """(日付, URLのリスト) を日付順に返す"""
+        return ((date, self._days[date]) for date in sorted(self._days))
+
+    def slice(self, start: datetime.date, end: datetime.date) -> 'CalendarIndex':
+        """期間内の日付だけを含む索引を返す
+
+        Args:
+            start(datetime.date): 開始日
+            end(datetime.date): 終了日(この日を含む)
+
+        Returns:
+            :obj:`CalendarIndex`: 新しい索引
+        """
+        index = CalendarIndex()
+        index._days = {date: list(urls) for date, urls in self._days.items() if start <= date <= end}
+        return index
+
+    def urls(self, start: datetime.date = None, end: datetime.date = None) -> List[str]:
+        """期間内のイベントURLを, 重複を除いてカレンダー順に返す
+
+        Args:
+            start(datetime.date): 開始日. Noneなら最初から
+            end(datetime.date): 終了日(この日を含む). Noneなら最後まで
+
+        Returns:
+            list: イベントURL
+        """
+        return list(dict.fromkeys(chain.from_iterable(
+            urls for date, urls in self.items()
+            if (start is None or start <= date) and (end is None or date <= end))))
+
+
+class EventIndex:
+    """開催期間 -> イベント の索引
+
+    イベントを開始日時から終了日時までの区間として, 区間の終わりの最大値を持たせた
+    平衡二分探索木(treap)に入れる. ある期間と重なるイベント, ある時刻に開催中のイベント,
+    ある日のイベントを O(log n + 結果の件数) で引ける.
+    追加, 削除も O(log n) なので, 長く動くサービスの中でも使える.
+    同じURLのイベントは1件だけ入る(後から入れたもので置き換える).
+
+    Example:
+
+        >>> index = EventIndex(api.get_all(year=2019, month=2))
+        >>> index.on(datetime.date(2019, 2, 14))
+        [<Event ...>]
+    """
+    __slots__ = ('_root', '_nodes')
+
+    def __init__(self, events=()):
+        """イニシャライザー
+
+        Args:
+            events: :obj:`Event` のiterable
+        """
+        self._root = None
+        # URL -> ノード
+        self._nodes = {}
+        self.update(events)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, event):
+        node = self._nodes.get(getattr(event, 'url', event))
+        return node is not None and node.event == event
+
+    def __iter__(self):
+        """開始日時の順にイベントを返す"""
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                yield node.event
+                node = node.right
+
+    def __reduce__(self):
+        return self.__class__, (list(self),)
+
+    def __repr__(self):
+        return '<EventIndex {} events>'.format(len(self._nodes))
+
+    def add(self, event: Event):
+        """イベントを追加する. 同じURLのイベントがあれば置き換える
+
+        Args:
+            event(Event): イベント
+
+        Raises:
+            ValueError: イベントに開催日が無い場合.
+        """
+        if event.start_date is None:
+            raise ValueError('event has no start_date: {}'.format(event.url))
+        if event.url in self._nodes:
+            self.remove(event.url)
+        node = _Node(event)
+        left, right = _split(self._root, node.key)
+        self._root = _merge(_merge(left, node), right)
+        self._nodes[event.url] = node
+
+    def update(self, events):
+        """イベントをまとめて追加する
+
+        Args:
+            events: :obj:`Event` のiterable
+        """
+        if self._root is not None:
+            for event in events:
+                self.add(event)
+            return
+        # 空の索引なら並べてから一度に作る(O(n log n))
+        for event in events:
+            if event.start_date is None:
+                raise ValueError('event has no start_date: {}'.format(event.url))
+            self._nodes[event.url] = _Node(event)
+        self._root = _build(sorted(self._nodes.values(), key=lambda node: node.key))
+
+    def remove(self, event):
+        """イベントを削除する. 無ければ何もしない
+
+        Args:
+            event: :obj:`Event` またはそのURL
+        """
+        node = self._nodes.pop(getattr(event, 'url', event), None)
+        if node is not None:
+            self._root = _delete(self._root, node.key)
+
+    def overlapping(self, start, end) -> List[Event]:
+        """期間 [start, end] と開催期間が重なるイベント
+
+        Args:
+            start: 開始日時. `datetime.date` ならその日の始め
+            end: 終了日時(この時刻を含む). `datetime.date` ならその日の終わり
+
+        Returns:
+            list: 開始日時の順のイベント
+        """
+        events = []
+        _overlapping(self._root, _key_time(start, datetime.time.min), _key_time(end, datetime.time.max), events)
+        return events
+
+    def at(self, moment: datetime.datetime) -> List[Event]:
+        """ `moment` に開催中のイベント
+
+        複数日にわたるイベントは, 開始日時から終了日時までずっと開催中として扱う.
+
+        Args:
+            moment(datetime.datetime): 日時. naiveなら日本時間として扱う
+
+        Returns:
+            list: 開始日時の順のイベント
+        """
+        return self.overlapping(moment, moment)
+
+    def on(self, date: datetime.date) -> List[Event]:
+        """ `date` に開催されるイベント
+
+        Args:
+            date(datetime.date): 日付
+
+        Returns:
+            list: 開始日時の順のイベント
+        """
+        return self.overlapping(date, date)
+
+
+class _Node:
+    __slots__ = ('key', 'end', 'max_end', 'priority', 'event', 'left', 'right')
+
+    def __init__(self, event: Event):
+        start, self.end = event._span()
+        self.max_end = self.end
+        # 同じ日時のイベントはURLで区別する
+        self.key = (start, self.end, event.url)
+        self.priority = random.random()
+        self.event = event
+        self.left = None
+        self.right = None
+
+    def update(self):
+        max_end = self.end
+        if self.left is not None and self.left.max_end > max_end:
+            max_end = self.left.max_end
+        if self.right is not None and self.right.max_end > max_end:
+            max_end = self.right.max_end
+        self.max_end = max_end
+        return self
+
+
+def _build(nodes):
+    """キーの順に並んだノードから木を作る"""
+    # 右端の経路をスタックに持ち, 優先度の高いノードが来たら経路の下の方を左の子にする
+    stack = []
+    for node in nodes:
+        last = None
+        while stack and stack[-1].priority < node.priority:
+            last = stack.pop().update()
+        node.left = last
+        if stack:
+            stack[-1].right = node
+        stack.append(node)
+    root = None
+    while stack:
+        root = stack.pop().update()
+    return root
+
+
+def _split(node, key):
+    """ `key` 未満の木と `key` 以上の木に分ける"""
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        return node.update(), right
+    left, node.left = _split(node.left, key)
+    return left, node.update()
+
+
+def _merge(left, right):
+    """ `left` の全てのキーが `right` より小さい2つの木をつなぐ"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return left.update()
+    right.left = _merge(left, right.left)
+    return right.update()
+
+
+def _delete(node, key):
+    if node is None:
+        return None
+    if node.key == key:
+        return _merge(node.left, node.right)
+    if key < node.key:
+        node.left = _delete(node.left, key)
+    else:
+        node.right = _delete(node.right, key)
+    return node.update()
+
+
+def _overlapping(node, start, end, events):
+    # 部分木の終わりの最大値が `start` より前なら, その部分木に重なるイベントは無い
+    while node is not None and node.max_end >= start:
+        _overlapping(node.left, start, end, events)
+        if node.key[0] > end:
+            # 右の部分木は全てこれより後に始まる
+            return
+        if node.end >= start:
+            events.append(node.event)
+        node = node.right
+
+
+def _key_time(value, time: datetime.time) -> datetime.datetime:
+    """索引のキー(日本時間のnaiveな日時)にする"""
+    if not isinstance(value, datetime.datetime):
+        return datetime.datetime.combine(value, time)
+    if value.tzinfo is not None:
+        value = value.astimezone(_jst()).replace(tzinfo=None)
+    return value
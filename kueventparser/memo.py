@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""取得結果のメモ化
+
+`core.event_parser` ( `api.get_all` , `api.get` ) に `memo` を指定すると,
+同じ factory, 取得方法, 期間(またはURL)の結果を :obj:`ResultCache` に保持し,
+`ttl` 秒の間は取得し直さずにその写しを返す.
+保持する件数が `max_entries` を超えたら, 最も長く使われていないものから捨てる(LRU).
+
+返すEventは保持しているものの写しなので, 呼び出し側で書き換えても保持しているものは変わらない.
+
+`lazy=True` , `record` を指定した呼び出しと, `get_all` , `get` 以外の取得方法はメモ化しない.
+
+Example:
+
+    >>> from kueventparser import api
+    >>> events = api.get_all(year=2019, month=2, memo=True)  # 取得する
+    >>> events = api.get_all(year=2019, month=2, memo=True)  # 保持しているものを返す
+    >>> api.invalidate(year=2019, month=2)
+"""
+import copy
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from kueventparser.stats import NULL_STATS
+
+# 保持する秒数
+DEFAULT_TTL = 10 * 60
+# 保持する件数の上限
+DEFAULT_MAX_ENTRIES = 256
+# メモ化する取得方法
+MEMO_METHODS = ('get', 'get_all')
+# 結果(順序を含む)が変わりうるのでキーに含めるオプション
+_KEY_OPTIONS = ('ordered', 'parser', 'max_bytes', 'max_parse_time')
+
+_MISSING = object()
+
+
+class ResultCache:
+    """取得結果を保持するLRUキャッシュ
+
+    スレッドセーフ. キーは `key` で作る.
+
+    Attributes:
+        ttl(:obj:`float`): 保持する秒数
+        max_entries(:obj:`int`): 保持する件数の上限
+        hits(:obj:`int`): 保持していたものを返した回数
+        misses(:obj:`int`): 取得した回数
+        evictions(:obj:`int`): 上限を超えて捨てた件数
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES, clock=time.monotonic):
+        """イニシャライザー
+
+        Args:
+            ttl(float): 保持する秒数
+            max_entries(int): 保持する件数の上限
+            clock: 現在時刻(秒)を返す関数
+        """
+        if max_entries < 1:
+            raise ValueError('max_entries must be positive')
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._clock = clock
+        # キー -> (期限, 結果). 最後に使ったものが末尾
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, count: bool = True):
+        """保持している結果の写しを返す
+
+        Args:
+            key: `key` で作ったキー
+            default: 保持していない(期限切れの)場合に返す値
+            count(bool): Trueなら `hits` , `misses` に数える
+
+        Returns:
+            結果の写し. 無ければ `default`
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            value = entry[1]
+        return _copy(value)
+
+    def put(self, key, value):
+        """結果(の写し)を保持する. 上限を超えたら最も長く使われていないものを捨てる"""
+        value = _copy(value)
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def fetch(self, key, load, stats=None):
+        """保持していればその写しを, なければ `load()` の結果を保持して返す
+
+        Args:
+            key: `key` で作ったキー
+            load: 結果を取得する関数
+            stats(Stats): 'memo.hits' , 'memo.misses' を数える先
+
+        Returns:
+            結果(の写し)
+        """
+        stats = stats or NULL_STATS
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            stats.count('memo.hits')
+            return value
+        stats.count('memo.misses')
+        value = load()
+        self.put(key, value)
+        return value
+
+    def invalidate(self, factory=None, url: str = None, start_date: datetime.date = None,
+                   end_date: datetime.date = None) -> int:
+        """条件に合う結果を捨てる. 条件を指定しなければ全て捨てる
+
+        Args:
+            factory: このfactoryの結果だけを捨てる
+            url(str): このURLの `get` の結果と, このURLのイベントを含む `get_all` の結果を捨てる
+            start_date(datetime.date): この期間と重なる `get_all` の結果を捨てる
+            end_date(datetime.date): 期間の終了日. Noneなら `start_date` の1日
+
+        Returns:
+            int: 捨てた件数
+        """
+        if start_date is not None and end_date is None:
+            end_date = start_date
+        with self._lock:
+            keys = [key for key, (_, value) in self._entries.items()
+                    if _matches(key, value, factory, url, start_date, end_date)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        """保持しているものを全て捨てる"""
+        self.invalidate()
+
+    def summary(self) -> dict:
+        """保持している件数, ヒット数等"""
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions}
+
+
+def key(factory, method: str, kwargs: dict, replay: str = None) -> Optional[tuple]:
+    """ `core.prepare` の返り値からキーを作る
+
+    Args:
+        factory: factoryのクラス
+        method(str): 取得方法
+        kwargs(dict): 取得方法に渡す引数
+        replay(str): 記録したアーカイブから読む場合はそのパス
+
+    Returns:
+        tuple: キー. メモ化しない呼び出しならNone.
+        順序( `ordered` ), 解析方法( `parser` ), 上限( `max_bytes` , `max_parse_time` )が違えば別のキーになる
+    """
+    if method not in MEMO_METHODS or kwargs.get('lazy'):
+        return None
+    fields = kwargs.get('fields')
+    fields = tuple(sorted(set(fields))) if fields is not None else None
+    if method == 'get':
+        target = kwargs.get('url')
+    else:
+        target = (kwargs['start_date'], kwargs['end_date'])
+    options = tuple(kwargs.get(name) for name in _KEY_OPTIONS)
+    return factory, method, target, fields, replay, options
+
+
+def _matches(key: tuple, value, factory, url, start_date, end_date) -> bool:
+    _factory, method, target = key[:3]
+    if factory is not None and _factory is not factory:
+        return False
+    if url is not None:
+        if method == 'get':
+            return target == url
+        return any(event.url == url for event in value)
+    if start_date is not None:
+        return method == 'get_all' and target[0] <= end_date and target[1] >= start_date
+    return True
+
+
+def _copy(value):
+    if isinstance(value, list):
+        return [copy.copy(event) for event in value]
+    return copy.copy(value)
+
+
+_memo = None
+_memo_lock = threading.Lock()
+
+
+def get_memo() -> ResultCache:
+    """プロセス内で共有される :obj:`ResultCache` を返す
+
+    `memo=True` の時に使う.
+    """
+    global _memo
+    with _memo_lock:
+        if _memo is None:
+            _memo = ResultCache()
+        return _memo
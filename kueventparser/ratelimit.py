@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""ホスト毎の流量制御
+
+`RateLimitedTransport` は取得の前にホスト毎の :obj:`HostLimiter` で待ち,
+サーバの様子に合わせて流量を変える(AIMD).
+
+* 1秒あたりのリクエスト数はトークンバケットで制限する.
+* 同時に送るリクエスト数(concurrency)も制限する.
+* 応答が `target_latency` 秒以内に返る間は rate と concurrency を少しずつ増やす(加算).
+* 429/503 が返るか, 応答が遅くなったら半分に減らす(乗算).
+* Retry-After が付いていれば, その時刻までそのホストへのリクエストを止める.
+  429/503 は `retries` 回まで送り直す.
+
+デフォルトのtransport( `transports.get_default_transport` )は流量を制限しない.
+`max_rate` ( `--max-rate` )を指定するか, このtransportを渡した時だけ,
+並列に取得してもサーバが許す速さ以上には送らない.
+
+Example:
+
+    >>> from kueventparser.ratelimit import RateLimitedTransport, RateLimiter
+    >>> from kueventparser.transports import HTTPTransport
+    >>> transport = RateLimitedTransport(HTTPTransport(), RateLimiter(max_rate=2.0))
+    >>> events = api.get_all(year=2019, month=2, max_workers=8, transport=transport)
+"""
+import threading
+import time
+from functools import partial
+from typing import Optional
+from urllib.parse import urlsplit
+
+from kueventparser.stats import NULL_STATS, Stats
+from kueventparser.transports import CHUNK_SIZE, BaseTransport, Response, StreamResponse
+
+# 最初の1秒あたりのリクエスト数
+DEFAULT_RATE = 5.0
+# 1秒あたりのリクエスト数の上限
+DEFAULT_MAX_RATE = 20.0
+# 同時に送るリクエスト数の上限
+DEFAULT_MAX_CONCURRENCY = 8
+# これより遅い応答はサーバが混んでいるとみなす(秒)
+DEFAULT_TARGET_LATENCY = 2.0
+# 混んでいるとみなすステータスコード
+THROTTLE_STATUS = (429, 503)
+# Retry-Afterで待つ秒数の上限
+MAX_RETRY_AFTER = 300.0
+
+
+class TokenBucket:
+    """トークンバケット
+
+    スレッドセーフ. トークンは予約してから待つので, 待っている間ロックは持たない.
+
+    Attributes:
+        rate(:obj:`float`): 1秒あたりに補充するトークン数
+        burst(:obj:`float`): 貯められるトークン数の上限
+    """
+
+    def __init__(self, rate: float, burst: float = None, clock=time.monotonic):
+        """イニシャライザー
+
+        Args:
+            rate(float): 1秒あたりに補充するトークン数
+            burst(float): 貯められるトークン数の上限. Noneなら `rate` (最低1)
+            clock: 現在時刻(秒)を返す関数
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """トークンを1つ予約する
+
+        Returns:
+            float: 予約したトークンが使えるようになるまでの秒数
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def set_rate(self, rate: float):
+        """補充の速さを変える. 貯まっているトークンはそのまま"""
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class HostLimiter:
+    """1つのホストへの流量を決める
+
+    スレッドセーフ. `acquire` と `release` を対にして使う.
+
+    Attributes:
+        host(:obj:`str`): ホスト
+        bucket(:obj:`TokenBucket`): rateを制限するバケット
+        concurrency(:obj:`float`): 同時に送れるリクエスト数(小数部分は切り捨てて使う)
+        active(:obj:`int`): 送っている途中のリクエスト数
+    """
+
+    def __init__(self, host: str, limiter: 'RateLimiter'):
+        self.host = host
+        self.limiter = limiter
+        self.bucket = TokenBucket(limiter.rate, limiter.burst, clock=limiter.clock)
+        self.concurrency = float(limiter.concurrency)
+        self.active = 0
+        self._paused_until = 0.0
+        self._decreased_at = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def rate(self) -> float:
+        """今の1秒あたりのリクエスト数"""
+        return self.bucket.rate
+
+    def acquire(self) -> float:
+        """リクエストを送ってよくなるまで待つ
+
+        Returns:
+            float: 待った秒数
+        """
+        began = self.limiter.clock()
+        with self._condition:
+            while self.active >= int(self.concurrency):
+                self._condition.wait()
+            self.active += 1
+        delay = max(self.bucket.reserve(), self._paused_until - self.limiter.clock())
+        if delay > 0:
+            self.limiter.sleep(delay)
+        return self.limiter.clock() - began
+
+    def release(self, latency: Optional[float] = None, throttled: bool = False,
+                retry_after: Optional[float] = None):
+        """リクエストが終わったことを伝え, 結果に合わせて流量を変える
+
+        Args:
+            latency(float): 応答までの秒数. Noneなら(例外等で)流量は変えない
+            throttled(bool): 429/503 が返ったかどうか
+            retry_after(float): Retry-Afterの秒数
+        """
+        limiter = self.limiter
+        with self._condition:
+            self.active -= 1
+            now = limiter.clock()
+            if retry_after is not None:
+                self._paused_until = max(self._paused_until, now + min(retry_after, MAX_RETRY_AFTER))
+            if throttled or (latency is not None and latency > limiter.target_latency):
+                # 送っている途中のリクエストの結果で続けて減らさないよう, 1往復に1回だけ減らす
+                if throttled or now - self._decreased_at > latency:
+                    self._decreased_at = now
+                    self.concurrency = max(limiter.min_concurrency, self.concurrency * limiter.decrease)
+                    self.bucket.set_rate(max(limiter.min_rate, self.bucket.rate * limiter.decrease))
+            elif latency is not None:
+                # 1往復(concurrency件)で +1 になるように増やす
+                self.concurrency = min(limiter.max_concurrency, self.concurrency + 1 / self.concurrency)
+                self.bucket.set_rate(min(limiter.max_rate, self.bucket.rate + 1 / max(self.concurrency, 1.0)))
+            self._condition.notify_all()
+
+    def snapshot(self) -> dict:
+        """rate, concurrency, active の辞書"""
+        with self._condition:
+            return {'rate': self.bucket.rate, 'concurrency': int(self.concurrency), 'active': self.active}
+
+
+class RateLimiter:
+    """ホスト毎の :obj:`HostLimiter` を持つ
+
+    スレッドセーフ. 同じホストを取得するtransportの間で共有する.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, max_rate: float = DEFAULT_MAX_RATE, min_rate: float = 0.2,
+                 burst: float = None, concurrency: int = 2, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 min_concurrency: int = 1, target_latency: float = DEFAULT_TARGET_LATENCY, decrease: float = 0.5,
+                 clock=time.monotonic, sleep=time.sleep):
+        """イニシャライザー
+
+        Args:
+            rate(float): 最初の1秒あたりのリクエスト数. `max_rate` を超えれば `max_rate`
+            max_rate(float): 1秒あたりのリクエスト数の上限
+            min_rate(float): 1秒あたりのリクエスト数の下限
+            burst(float): 続けて送れるリクエスト数. Noneなら `rate`
+            concurrency(int): 最初の同時リクエスト数
+            max_concurrency(int): 同時リクエスト数の上限
+            min_concurrency(int): 同時リクエスト数の下限
+            target_latency(float): これより遅い応答はサーバが混んでいるとみなす(秒)
+            decrease(float): 混んでいる時に rate と concurrency に掛ける値
+            clock: 現在時刻(秒)を返す関数
+            sleep: 指定した秒数待つ関数
+        """
+        self.rate = min(rate, max_rate)
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.concurrency = max(min(concurrency, max_concurrency), min_concurrency)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.target_latency = target_latency
+        self.decrease = decrease
+        self.clock = clock
+        self.sleep = sleep
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def host(self, url: str) -> HostLimiter:
+        """URLのホストの :obj:`HostLimiter` を返す. 無ければ作る"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            limiter = self._hosts.get(host)
+            if limiter is None:
+                limiter = self._hosts[host] = HostLimiter(host, self)
+            return limiter
+
+    def snapshot(self) -> dict:
+        """ホスト -> `HostLimiter.snapshot` """
+        with self._lock:
+            hosts = list(self._hosts.values())
+        return {limiter.host: limiter.snapshot() for limiter in hosts}
+
+
+def parse_retry_after(value: Optional[str], now: float = None) -> Optional[float]:
+    """Retry-Afterヘッダを秒数にする
+
+    Args:
+        value(str): 秒数かHTTP-date
+        now(float): 現在時刻(UNIX時間). Noneなら `time.time()`
+
+    Returns:
+        float: 待つ秒数(0以上). 読めなければNone
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    import email.utils
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - (time.time() if now is None else now))
+
+
+class RateLimitedTransport(BaseTransport):
+    """ :obj:`RateLimiter` に従って送るtransport
+
+    stats には次を記録する.
+
+    段階:
+        ratelimit.wait: 送れるようになるまで待った時間
+    カウンタ:
+        ratelimit.throttled: 429/503 が返った回数
+    ゲージ:
+        ratelimit.rate, ratelimit.concurrency: 最後に送ったホストの今の rate と concurrency
+
+    Attributes:
+        transport(:obj:`BaseTransport`): 実際に通信するtransport
+        limiter(:obj:`RateLimiter`): 流量を決めるもの
+        stats(:obj:`Stats`): 記録する先
+    """
+
+    def __init__(self, transport: BaseTransport, limiter: RateLimiter = None, stats: Stats = None,
+                 retries: int = 3):
+        """イニシャライザー
+
+        Args:
+            transport(BaseTransport): 実際に通信するtransport
+            limiter(RateLimiter): 流量を決めるもの. Noneなら新しく作る
+            stats(Stats): 記録する先. Noneなら記録しない
+            retries(int): 429/503 の時に送り直す回数の上限
+        """
+        self.transport = transport
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.stats = stats or NULL_STATS
+        self.retries = retries
+
+    @classmethod
+    def observed(cls, transport: 'RateLimitedTransport', stats: Stats) -> 'RateLimitedTransport':
+        """同じtransportと `RateLimiter` を使い, `stats` に記録するtransportを作る
+
+        Args:
+            transport(RateLimitedTransport): 元のtransport
+            stats(Stats): 記録する先
+
+        Returns:
+            :obj:`RateLimitedTransport`: transport
+        """
+        return cls(transport.transport, transport.limiter, stats=stats, retries=transport.retries)
+
+    def get(self, url: str, headers: Optional[dict] = None) -> Response:
+        return self._send(url, partial(self.transport.get, url, headers=headers))
+
+    def stream(self, url: str, headers: Optional[dict] = None, chunk_size: int = CHUNK_SIZE,
+               timeout: float = None) -> StreamResponse:
+        # 応答(ヘッダ)が返るまでを1リクエストとして数える
+        return self._send(url, partial(self.transport.stream, url, headers=headers, chunk_size=chunk_size,
+                                       timeout=timeout))
+
+    def _send(self, url: str, send):
+        host = self.limiter.host(url)
+        stats = self.stats
+        for attempt in range(self.retries + 1):
+            waited = host.acquire()
+            if stats.enabled:
+                stats.record('ratelimit.wait', waited)
+            began = time.perf_counter()
+            try:
+                r = send()
+            except BaseException:
+                host.release()
+                raise
+            throttled = r.status_code in THROTTLE_STATUS
+            host.release(time.perf_counter() - began, throttled,
+                         parse_retry_after(r.headers.get('retry-after')) if throttled else None)
+            if stats.enabled:
+                stats.gauge('ratelimit.rate', host.rate)
+                stats.gauge('ratelimit.concurrency', int(host.concurrency))
+            if not throttled:
+                return r
+            stats.count('ratelimit.throttled')
+            if attempt < self.retries and isinstance(r, StreamResponse):
+                r.close()
+        return r
+
+    def close(self):
+        self.transport.close()
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    """プロセス内で共有される :obj:`RateLimiter` を返す
+
+    複数のtransportで流量を共有する時に使う.
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
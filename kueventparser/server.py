@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+"""イベントを配信するHTTPサーバ( `parse_event serve` )
+
+取得したイベントを月毎にメモリに保持し, 次のエンドポイントで返す.
+1つのプロセスで全ての利用者に答えるので, 京大HPへの取得は月毎に `ttl` 秒に1回で済む.
+
+    /events?from=YYYY-MM-DD&to=YYYY-MM-DD  期間のイベント(JSONの配列). 省略すれば今月
+    /event?url=...                         イベントページ1件(JSON). 無ければ404.
+                                           factoryが取得するホスト以外のURLは400
+    /calendar.ics?from=...&to=...          期間のイベント(iCalendar)
+    /stats                                 保持している件数とヒット数(JSON)
+
+レスポンスにはイベントの内容から作ったETagを付け, If-None-Matchが一致すれば304を返す.
+
+Example:
+
+    $ parse_event serve --port 8080 --cache-dir ~/.cache/kueventparser
+    $ curl 'http://127.0.0.1:8080/events?from=2019-02-01&to=2019-02-28'
+"""
+import datetime
+import hashlib
+import io
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from kueventparser.events import Event
+from kueventparser.utils import date_to_month, months_between
+from kueventparser.writers import ICSWriter, event_to_record
+
+# 月毎のイベントを保持する秒数(行事カレンダーのキャッシュの有効期限と同じ)
+DEFAULT_TTL = 60 * 60
+# 1回で問い合わせられる月数の上限
+MAX_MONTHS = 24
+# URL毎に保持するイベント数の上限
+DEFAULT_MAX_EVENTS = 4096
+# 保持する月数の上限
+DEFAULT_MAX_MONTHS = 120
+# `get` に渡すオプション
+_GET_OPTIONS = ('transport', 'parser', 'stats')
+
+
+class EventStore:
+    """取得したイベントを月毎, URL毎に保持する
+
+    スレッドセーフ. 同じ月(URL)を同時に要求されても取得は1回だけ行う.
+    月毎のイベントは `max_months` 月分, URL毎のイベントは `max_events` 件まで保持し,
+    超えたら期限切れのものと最も長く使われていないものから捨てる.
+    イベント情報の無かったURLは保持しない.
+
+    Attributes:
+        factory: イベントを取得するfactory
+        ttl(:obj:`float`): 保持する秒数
+        max_events(:obj:`int`): URL毎に保持するイベント数の上限
+        max_months(:obj:`int`): 保持する月数の上限
+        hosts(:obj:`frozenset`): `event` で取得してよいホスト
+        options(:obj:`dict`): `get_all` に渡すオプション
+        hits(:obj:`int`): 保持していたものを返した回数
+        misses(:obj:`int`): 取得した回数
+    """
+
+    def __init__(self, factory, ttl: float = DEFAULT_TTL, clock=time.monotonic,
+                 max_events: int = DEFAULT_MAX_EVENTS, max_months: int = DEFAULT_MAX_MONTHS, hosts=None,
+                 **options):
+        """イニシャライザー
+
+        Args:
+            factory: イベントを取得するfactory( `core.select_factory` の返り値)
+            ttl(float): 保持する秒数
+            clock: 現在時刻(秒)を返す関数
+            max_events(int): URL毎に保持するイベント数の上限
+            max_months(int): 保持する月数の上限
+            hosts: `event` で取得してよいホストのiterable. Noneならfactoryの行事カレンダーのホスト
+            **options: `get_all` に渡すオプション(transport, parser, max_workers, stats 等)
+        """
+        if max_events < 1 or max_months < 1:
+            raise ValueError('max_events and max_months must be positive')
+        self.factory = factory
+        self.ttl = ttl
+        self.max_events = max_events
+        self.max_months = max_months
+        self.hosts = frozenset(hosts if hosts is not None else _factory_hosts(factory))
+        self.options = options
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        # (年, 月) -> (期限, イベントのリスト). 最後に使ったものが末尾
+        self._months = OrderedDict()
+        # URL -> (期限, イベント). 最後に使ったものが末尾
+        self._events = OrderedDict()
+        # 取得中のキー -> Lock
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_options(cls, factory='official', ttl: float = DEFAULT_TTL, **kwargs) -> 'EventStore':
+        """ `core.event_parser` と同じ引数(cache_dir, replay, max_rate 等)から作る
+
+        Args:
+            factory: factoryの名前かクラス
+            ttl(float): 保持する秒数
+            **kwargs: `core.event_parser` の引数. 期間と `method` は無視する
+
+        Returns:
+            :obj:`EventStore`: store
+        """
+        from kueventparser.core import prepare
+
+        for key in ('method', 'start_date', 'end_date', 'year', 'month', 'day', 'date'):
+            kwargs.pop(key, None)
+        today = datetime.date.today()
+        _factory, _, options = prepare(factory, 'get_all', start_date=today, end_date=today, **kwargs)
+        del options['start_date'], options['end_date']
+        return cls(_factory, ttl=ttl, **options)
+
+    def events(self, start_date: datetime.date, end_date: datetime.date) -> list:
+        """期間に開催されるイベント(開始日時順)
+
+        Args:
+            start_date(datetime.date): 期間の開始日
+            end_date(datetime.date): 期間の終了日(この日を含む)
+
+        Returns:
+            list: :obj:`Event` のリスト
+        """
+        found = {}
+        for year, month in months_between(start_date, end_date):
+            for event in self.month(year, month):
+                if _overlaps(event, start_date, end_date):
+                    found[event.url] = event
+        return sorted(found.values())
+
+    def month(self, year: int, month: int) -> list:
+        """月のイベント. 保持していなければ(期限切れなら)取得する"""
+        return self._cached(self._months, (year, month), self._load_month)
+
+    def event(self, url: str) -> Optional[Event]:
+        """イベントページ1件. 保持していなければ取得する. イベント情報が無ければNone
+
+        Raises:
+            BadRequest: `hosts` 以外のURLの場合.
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or parts.netloc not in self.hosts:
+            raise BadRequest('url must be on {}'.format(', '.join(sorted(self.hosts)) or 'no host'))
+        return self._cached(self._events, url, self._load_event)
+
+    def clear(self):
+        """保持しているものを全て捨てる"""
+        with self._lock:
+            self._months.clear()
+            self._events.clear()
+
+    def summary(self) -> dict:
+        """保持している月数, イベント数とヒット数"""
+        with self._lock:
+            return {'months': len(self._months), 'events': len(self._events), 'hits': self.hits,
+                    'misses': self.misses}
+
+    def _cached(self, table: dict, key, load):
+        with self._lock:
+            entry = table.get(key)
+            if entry is not None and entry[0] > self._clock():
+                self._hit(table, key)
+                return entry[1]
+            lock = self._loading.setdefault(key, threading.Lock())
+        with lock:
+            # 待っている間に他のスレッドが取得していればそれを使う
+            with self._lock:
+                entry = table.get(key)
+                if entry is not None and entry[0] > self._clock():
+                    self._hit(table, key)
+                    return entry[1]
+                self.misses += 1
+            value = None
+            try:
+                value = load(key)
+            finally:
+                # 保持してから取得中の印を消す. 間に来たスレッドが取得し直さないようにする
+                with self._lock:
+                    if value is not None:
+                        table[key] = (self._clock() + self.ttl, value)
+                        table.move_to_end(key)
+                        self._trim(table)
+                    self._loading.pop(key, None)
+            return value
+
+    def _hit(self, table: OrderedDict, key):
+        self.hits += 1
+        table.move_to_end(key)
+
+    def _trim(self, table: OrderedDict):
+        """ `table` を上限以下にする. 期限切れのものから捨てる( `_lock` を持って呼ぶ)"""
+        limit = self.max_events if table is self._events else self.max_months
+        if len(table) <= limit:
+            return
+        now = self._clock()
+        for key in [key for key, (expires, _) in table.items() if expires <= now]:
+            del table[key]
+        while len(table) > limit:
+            table.popitem(last=False)
+
+    def _load_month(self, key) -> list:
+        start, end = date_to_month(datetime.date(key[0], key[1], 1))
+        events = self.factory.get_all(start, end, **self.options)
+        expires = self._clock() + self.ttl
+        with self._lock:
+            # `/event` でも使えるようにURL毎にも保持する
+            for event in events:
+                self._events[event.url] = (expires, event)
+                self._events.move_to_end(event.url)
+            self._trim(self._events)
+        return events
+
+    def _load_event(self, url: str) -> Optional[Event]:
+        return self.factory.get(url, **{key: self.options[key] for key in _GET_OPTIONS if key in self.options})
+
+
+def _factory_hosts(factory) -> set:
+    """factoryが行事カレンダーを取得するホスト. まとめたfactoryなら各factoryのもの"""
+    sources = getattr(factory, 'sources', None)
+    if sources:
+        return set().union(*(_factory_hosts(source) for source in sources))
+    template = getattr(factory, '_template', None)
+    return {urlsplit(template).netloc} if template else set()
+
+
+def _overlaps(event: Event, start: datetime.date, end: datetime.date) -> bool:
+    if event.start_date is None:
+        return True
+    return event.start_date <= end and (event.end_date or event.start_date) >= start
+
+
+class BadRequest(ValueError):
+    """リクエストの引数が正しくないときの例外(400を返す)"""
+
+
+class EventRequestHandler(BaseHTTPRequestHandler):
+    """ `EventServer` のリクエストを処理する"""
+    protocol_version = 'HTTP/1.1'
+    server_version = 'kueventparser'
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        route = self.server.routes.get(parts.path)
+        if route is None:
+            self._send_json(404, {'error': 'not found: {}'.format(parts.path)})
+            return
+        try:
+            getattr(self, route)(query)
+        except BadRequest as e:
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            self.log_error('%s: %r', self.path, e)
+            self._send_json(502, {'error': 'failed to fetch events: {}'.format(e)})
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def events(self, query: dict):
+        records = [event_to_record(event) for event in self._events(query)]
+        body = json.dumps(records, ensure_ascii=False)
+        self._send_data(body, 'events', lambda: body, 'application/json; charset=utf-8')
+
+    def event(self, query: dict):
+        url = query.get('url')
+        if not url:
+            raise BadRequest("'url' is required")
+        event = self.server.store.event(url)
+        if event is None:
+            self._send_json(404, {'error': 'no event in {}'.format(url)})
+            return
+        body = json.dumps(event_to_record(event), ensure_ascii=False)
+        self._send_data(body, 'event', lambda: body, 'application/json; charset=utf-8')
+
+    def calendar(self, query: dict):
+        events = self._events(query)
+        data = json.dumps([event_to_record(event) for event in events], ensure_ascii=False)
+
+        def render():
+            stream = io.StringIO()
+            with ICSWriter(stream, flush=False) as writer:
+                for event in events:
+                    writer.write(event)
+            return stream.getvalue()
+
+        self._send_data(data, 'ics', render, 'text/calendar; charset=utf-8')
+
+    def stats(self, query: dict):
+        summary = self.server.store.summary()
+        stats = self.server.store.options.get('stats')
+        if stats is not None:
+            summary['stats'] = stats.summary()
+        self._send_json(200, summary)
+
+    def _events(self, query: dict) -> list:
+        start = _parse_date(query, 'from')
+        end = _parse_date(query, 'to')
+        if start is None and end is None:
+            start, end = date_to_month(datetime.date.today())
+        elif end is None:
+            end = date_to_month(start)[1]
+        elif start is None:
+            start = date_to_month(end)[0]
+        if start > end:
+            raise BadRequest("'from' must not be after 'to'")
+        if len(months_between(start, end)) > MAX_MONTHS:
+            raise BadRequest('at most {} months at once'.format(MAX_MONTHS))
+        return self.server.store.events(start, end)
+
+    def _send_data(self, data: str, kind: str, render, content_type: str):
+        """内容( `data` )からETagを作り, 一致すれば304, しなければ `render()` を返す"""
+        etag = '"{}"'.format(hashlib.sha1((kind + '\n' + data).encode('utf-8')).hexdigest()[:20])
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self._send(200, render().encode('utf-8'), content_type, etag)
+
+    def _send_json(self, status: int, value):
+        self._send(status, json.dumps(value, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8')
+
+    def _send(self, status: int, body: bytes, content_type: str, etag: str = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _parse_date(query: dict, key: str) -> Optional[datetime.date]:
+    value = query.get(key)
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise BadRequest("invalid '{}': '{}' (use YYYY-MM-DD)".format(key, value))
+
+
+class EventServer(ThreadingHTTPServer):
+    """ :obj:`EventStore` を配信するHTTPサーバ
+
+    Attributes:
+        store(:obj:`EventStore`): イベントを保持するもの
+        routes(:obj:`dict`): パス -> `EventRequestHandler` のメソッド名
+        quiet(:obj:`bool`): Trueならアクセスログを出さない
+    """
+    daemon_threads = True
+    routes = {
+        '/events': 'events',
+        '/event': 'event',
+        '/calendar.ics': 'calendar',
+        '/stats': 'stats',
+    }
+
+    def __init__(self, store: EventStore, host: str = '127.0.0.1', port: int = 8080, quiet: bool = False):
+        """イニシャライザー
+
+        Args:
+            store(EventStore): イベントを保持するもの
+            host(str): 待ち受けるアドレス
+            port(int): 待ち受けるポート. 0なら空いているポート
+            quiet(bool): Trueならアクセスログを出さない
+        """
+        self.store = store
+        self.quiet = quiet
+        super().__init__((host, port), EventRequestHandler)
+
+
+def serve(factory='official', host: str = '127.0.0.1', port: int = 8080, ttl: float = DEFAULT_TTL,
+          quiet: bool = False, **kwargs):
+    """サーバを起動し, 止められるまで配信する
+
+    Args:
+        factory: factoryの名前かクラス
+        host(str): 待ち受けるアドレス
+        port(int): 待ち受けるポート
+        ttl(float): 月毎のイベントを保持する秒数
+        quiet(bool): Trueならアクセスログを出さない
+        **kwargs: `core.event_parser` の引数(cache_dir, parser, max_workers, replay, stats 等)
+    """
+    store = EventStore.from_options(factory, ttl=ttl, **kwargs)
+    server = EventServer(store, host, port, quiet=quiet)
+    print('serving on http://{}:{}/'.format(*server.server_address[:2]), file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""取得の段階毎の計測
+
+各factoryや `utils.url_to_soup` は `stats` 引数で受け取った :obj:`Stats` に
+段階(stage)毎の時間とカウンタを記録する.
+指定しなければ何もしない `NULL_STATS` を使うので, 計測しない時の負担はほぼ無い.
+
+段階:
+    calendar.fetch, calendar.parse, calendar.index: 行事カレンダーの取得, HTMLの解析, URLの抽出
+    event.fetch: イベントページの取得
+    event.parse: イベントページのHTMLの解析(文字列の抽出まで). `parser='stream'` なら本文の受信を含む
+    event.strings: 日付, 時刻文字列の解析( `parse_str_to_*` )とEventの作成
+
+カウンタ:
+    pages, bytes: 取得したページ数と本文のbytes数
+    cache.hits: キャッシュから返されたページ数
+    events: 作れたイベント数
+    events.none: イベント情報が無かったページ数(negative cacheで取得しなかったものを含む)
+    events.failed: `get_many` で取得かパースに失敗したページ数
+    memo.hits, memo.misses: `memo` で保持していた結果を返した回数と取得した回数
+    stream.stopped, stream.truncated: `parser='stream'` で, 要るフィールドを読み終えて受信をやめたページ数と,
+        `max_bytes` , `max_parse_time` を超えて受信をやめたページ数
+    sources.failed, events.duplicate: まとめたfactoryで失敗したものの数と, 重複して除いたイベント数
+
+ゲージ(最後に記録した値):
+    ratelimit.rate, ratelimit.concurrency: `ratelimit.RateLimitedTransport` の今の流量
+
+Example:
+
+    >>> from kueventparser import api
+    >>> from kueventparser.stats import Stats
+    >>> stats = Stats()
+    >>> events = api.get_all(year=2019, month=2, stats=stats)
+    >>> print(stats.format())
+"""
+import math
+import threading
+import time
+from typing import Callable, Optional
+
+# ヒストグラムのバケットの数. i番目は 2**i マイクロ秒以下
+_BUCKETS = 32
+
+
+class Histogram:
+    """レイテンシのヒストグラム(2のべき乗マイクロ秒毎のバケット)
+
+    Attributes:
+        count(:obj:`int`): 記録した回数
+        total(:obj:`float`): 合計秒数
+        min(:obj:`float`): 最小の秒数
+        max(:obj:`float`): 最大の秒数
+    """
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = [0] * _BUCKETS
+
+    def add(self, seconds: float):
+        """1回分の秒数を記録する"""
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        micros = int(seconds * 1e6)
+        self.buckets[min(micros.bit_length(), _BUCKETS - 1)] += 1
+
+    def quantile(self, q: float) -> float:
+        """分位数(バケットの上限で近似した秒数)
+
+        Args:
+            q(float): 0から1の値
+
+        Returns:
+            float: 秒数. 記録が無ければ0
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min((1 << i) / 1e6, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """count, total, mean, min, p50, p90, p99, max の辞書"""
+        return {'count': self.count, 'total': self.total,
+                'mean': self.total / self.count if self.count else 0.0,
+                'min': self.min if self.count else 0.0,
+                'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99),
+                'max': self.max}
+
+
+class _Stage:
+    """ `Stats.stage` が返すコンテキストマネージャ"""
+    __slots__ = ('stats', 'name', 'began')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        if self.stats.on_start is not None:
+            self.stats.on_start(self.name)
+        self.began = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stats.record(self.name, time.perf_counter() - self.began)
+
+
+class Stats:
+    """段階毎の時間とカウンタを記録する
+
+    スレッドセーフ. 1回の取得(または複数回)で使い回してよい.
+
+    Attributes:
+        counters(:obj:`dict`): カウンタ名 -> 値
+        gauges(:obj:`dict`): ゲージ名 -> 最後に記録した値
+        stages(:obj:`dict`): 段階名 -> :obj:`Histogram`
+        on_start: 段階の開始時に `on_start(段階名)` で呼ばれる
+        on_end: 段階の終了時に `on_end(段階名, 秒数)` で呼ばれる
+    """
+    enabled = True
+
+    def __init__(self, on_start: Optional[Callable[[str], None]] = None,
+                 on_end: Optional[Callable[[str, float], None]] = None):
+        """イニシャライザー
+
+        Args:
+            on_start: 段階の開始時に呼ぶ関数
+            on_end: 段階の終了時に呼ぶ関数
+        """
+        self.on_start = on_start
+        self.on_end = on_end
+        self.counters = {}
+        self.gauges = {}
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name: str) -> _Stage:
+        """段階の時間を計るコンテキストマネージャ
+
+        Args:
+            name(str): 段階名
+
+        Example:
+
+            >>> with stats.stage('event.fetch'):
+            ...     r = transport.get(url)
+        """
+        return _Stage(self, name)
+
+    def record(self, name: str, seconds: float):
+        """段階の時間を記録する
+
+        Args:
+            name(str): 段階名
+            seconds(float): 秒数
+        """
+        with self._lock:
+            histogram = self.stages.get(name)
+            if histogram is None:
+                histogram = self.stages[name] = Histogram()
+            histogram.add(seconds)
+        if self.on_end is not None:
+            self.on_end(name, seconds)
+
+    def count(self, name: str, n: int = 1):
+        """カウンタを増やす
+
+        Args:
+            name(str): カウンタ名
+            n(int): 増やす数
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name: str, value: float):
+        """ゲージの値を記録する(前の値は捨てる)
+
+        Args:
+            name(str): ゲージ名
+            value(float): 値
+        """
+        with self._lock:
+            self.gauges[name] = value
+
+    def fetched(self, response, size: int = None):
+        """取得したページを数える(pages, bytes, cache.hits)
+
+        Args:
+            response(:obj:`kueventparser.transports.Response`): レスポンス
+            size(int): 受け取った本文のbytes数. Noneなら `response.content` の長さ
+        """
+        with self._lock:
+            counters = self.counters
+            counters['pages'] = counters.get('pages', 0) + 1
+            counters['bytes'] = counters.get('bytes', 0) + (len(response.content) if size is None else size)
+            if response.from_cache:
+                counters['cache.hits'] = counters.get('cache.hits', 0) + 1
+
+    def summary(self) -> dict:
+        """記録の要約
+
+        Returns:
+            dict: {'counters': カウンタ, 'gauges': ゲージ, 'stages': 段階名 -> `Histogram.summary` }
+        """
+        with self._lock:
+            return {'counters': dict(self.counters), 'gauges': dict(self.gauges),
+                    'stages': {name: histogram.summary() for name, histogram in sorted(self.stages.items())}}
+
+    def format(self) -> str:
+        """人が読むための要約"""
+        summary = self.summary()
+        lines = ['{:<16} {:>7} {:>10} {:>10} {:>10} {:>10}'.format('stage', 'count', 'total', 'mean', 'p90', 'max')]
+        for name, s in summary['stages'].items():
+            lines.append('{:<16} {:>7} {:>9.3f}s {:>8.2f}ms {:>8.2f}ms {:>8.2f}ms'.format(
+                name, s['count'], s['total'], s['mean'] * 1e3, s['p90'] * 1e3, s['max'] * 1e3))
+        lines.append(', '.join('{} {}'.format(name, value) for name, value in sorted(summary['counters'].items())))
+        if summary['gauges']:
+            lines.append(', '.join('{} {:g}'.format(name, value) for name, value in sorted(summary['gauges'].items())))
+        return '\n'.join(lines)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullStats(Stats):
+    """何も記録しない :obj:`Stats`"""
+    enabled = False
+
+    def __init__(self):
+        super().__init__()
+
+    def stage(self, name: str):
+        return _NULL_STAGE
+
+    def record(self, name: str, seconds: float):
+        pass
+
+    def count(self, name: str, n: int = 1):
+        pass
+
+    def gauge(self, name: str, value: float):
+        pass
+
+    def fetched(self, response, size: int = None):
+        pass
+
+
+# `stats` が指定されなかった時に使う
+NULL_STATS = NullStats()
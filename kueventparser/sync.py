@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""差分同期のための状態の保存
+
+前回の同期で見たイベントURL, ページ本文のハッシュ, ETag等, パースした `Event` をSQLiteに保存する.
+同期の処理自体は各factoryの `sync` が行う( `OfficialEventFactory.sync` 等).
+
+Example:
+
+    >>> from kueventparser import api
+    >>> for delta in api.sync(state='state.sqlite3', year=2019, month=2):
+    ...     print(delta.kind, delta.url)
+"""
+import hashlib
+import pickle
+import sqlite3
+import threading
+from typing import Optional
+
+from kueventparser.events import Event
+
+# 前回の確認からこの秒数が経つまではページを確認しない(デフォルト)
+DEFAULT_RECHECK = 24 * 60 * 60
+
+ADDED = 'added'
+CHANGED = 'changed'
+REMOVED = 'removed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    url TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    event BLOB NOT NULL,
+    first_day TEXT NOT NULL,
+    last_day TEXT NOT NULL,
+    last_seen REAL NOT NULL,
+    last_checked REAL NOT NULL
+);
+"""
+
+
+class Delta:
+    """同期で見つかった変更
+
+    Attributes:
+        kind(:obj:`str`): 'added', 'changed', 'removed' のいずれか
+        url(:obj:`str`): イベントURL
+        event(:obj:`Event`): 新しいイベント. 'removed' なら消える前のイベント
+    """
+    __slots__ = ('kind', 'url', 'event')
+
+    def __init__(self, kind: str, url: str, event: Event):
+        self.kind = kind
+        self.url = url
+        self.event = event
+
+    def __repr__(self):
+        return '<Delta {} {}>'.format(self.kind, self.url)
+
+    def __str__(self):
+        return '{}\t{}\t{}'.format(self.kind, self.url, self.event)
+
+    def __eq__(self, other):
+        if not isinstance(other, Delta):
+            return NotImplemented
+        return (self.kind, self.url, self.event) == (other.kind, other.url, other.event)
+
+
+class Record:
+    """ `StateStore` に保存されている1件
+
+    Attributes:
+        url(:obj:`str`): イベントURL
+        hash(:obj:`str`): ページ本文のハッシュ
+        etag(:obj:`str`): ETag. 無ければNone
+        last_modified(:obj:`str`): Last-Modified. 無ければNone
+        event(:obj:`Event`): パースしたイベント. イベント情報の無いページならNone
+        first_day(:obj:`str`): カレンダーに載っていた最初の日(ISO形式)
+        last_day(:obj:`str`): カレンダーに載っていた最後の日(ISO形式)
+        last_seen(:obj:`float`): 最後にカレンダーで見た時刻
+        last_checked(:obj:`float`): 最後にページを確認した時刻
+    """
+    __slots__ = ('url', 'hash', 'etag', 'last_modified', 'event', 'first_day', 'last_day',
+                 'last_seen', 'last_checked')
+
+    def __init__(self, url, hash, etag, last_modified, event, first_day, last_day, last_seen, last_checked):
+        self.url = url
+        self.hash = hash
+        self.etag = etag
+        self.last_modified = last_modified
+        self.event = event
+        self.first_day = first_day
+        self.last_day = last_day
+        self.last_seen = last_seen
+        self.last_checked = last_checked
+
+    def validators(self) -> dict:
+        """条件付きGETに使うヘッダ"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+def content_hash(content: bytes) -> str:
+    """ページ本文のハッシュ
+
+    Args:
+        content(bytes): 本文
+
+    Returns:
+        str: sha256の16進表記
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+class StateStore:
+    """同期の状態を保存するSQLiteのストア
+
+    スレッドセーフ.
+    """
+
+    def __init__(self, path: str):
+        """イニシャライザー
+
+        Args:
+            path(str): SQLiteのファイル. 無ければ作る
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+
+    def get(self, url: str) -> Optional[Record]:
+        """URLの記録を返す. 無ければNone"""
+        with self._lock:
+            row = self._db.execute('SELECT * FROM events WHERE url = ?', (url,)).fetchone()
+        return _record(row) if row is not None else None
+
+    def put(self, record: Record):
+        """記録を保存する(上書き)"""
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             (record.url, record.hash, record.etag, record.last_modified,
+                              pickle.dumps(record.event, pickle.HIGHEST_PROTOCOL), record.first_day,
+                              record.last_day, record.last_seen, record.last_checked))
+            self._db.commit()
+
+    def remove(self, url: str):
+        """記録を消す"""
+        with self._lock:
+            self._db.execute('DELETE FROM events WHERE url = ?', (url,))
+            self._db.commit()
+
+    def in_range(self, first_day: str, last_day: str):
+        """カレンダーに載っていた期間が [first_day, last_day] と重なる記録
+
+        Args:
+            first_day(str): 期間の開始日(ISO形式)
+            last_day(str): 期間の終了日(ISO形式)
+
+        Returns:
+            list: :obj:`Record` のリスト
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM events WHERE first_day <= ? AND last_day >= ?',
+                                    (last_day, first_day)).fetchall()
+        return [_record(row) for row in rows]
+
+    def events(self):
+        """保存されている全てのイベント"""
+        with self._lock:
+            rows = self._db.execute('SELECT event FROM events ORDER BY first_day, url').fetchall()
+        events = (pickle.loads(row[0]) for row in rows)
+        return [event for event in events if event is not None]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _record(row) -> Record:
+    row = list(row)
+    row[4] = pickle.loads(row[4])
+    return Record(*row)
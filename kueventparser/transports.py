@@ -0,0 +1,515 @@
+# -*- coding: utf-8 -*-
+"""HTTP通信を担うtransport群
+
+`utils.url_to_soup` や各factoryはこのモジュールのtransportを通してページを取得する.
+テストやベンチマークでは同じインターフェースを持つ別のtransportに差し替えられる.
+"""
+import gzip
+import socket
+import threading
+import zlib
+from abc import ABCMeta, abstractmethod
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urljoin, urlsplit
+
+if TYPE_CHECKING:
+    import asyncio
+
+USER_AGENT = 'kueventparser'
+# リダイレクトを辿る回数の上限
+MAX_REDIRECTS = 10
+# リトライするステータスコード
+RETRY_STATUS = (500, 502, 503, 504)
+# `ratelimit.RateLimitedTransport` を通す時にリトライするステータスコード(503はそちらで扱う)
+LIMITED_RETRY_STATUS = (500, 502, 504)
+# `BaseTransport.stream` で一度に返す本文のbytes数
+CHUNK_SIZE = 16 * 1024
+
+
+class Response:
+    """transportが返すレスポンス
+
+    Attributes:
+        url(:obj:`str`): 最終的に取得したURL(リダイレクト後)
+        status_code(:obj:`int`): ステータスコード
+        headers(:obj:`dict`): ヘッダ. キーは小文字
+        content(:obj:`bytes`): 本文(gzip等は展開済み)
+        from_cache(:obj:`bool`): キャッシュから返されたかどうか
+    """
+    __slots__ = ('url', 'status_code', 'headers', 'content', 'from_cache')
+
+    def __init__(self, url: str, status_code: int, headers: dict, content: bytes, from_cache: bool = False):
+        self.url = url
+        self.status_code = status_code
+        self.headers = {key.lower(): value for key, value in headers.items()}
+        self.content = content
+        self.from_cache = from_cache
+
+    def __repr__(self):
+        return '<Response [{}] {}>'.format(self.status_code, self.url)
+
+    @property
+    def encoding(self) -> Optional[str]:
+        """Content-Typeに明示されたcharset. 無ければNone"""
+        content_type = self.headers.get('content-type', '')
+        for param in content_type.split(';')[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.lower() == 'charset' and value:
+                return value.strip('"\'').lower()
+        return None
+
+    def raise_for_status(self):
+        """4xx, 5xx の時に例外を投げる
+
+        Raises:
+            HTTPError: ステータスコードが400以上の場合.
+        """
+        if self.status_code >= 400:
+            raise HTTPError(self)
+
+
+class StreamResponse:
+    """ `BaseTransport.stream` が返すレスポンス
+
+    本文は `iter_content` で少しずつ読む. 読み終わる前に `close` すれば残りは受信しない.
+
+    Attributes:
+        url(:obj:`str`): 最終的に取得したURL(リダイレクト後)
+        status_code(:obj:`int`): ステータスコード
+        headers(:obj:`dict`): ヘッダ. キーは小文字
+        from_cache(:obj:`bool`): キャッシュから返されたかどうか
+    """
+    __slots__ = ('url', 'status_code', 'headers', 'from_cache', '_chunks', '_close')
+
+    encoding = Response.encoding
+
+    def __init__(self, url: str, status_code: int, headers: dict, chunks, close=None, from_cache: bool = False):
+        """イニシャライザー
+
+        Args:
+            url(str): 最終的に取得したURL
+            status_code(int): ステータスコード
+            headers(dict): ヘッダ
+            chunks: 本文(gzip等は展開済み)を少しずつ返すiterable
+            close: 通信をやめる関数. Noneなら何もしない
+            from_cache(bool): キャッシュから返されたかどうか
+        """
+        self.url = url
+        self.status_code = status_code
+        self.headers = {key.lower(): value for key, value in headers.items()}
+        self.from_cache = from_cache
+        self._chunks = chunks
+        self._close = close
+
+    def __repr__(self):
+        return '<StreamResponse [{}] {}>'.format(self.status_code, self.url)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def iter_content(self):
+        """本文を少しずつ返す"""
+        return iter(self._chunks)
+
+    def close(self):
+        """通信をやめる. 読み終わっていなければ接続を閉じる"""
+        if self._close is not None:
+            self._close()
+
+
+class HTTPError(IOError):
+    """ステータスコードがエラーを示すときの例外
+
+    Attributes:
+        response(:obj:`Response`): 原因となったレスポンス
+    """
+
+    def __init__(self, response: Response):
+        super().__init__('{} Error for url: {}'.format(response.status_code, response.url))
+        self.response = response
+
+
+def decode_content(content: bytes, encoding: Optional[str]) -> bytes:
+    """Content-Encodingに従って本文を展開する
+
+    Args:
+        content(bytes): 受信した本文
+        encoding(str): Content-Encodingヘッダの値
+
+    Returns:
+        bytes: 展開した本文
+    """
+    encoding = (encoding or '').lower()
+    if encoding == 'gzip':
+        return gzip.decompress(content)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(content)
+        except zlib.error:
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+    return content
+
+
+class BaseTransport(metaclass=ABCMeta):
+    """同期transportの基底クラス
+
+    `get` を実装すれば `utils.url_to_soup` や各factoryから使える.
+    """
+
+    @abstractmethod
+    def get(self, url: str, headers: Optional[dict] = None) -> Response:
+        """URLをGETする
+
+        Args:
+            url(str): 取得するURL
+            headers(dict): 追加のリクエストヘッダ
+
+        Returns:
+            :obj:`Response`: レスポンス
+        """
+
+    def stream(self, url: str, headers: Optional[dict] = None, chunk_size: int = CHUNK_SIZE,
+               timeout: float = None) -> StreamResponse:
+        """URLをGETし, 本文を少しずつ返す
+
+        デフォルトでは `get` で全体を受け取ってから分けて返す.
+        途中で読むのをやめて通信を減らせるtransportは上書きする.
+
+        Args:
+            url(str): 取得するURL
+            headers(dict): 追加のリクエストヘッダ
+            chunk_size(int): 一度に返す本文のbytes数
+            timeout(float): このリクエストの読み込みのタイムアウト秒数. transport自身のものより長ければ使わない.
+                デフォルトでは使わない
+
+        Returns:
+            :obj:`StreamResponse`: レスポンス
+        """
+        r = self.get(url, headers=headers)
+        content = r.content
+        return StreamResponse(r.url, r.status_code, r.headers,
+                              (content[i:i + chunk_size] for i in range(0, len(content), chunk_size)),
+                              from_cache=r.from_cache)
+
+    def close(self):
+        """保持している資源を解放する"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class HTTPTransport(BaseTransport):
+    """`requests.Session` を使うtransport
+
+    ホスト毎に接続をプールしてkeep-aliveで使い回す.
+    5xxや接続エラーは指数バックオフでリトライする.
+    """
+
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 5.0, read_timeout: float = 30.0,
+                 retries: int = 3, backoff_factor: float = 0.5, headers: Optional[dict] = None,
+                 retry_status=RETRY_STATUS):
+        """イニシャライザー
+
+        Args:
+            pool_size(int): ホスト毎にプールする接続数. 並列数以上にする
+            connect_timeout(float): 接続のタイムアウト秒数
+            read_timeout(float): 読み込みのタイムアウト秒数
+            retries(int): リトライ回数の上限
+            backoff_factor(float): リトライ間隔. `backoff_factor * 2 ** (n - 1)` 秒待つ
+            headers(dict): 全てのリクエストに付けるヘッダ
+            retry_status: リトライするステータスコード
+        """
+        # requestsは読み込みが重いので, 初めて作る時に読み込む
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff_factor, status_forcelist=retry_status,
+                      allowed_methods=frozenset(['GET']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip, deflate'})
+        self.session.headers.update(headers or {})
+
+    def get(self, url: str, headers: Optional[dict] = None) -> Response:
+        r = self.session.get(url, headers=headers, timeout=self.timeout)
+        return Response(r.url, r.status_code, r.headers, r.content)
+
+    def stream(self, url: str, headers: Optional[dict] = None, chunk_size: int = CHUNK_SIZE,
+               timeout: float = None) -> StreamResponse:
+        # 読み終わる前に閉じれば, 接続はプールに戻さずに閉じる
+        connect_timeout, read_timeout = self.timeout
+        if timeout is not None:
+            read_timeout = min(read_timeout, timeout)
+        r = self.session.get(url, headers=headers, timeout=(connect_timeout, read_timeout), stream=True)
+        return StreamResponse(r.url, r.status_code, r.headers, r.iter_content(chunk_size), r.close)
+
+    def close(self):
+        self.session.close()
+
+
+class MemoryTransport(BaseTransport):
+    """メモリ上のページを返すtransport
+
+    テストやベンチマークでネットワークを使わずにfactoryを動かすために使う.
+
+    Attributes:
+        pages(:obj:`dict`): URL -> bytes
+        requested(:obj:`list`): 要求されたURLの記録
+    """
+
+    def __init__(self, pages: dict, headers: Optional[dict] = None):
+        """イニシャライザー
+
+        Args:
+            pages(dict): URL -> 本文(bytes)
+            headers(dict): 全てのレスポンスに付けるヘッダ
+        """
+        self.pages = pages
+        self.headers = headers or {'Content-Type': 'text/html; charset=utf-8'}
+        self.requested = []
+        self._lock = threading.Lock()
+
+    def get(self, url: str, headers: Optional[dict] = None) -> Response:
+        with self._lock:
+            self.requested.append(url)
+        content = self.pages.get(url)
+        if content is None:
+            return Response(url, 404, {}, b'')
+        return Response(url, 200, self.headers, content)
+
+
+_default_transport = None
+_default_lock = threading.Lock()
+
+
+def get_default_transport() -> BaseTransport:
+    """transportが指定されなかった時に使うtransportを返す
+
+    初回呼び出し時に `HTTPTransport` を作り, 以後は使い回す.
+    流量は制限しない. 制限するなら `max_rate` を指定するか, `ratelimit.RateLimitedTransport` を渡す.
+
+    Returns:
+        :obj:`BaseTransport`: transport
+    """
+    global _default_transport
+    with _default_lock:
+        if _default_transport is None:
+            _default_transport = HTTPTransport()
+        return _default_transport
+
+
+def set_default_transport(transport: Optional[BaseTransport]):
+    """デフォルトのtransportを差し替える
+
+    Args:
+        transport(BaseTransport): 新しいtransport. Noneなら次回使用時に作り直す
+    """
+    global _default_transport
+    with _default_lock:
+        _default_transport = transport
+
+
+class AsyncHTTPTransport:
+    """asyncioで動くHTTP/1.1クライアント
+
+    標準ライブラリのみ(`asyncio.open_connection`)で実装している.
+    asyncioは読み込みが重いので, 各メソッドで(呼ばれた時には読み込まれている)参照する.
+    ホスト毎にkeep-aliveした接続を使い回し, 同時リクエスト数は `limit` で制限する.
+    5xxや接続エラーは `HTTPTransport` と同じく指数バックオフでリトライする.
+
+    接続とsemaphoreは使われたイベントループのもの. 別のループで使うと作り直す.
+
+    Example:
+
+        >>> async def main():
+        ...     async with AsyncHTTPTransport() as transport:
+        ...         r = await transport.get("http://www.kyoto-u.ac.jp/")
+    """
+
+    def __init__(self, limit: int = 100, timeout: float = 30.0, headers: Optional[dict] = None,
+                 retries: int = 3, backoff_factor: float = 0.5, retry_status=RETRY_STATUS):
+        """イニシャライザー
+
+        Args:
+            limit(int): 同時に送るリクエスト数の上限
+            timeout(float): 1回のリクエスト(リダイレクト含む)のタイムアウト秒数
+            headers(dict): 全てのリクエストに付けるヘッダ
+            retries(int): リトライ回数の上限
+            backoff_factor(float): リトライ間隔. `backoff_factor * 2 ** (n - 1)` 秒待つ
+            retry_status: リトライするステータスコード
+        """
+        self.limit = limit
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.retry_status = frozenset(retry_status)
+        self.headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip, deflate'}
+        self.headers.update(headers or {})
+        self._loop = None
+        self._semaphore = None
+        self._idle = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def get(self, url: str, headers: Optional[dict] = None) -> Response:
+        """URLをGETする. リダイレクトは辿る.
+
+        Args:
+            url(str): 取得するURL
+            headers(dict): 追加のリクエストヘッダ
+
+        Returns:
+            :obj:`Response`: レスポンス. リトライしても `retry_status` なら最後のもの
+        """
+        import asyncio
+        self._bind(asyncio.get_event_loop())
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    await asyncio.sleep(self.backoff_factor * 2 ** (attempt - 1))
+                try:
+                    response = await asyncio.wait_for(self._get(url, headers), self.timeout)
+                except (ConnectionError, socket.gaierror, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    if attempt == self.retries:
+                        raise
+                    continue
+                if response.status_code not in self.retry_status or attempt == self.retries:
+                    return response
+
+    async def close(self):
+        """使い回している接続を全て閉じる"""
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for _, writer in connections:
+                writer.close()
+
+    def _bind(self, loop):
+        """semaphoreと使い回す接続を `loop` のものにする"""
+        if self._loop is loop:
+            return
+        import asyncio
+        # 別のループの接続は使えないので捨てる
+        self._idle = {}
+        self._loop = loop
+        self._semaphore = asyncio.Semaphore(self.limit)
+
+    async def _get(self, url, headers):
+        for _ in range(MAX_REDIRECTS + 1):
+            response = await self._request(url, headers)
+            location = response.headers.get('location')
+            if response.status_code in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                continue
+            return response
+        raise IOError('Exceeded {} redirects: {}'.format(MAX_REDIRECTS, url))
+
+    async def _request(self, url, headers):
+        import asyncio
+        parts = urlsplit(url)
+        secure = parts.scheme == 'https'
+        key = (parts.scheme, parts.hostname, parts.port or (443 if secure else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        _headers = dict(self.headers)
+        _headers.update(headers or {})
+        _headers['Host'] = parts.netloc
+        request = 'GET {} HTTP/1.1\r\n'.format(path)
+        request += ''.join('{}: {}\r\n'.format(k, v) for k, v in _headers.items())
+        request = (request + '\r\n').encode('latin-1')
+
+        # 使い回した接続がサーバ側で切れていた場合だけ, 新しい接続で1回やり直す
+        for fresh in (False, True):
+            if fresh:
+                for _, stale in self._idle.pop(key, []):
+                    stale.close()
+            reused = bool(self._idle.get(key))
+            reader, writer = await self._connect(key)
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, response_headers, content, keep_alive = await self._read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused and not fresh:
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            break
+        if keep_alive:
+            self._idle.setdefault(key, []).append((reader, writer))
+        else:
+            writer.close()
+        content = decode_content(content, response_headers.get('content-encoding'))
+        return Response(url, status, response_headers, content)
+
+    async def _connect(self, key):
+        connections = self._idle.get(key)
+        while connections:
+            reader, writer = connections.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        import asyncio
+        scheme, host, port = key
+        return await asyncio.open_connection(host, port, ssl=True if scheme == 'https' else None)
+
+    @staticmethod
+    async def _read_head(reader: 'asyncio.StreamReader'):
+        status_line = await reader.readuntil(b'\r\n')
+        version, status, _ = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+        headers = {}
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return version, int(status), headers
+
+    @classmethod
+    async def _read_response(cls, reader: 'asyncio.StreamReader'):
+        version, status, headers = await cls._read_head(reader)
+        # 100 Continue等の途中経過のレスポンスは読み飛ばす(本文は無い)
+        while 100 <= status < 200 and status != 101:
+            version, status, headers = await cls._read_head(reader)
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+
+        if status in (101, 204, 304):
+            content = b''
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if size == 0:
+                    # trailerは読み捨てる
+                    while await reader.readuntil(b'\r\n') != b'\r\n':
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            content = b''.join(chunks)
+        elif 'content-length' in headers:
+            content = await reader.readexactly(int(headers['content-length']))
+        else:
+            content = await reader.read()
+            keep_alive = False
+        return status, headers, content, keep_alive
@@ -5,26 +5,67 @@
 """
 import calendar
 import datetime
+import queue
 import re
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+from itertools import islice
+from typing import TYPE_CHECKING
 
-import pytz
-import requests
-from bs4 import BeautifulSoup
+from kueventparser.events import _jst
+from kueventparser.stats import NULL_STATS
+from kueventparser.transports import get_default_transport
 
+if TYPE_CHECKING:
+    import bs4
 
-def url_to_soup(url: str) -> BeautifulSoup:
+# `imap_bounded` でスレッド数の何倍まで先に投入しておくか
+_PREFETCH = 2
+
+
+def url_to_soup(url: str, transport=None, stats=None, stage: str = 'page') -> 'bs4.BeautifulSoup':
     """URLからBeautifulSoupのオブジェクトを作る
 
     Args:
         url(str): 変換したいURL
+        transport(:obj:`kueventparser.transports.BaseTransport`, optional):
+            通信に使うtransport. 指定しなければデフォルトのものを使う
+        stats(:obj:`kueventparser.stats.Stats`, optional): 計測を記録する先
+        stage(str): 計測に使う段階名の接頭辞. '<stage>.fetch' と '<stage>.parse' を記録する
 
     Returns:
         :obj:`bs4.BeautifulSoup` : BeautifulSoupのオブジェクト
 
+    Raises:
+        kueventparser.transports.HTTPError: ステータスコードが400以上の場合.
+            エラーページを空のページとして扱わないようにする
     """
-    r = requests.get(url)
-    soup = BeautifulSoup(r.content, "lxml")
-    return soup
+    if transport is None:
+        transport = get_default_transport()
+    stats = stats or NULL_STATS
+    with stats.stage(stage + '.fetch'):
+        r = transport.get(url)
+    stats.fetched(r)
+    r.raise_for_status()
+    with stats.stage(stage + '.parse'):
+        return content_to_soup(r.content)
+
+
+def content_to_soup(content: bytes) -> 'bs4.BeautifulSoup':
+    """HTMLのbytesからBeautifulSoupのオブジェクトを作る
+
+    bs4は読み込みが重いので初めて使う時に読み込む.
+
+    Args:
+        content(bytes): HTML
+
+    Returns:
+        :obj:`bs4.BeautifulSoup` : BeautifulSoupのオブジェクト
+    """
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(content, "lxml")
 
 
 def date_to_month(date: datetime.date):
@@ -32,10 +73,183 @@ def date_to_month(date: datetime.date):
     return datetime.date(date.year, date.month, 1), datetime.date(date.year, date.month, last)
 
 
+def months_between(start: datetime.date, end: datetime.date):
+    """期間に含まれる月を列挙する
+
+    Args:
+        start(datetime.date): 開始日
+        end(datetime.date): 終了日(この日を含む)
+
+    Returns:
+        list: (year, month) のリスト. `start` が `end` より後なら空
+    """
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def imap_bounded(func, iterable, max_workers: int = 1, ordered: bool = False, processes: bool = False):
+    """スレッドプール(またはプロセスプール)で `func` を `iterable` の各要素に適用する
+
+    同時に投入するのは `max_workers` の数倍までで, 結果を取り出すにつれて次を投入する.
+    途中でgeneratorを閉じれば未着手のものはキャンセルされる.
+    `max_workers` が1以下ならスレッドを使わずに順番に実行する.
+
+    Args:
+        func: 1引数の関数
+        iterable: 引数のiterable
+        max_workers(int): スレッド数の上限
+        ordered(bool): Trueなら `iterable` の順序で返す. Falseなら終わった順に返す
+        processes(bool): Trueならプロセスプールを使う. `func` , 引数, 返り値はpicklableであること
+
+    Returns:
+        generator: `func` の返り値
+    """
+    if max_workers is None or max_workers <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+    items = iter(iterable)
+    if processes:
+        # multiprocessingは読み込みが重いので, プロセスプールを使う時に読み込む
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=_process_context())
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+    with executor:
+        def submit(n):
+            for item in islice(items, n):
+                futures.append(executor.submit(func, item))
+
+        futures = deque()
+        submit(max_workers * _PREFETCH)
+        try:
+            while futures:
+                if ordered:
+                    done = [futures.popleft()]
+                else:
+                    finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    done = [future for future in futures if future in finished]
+                    for future in done:
+                        futures.remove(future)
+                submit(len(done))
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def imap_pipelined(fetch, parse, iterable, fetch_workers: int = 1, parse_workers: int = 1,
+                   ordered: bool = False, queue_size: int = None):
+    """取得(スレッドプール)とパース(プロセスプール)を別々の段として並列に動かす
+
+    `fetch` をスレッドで `iterable` の各要素に適用し, 結果を長さに上限のあるキューに入れる.
+    キューから取り出したものにはプロセスプールで `parse` を適用する.
+    パースが追いつかなければキューが埋まって取得が止まる(backpressure).
+    途中でgeneratorを閉じれば両方の段を止める.
+
+    Args:
+        fetch: 1引数の関数. スレッドで実行する
+        parse: 1引数の関数. プロセスで実行するので, 関数, 引数, 返り値はpicklableであること
+        iterable: `fetch` の引数のiterable
+        fetch_workers(int): 取得するスレッド数
+        parse_workers(int): パースするプロセス数. 1以下ならプロセスを使わずに順番にパースする
+        ordered(bool): Trueなら `iterable` の順序で返す
+        queue_size(int): 取得してパース待ちのものの数の上限. Noneなら両方の段のワーカー数から決める
+
+    Returns:
+        generator: `parse` の返り値
+    """
+    fetched = queue.Queue(maxsize=queue_size or (fetch_workers + parse_workers) * _PREFETCH)
+    stop = threading.Event()
+
+    def produce():
+        results = imap_bounded(fetch, iterable, max_workers=fetch_workers, ordered=ordered)
+        try:
+            for result in results:
+                if not put_until_stopped(fetched, result, stop):
+                    return
+        except BaseException as e:
+            put_until_stopped(fetched, Failure(e), stop)
+            return
+        finally:
+            results.close()
+        put_until_stopped(fetched, DONE, stop)
+
+    def consume():
+        while True:
+            item = fetched.get()
+            if item is DONE:
+                return
+            if isinstance(item, Failure):
+                raise item.error
+            yield item
+
+    producer = threading.Thread(target=produce, name='imap_pipelined', daemon=True)
+    producer.start()
+    try:
+        yield from imap_bounded(parse, consume(), max_workers=parse_workers, ordered=ordered, processes=True)
+    finally:
+        stop.set()
+        producer.join()
+
+
+# スレッド間のキュー( `imap_pipelined` , `adapters.aggregate` )の終わりの印
+DONE = object()
+
+
+class Failure:
+    """キューで受け渡す, 別のスレッドで起きた例外
+
+    Attributes:
+        error(:obj:`BaseException`): 起きた例外
+    """
+    __slots__ = ('error',)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def put_until_stopped(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """キューが空くまで待って `item` を入れる
+
+    Args:
+        q(queue.Queue): 上限のあるキュー
+        item: 入れるもの
+        stop(threading.Event): 止める印. 受け取る側がやめたらsetする
+
+    Returns:
+        bool: 入れたらTrue. 入れる前に止められたらFalse
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _process_context():
+    """プロセスプールの開始方法
+
+    取得のスレッドが動いている中でforkしないように, 使えればforkserverを使う.
+    """
+    import multiprocessing
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context()
+
+
 def parse_str_to_time(time_text: str):
     """京大イベントページで見られる形式の時刻文字列をdatetimeに変換する
 
     'n時m分～k時l分' の形をとるものを処理する.
+    'n時m分' だけの場合は開始, 終了とも同じ時刻になる.
 
     Args:
         time_text(str): 時刻文字列
@@ -48,82 +262,123 @@ def parse_str_to_time(time_text: str):
     Raises:
         ValueError: `time_text` が正規表現にマッチしない場合.
     """
-    pattern = (r'.*?(?P<hour_start>\d+)時(?P<minute_start>\d+)分～'
-               r'.*?(?P<hour_end>\d+)時(?P<minute_end>\d+)分'
-               )
-    pattern2 = (r'.*?(?P<hour_start>\d+)時(?P<minute_start>\d+)分'
-                )
-
-    match = re.match(pattern, time_text)
-    match2 = re.match(pattern2, time_text)
-    if match is None:
-        # パターン1に合わなかったらパターン2を使う
-        match = match2
-    elif match2 is None:
-        # パターンにマッチしなければ例外を返す
-        raise ValueError
-    jst = pytz.timezone('Asia/Tokyo')
-    hour_start = int(match.group('hour_start'))
-    minute_start = int(match.group('minute_start'))
-    if match is match2:
-        hour_end = hour_start
-        minute_end = minute_start
-    else:
-        hour_end = int(match.group('hour_end'))
-        minute_end = int(match.group('minute_end'))
-    # 抽出結果からそれぞれのdatetimeオブジェクトを生成
-    # タイムゾーンは'Asia/Tokyo'を用いる
-    start = datetime.time(hour_start, minute_start, tzinfo=jst)
-    end = datetime.time(hour_end, minute_end, tzinfo=jst)
+    start, end = _parse_time(time_text)
     # 辞書に格納して返す
     return {'start': start, 'end': end}
 
 
 def parse_str_to_date(date_text: str):
-    """京大イベントページで見られる形式の文字列をdatetimeに変換する
+    """京大イベントページで見られる形式の日付文字列をdateに変換する
 
-    'n時m分～k時l分' の形をとるものを処理する.
+    'YYYY年MM月DD日 〜 YYYY年MM月DD日' の形をとるものを処理する.
+    'YYYY年MM月DD日' だけの場合は開始, 終了とも同じ日になる.
 
     Args:
-        date_text(str): 時刻文字列
+        date_text(str): 日付文字列
 
     Returns:
-        dict: 開始, 終了時刻の `datetime.time` を格納した辞書
+        dict: 開始, 終了日の `datetime.date` を格納した辞書
 
-    {"start": :obj:`datetime.time` , "end": :obj:`datetime.time` }
+    {"start": :obj:`datetime.date` , "end": :obj:`datetime.date` }
 
     Raises:
-        ValueError: `time_text` が正規表現にマッチしない場合.
+        ValueError: `date_text` が正規表現にマッチしない場合.
     """
-    # 2019年06月04日 火曜日 〜 2019年07月16日 火曜日
-    pattern = (r'.*?(?P<year_start>\d+)年(?P<month_start>\d+)月(?P<day_start>\d+)日.*?〜'
-               r'.*?(?P<year_end>\d+)年(?P<month_end>\d+)月(?P<day_end>\d+)日.*'
-               )
-    pattern2 = (r'.*?(?P<year_start>\d+)年(?P<month_start>\d+)月(?P<day_start>\d+)日.*'
-                )
-
-    match = re.match(pattern, date_text)
-    match2 = re.match(pattern2, date_text)
-    if match is None:
-        # パターン1に合わなかったらパターン2を使う
-        match = match2
-        if match is None:
-            # パターンにマッチしなければ例外を返す
-            raise ValueError
-    year_start = int(match.group('year_start'))
-    month_start = int(match.group('month_start'))
-    day_start = int(match.group('day_start'))
-    if match is match2:
-        year_end = year_start
-        month_end = month_start
-        day_end = day_start
-    else:
-        year_end = int(match.group('year_end'))
-        month_end = int(match.group('month_end'))
-        day_end = int(match.group('day_end'))
-    # 抽出結果からそれぞれのdatetimeオブジェクトを生成
-    # タイムゾーンは'Asia/Tokyo'を用いる
-    start = datetime.date(year=year_start, month=month_start, day=day_start)
-    end = datetime.date(year_end, month_end, day_end)
+    start, end = _parse_date(date_text)
     # 辞書に格納して返す
     return {'start': start, 'end': end}
+
+
+def parse_times_many(time_texts):
+    """ `parse_str_to_time` をまとめて行う
+
+    Args:
+        time_texts: 時刻文字列のiterable
+
+    Returns:
+        list: `parse_str_to_time` の結果. 読めなかった文字列はNone
+    """
+    return [_or_none(_parse_time, text) for text in time_texts]
+
+
+def parse_dates_many(date_texts):
+    """ `parse_str_to_date` をまとめて行う
+
+    Args:
+        date_texts: 日付文字列のiterable
+
+    Returns:
+        list: `parse_str_to_date` の結果. 読めなかった文字列はNone
+    """
+    return [_or_none(_parse_date, text) for text in date_texts]
+
+
+# 'n時m分' とその直後の'～'.
+# 数字の途中からは照合を始めないので, 長い数字の列があっても線形時間で済む
+_TIME = re.compile(r'(?<!\d)(\d+)時(\d+)分(～)?')
+# 'YYYY年MM月DD日' または '〜'
+_DATE = re.compile(r'(?<!\d)(\d+)年(\d+)月(\d+)日|〜')
+# 同じ文字列が何度も出てくるので結果を覚えておく
+_MEMO_SIZE = 4096
+
+
+@lru_cache(maxsize=_MEMO_SIZE)
+def _parse_time(time_text: str):
+    """時刻文字列を (開始, 終了) にする
+
+    以前の正規表現( `re.match` と `.*?` )と同じく1行目だけを見る.
+    最初の'n時m分～'とその次の'k時l分'を開始, 終了とし,
+    無ければ最初の'n時m分'を開始, 終了とする.
+    """
+    first = tilde = None
+    for match in _TIME.finditer(time_text.partition('\n')[0]):
+        if first is None:
+            first = match
+        if tilde is not None:
+            return _time(tilde), _time(match)
+        if match.group(3):
+            tilde = match
+    if first is None:
+        raise ValueError("no time in '{}'".format(time_text))
+    start = _time(first)
+    return start, start
+
+
+@lru_cache(maxsize=_MEMO_SIZE)
+def _parse_date(date_text: str):
+    """日付文字列を (開始, 終了) にする
+
+    以前の正規表現と同じく1行目だけを見る.
+    最初の日付と, その後の'〜'の後の最初の日付を開始, 終了とし,
+    無ければ最初の日付を開始, 終了とする.
+    """
+    first = None
+    tilde = False
+    for match in _DATE.finditer(date_text.partition('\n')[0]):
+        if match.group(1) is None:
+            tilde = first is not None
+        elif first is None:
+            first = match
+        elif tilde:
+            return _date(first), _date(match)
+    if first is None:
+        raise ValueError("no date in '{}'".format(date_text))
+    start = _date(first)
+    return start, start
+
+
+def _time(match) -> datetime.time:
+    # タイムゾーンは'Asia/Tokyo'を用いる
+    return datetime.time(int(match.group(1)), int(match.group(2)), tzinfo=_jst())
+
+
+def _date(match) -> datetime.date:
+    return datetime.date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+
+
+def _or_none(parse, text):
+    try:
+        start, end = parse(text)
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return {'start': start, 'end': end}
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""イベントの出力形式
+
+`parse_event` の `--format` で選ぶ, イベントを1件ずつストリームに書き出すwriter群.
+どのwriterもイベントを受け取った順にすぐ書き出し, 全体を溜め込まない.
+
+Example:
+
+    >>> import sys
+    >>> from kueventparser import api
+    >>> from kueventparser.writers import get_writer
+    >>> with get_writer('jsonl', sys.stdout) as writer:
+    ...     for event in api.generate_all(year=2019, month=2):
+    ...         writer.write(event)
+"""
+import csv
+import datetime
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+from kueventparser.events import FIELDS, Event, _jst
+# iCalendarの1行の上限(octets)
+_ICS_LINE = 75
+
+
+def event_to_record(event: Event, fields=FIELDS) -> dict:
+    """イベントをJSON等にできる辞書にする
+
+    日付はISO 8601の文字列, 時刻は '+09:00' 付きのISO 8601の文字列にする.
+    (pytzのtzinfoをそのまま `isoformat` すると '+09:19' になるため)
+
+    Args:
+        event(Event): イベント
+        fields: 出力するフィールド名. `FIELDS` のいずれか
+
+    Returns:
+        dict: `fields` をキーとする辞書
+    """
+    return {key: _CONVERTERS.get(key, _identity)(getattr(event, key)) for key in fields}
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def _identity(value):
+    return value
+
+
+def _time_isoformat(time: datetime.time):
+    if time is None:
+        return None
+    if time.tzinfo is None or time.utcoffset() is not None:
+        return time.isoformat()
+    # 日本時間のオフセットは日付に依らないので, 適当な日でlocalizeして決める
+    naive = datetime.datetime.combine(datetime.date(2000, 1, 1), time.replace(tzinfo=None))
+    offset = datetime.timezone(_jst().localize(naive).utcoffset())
+    return time.replace(tzinfo=offset).isoformat()
+
+
+# フィールド名 -> 出力用に変換する関数
+_CONVERTERS = {
+    'start_date': _isoformat,
+    'end_date': _isoformat,
+    'start': _time_isoformat,
+    'end': _time_isoformat,
+}
+
+
+class BaseWriter:
+    """writerの基底クラス
+
+    `write` で1件ずつ書き出し, `close` で終わりを書き出す.
+    Noneのイベント(イベント情報の無いページ)は書き出さない.
+    """
+
+    def __init__(self, stream, flush: bool = True, fields=None):
+        """イニシャライザー
+
+        Args:
+            stream: 書き出す先のテキストストリーム
+            flush(bool): 1件毎にflushするかどうか
+            fields: 出力するフィールド名. Noneなら全て( `FIELDS` ). JSON Lines, CSVのみ
+        """
+        self.stream = stream
+        self.flush = flush
+        self.fields = tuple(fields) if fields else FIELDS
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, event: Event):
+        """イベントを1件書き出す
+
+        Args:
+            event(Event): イベント
+        """
+        if event is None:
+            return
+        self.stream.write(self.format(event))
+        if self.flush:
+            self.stream.flush()
+
+    def format(self, event: Event) -> str:
+        """1件分の文字列を返す"""
+        raise NotImplementedError
+
+    def close(self):
+        """終わりを書き出す. ストリーム自体は閉じない"""
+
+
+class TextWriter(BaseWriter):
+    """イベント名を1行ずつ書き出す(以前の出力と同じく, Noneもそのまま書き出す)"""
+
+    def write(self, event: Event):
+        self.stream.write(self.format(event))
+        if self.flush:
+            self.stream.flush()
+
+    def format(self, event: Event) -> str:
+        return '{}\n'.format(event)
+
+
+class JSONLinesWriter(BaseWriter):
+    """JSON Lines. orjsonがあれば使う"""
+
+    def format(self, event: Event) -> str:
+        record = event_to_record(event, self.fields)
+        if orjson is not None:
+            return orjson.dumps(record).decode('utf-8') + '\n'
+        return json.dumps(record, ensure_ascii=False) + '\n'
+
+
+class CSVWriter(BaseWriter):
+    """CSV. 最初の行はヘッダ"""
+
+    def __init__(self, stream, flush: bool = True, fields=None):
+        super().__init__(stream, flush, fields)
+        self._writer = csv.DictWriter(stream, self.fields, lineterminator='\n')
+        self._writer.writeheader()
+
+    def write(self, event: Event):
+        if event is None:
+            return
+        self._writer.writerow(event_to_record(event, self.fields))
+        if self.flush:
+            self.stream.flush()
+
+
+class ICSWriter(BaseWriter):
+    """iCalendar(RFC 5545). 日時はUTCで書き出す"""
+
+    def __init__(self, stream, flush: bool = True, fields=None):
+        super().__init__(stream, flush, fields)
+        self._stamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        self.stream.write('BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//kueventparser//kueventparser//JA\r\n')
+
+    def format(self, event: Event) -> str:
+        lines = ['BEGIN:VEVENT',
+                 'UID:' + _ics_text(event.url),
+                 'DTSTAMP:' + self._stamp,
+                 'SUMMARY:' + _ics_text(event.title)]
+        if event.start_date is not None:
+            lines.append('DTSTART:' + _ics_datetime(event.start_datetime))
+            lines.append('DTEND:' + _ics_datetime(event.end_datetime))
+        if event.location:
+            lines.append('LOCATION:' + _ics_text(event.location))
+        if event.description:
+            lines.append('DESCRIPTION:' + _ics_text(event.description))
+        lines.append('URL:' + event.url)
+        lines.append('END:VEVENT')
+        return ''.join(_ics_fold(line) + '\r\n' for line in lines)
+
+    def close(self):
+        self.stream.write('END:VCALENDAR\r\n')
+        self.stream.flush()
+
+
+def _ics_datetime(value: datetime.datetime) -> str:
+    return value.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _ics_text(value: str) -> str:
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _ics_fold(line: str) -> str:
+    """75 octetsを超える行を折り返す(マルチバイト文字の途中では切らない)"""
+    if len(line.encode('utf-8')) <= _ICS_LINE:
+        return line
+    parts = []
+    current = ''
+    size = 0
+    # 2行目以降は先頭の空白の分だけ短くする
+    limit = _ICS_LINE
+    for char in line:
+        width = len(char.encode('utf-8'))
+        if size + width > limit:
+            parts.append(current)
+            current, size, limit = '', 0, _ICS_LINE - 1
+        current += char
+        size += width
+    parts.append(current)
+    return '\r\n '.join(parts)
+
+
+# 形式名 -> writer
+WRITERS = {
+    'text': TextWriter,
+    'jsonl': JSONLinesWriter,
+    'csv': CSVWriter,
+    'ics': ICSWriter,
+}
+
+
+def get_writer(format: str, stream, flush: bool = True, fields=None) -> BaseWriter:
+    """形式名からwriterを作る
+
+    Args:
+        format(str): `WRITERS` のキー
+        stream: 書き出す先のテキストストリーム
+        flush(bool): 1件毎にflushするかどうか
+        fields: 出力するフィールド名. Noneなら全て
+
+    Returns:
+        :obj:`BaseWriter`: writer
+
+    Raises:
+        ValueError: 未知の形式の場合.
+    """
+    try:
+        writer = WRITERS[format]
+    except KeyError:
+        raise ValueError("unknown format: '{}' (choose from {})".format(format, ', '.join(WRITERS)))
+    return writer(stream, flush=flush, fields=fields)
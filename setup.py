@@ -48,6 +48,10 @@ setup(
     python_requires=">=3.4",
     setup_requires=['setuptools >= 30.3'],
     install_requires=requires,
+    extras_require={
+        # JSON Linesの出力を速くする
+        'fast': ['orjson'],
+    },
     license=about['__license__'],
     zip_safe=False,
     classifiers=[
@@ -70,6 +74,8 @@ setup(
         'Topic :: Utilities'
     ],
     entry_points={
-        'console_scripts': ['parse_event= kueventparser.core:main']
+        'console_scripts': ['parse_event= kueventparser.core:main'],
+        # 名前で選べるfactory( `kueventparser.adapters.registry` を参照)
+        'kueventparser.adapters': ['official = kueventparser.adapters.official:OfficialEventFactory'],
     },
 )
@@ -1,4 +1,8 @@
 # content of conftest.py
+from os import path
+
+import pytest
+
 from kueventparser import events
 
 
@@ -38,3 +42,108 @@ def make_test_event(uri: str, ) -> events.Event:
                          description=description, start_date=s_date, end_date=e_date, start=start,
                          end=end)
     return event
+
+
+DATA_DIR = path.join(path.dirname(__file__), "data")
+CALENDAR_URL = "http://www.kyoto-u.ac.jp/ja/social/event/calendar/?year=2017&month=10"
+
+
+def read_data(name: str) -> bytes:
+    """テスト用データをbytesで読み込む.
+
+    Args:
+        name(str): `tests/data` 以下のファイル名
+
+    Returns:
+        bytes: ファイルの中身
+    """
+    with open(path.join(DATA_DIR, name), "rb") as f:
+        return f.read()
+
+
+def fake_pages() -> dict:
+    """オフラインテスト用の URL -> HTML の対応表.
+
+    カレンダー(2017年10月)に載っているイベントは全て `test_event1.html` を返す.
+    ただし `/bungaku/` のものだけはイベント情報の無いページを返す
+    (`_get_event` がNoneを返す).
+
+    Returns:
+        dict: URL -> bytes
+    """
+    from bs4 import BeautifulSoup
+
+    calendar = read_data("test_calendar1.html")
+    event = read_data("test_event1.html")
+    broken = b"<html><body><h1 class=\"title\">no detail</h1></body></html>"
+    pages = {CALENDAR_URL: calendar}
+    for a in BeautifulSoup(calendar, "lxml").select("td.event_of_day a"):
+        url = a.get("href")
+        pages[url] = broken if "/bungaku/" in url else event
+    return pages
+
+
+@pytest.fixture
+def offline():
+    """`fake_pages` を返すtransportをデフォルトにし, ネットワークを使わずにfactoryを動かす.
+
+    Returns:
+        list: 取得したURLの記録
+    """
+    from kueventparser.transports import MemoryTransport, set_default_transport
+
+    transport = MemoryTransport(fake_pages())
+    set_default_transport(transport)
+    yield transport.requested
+    set_default_transport(None)
+
+
+@pytest.fixture
+def stand_in_server(monkeypatch):
+    """`fake_pages` を配信するローカルのHTTPサーバ.
+
+    京大HPのURLはサーバのURLに置き換えて配信し,
+    `OfficialEventFactory._template` もサーバを向くようにする.
+
+    Returns:
+        str: サーバのURL( `http://127.0.0.1:port` )
+    """
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlsplit
+
+    from kueventparser.adapters.official import OfficialEventFactory
+
+    pages = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            body = pages.get(self.path)
+            status = 200 if body is not None else 404
+            body = body if body is not None else b"not found"
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    base = "http://127.0.0.1:{}".format(server.server_address[1])
+    origin = "http://www.kyoto-u.ac.jp"
+    for url, body in fake_pages().items():
+        parts = urlsplit(url)
+        key = parts.path + ("?" + parts.query if parts.query else "")
+        pages[key] = body.replace(origin.encode(), base.encode())
+    monkeypatch.setattr(OfficialEventFactory, "_template",
+                        OfficialEventFactory._template.replace(origin, base))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield base
+    server.shutdown()
+    server.server_close()
@@ -1,11 +1,38 @@
 """ 'obj:kueventparser.events' のテスト
 """
+import asyncio
+import datetime
+import time
 from os import path
 
-from kueventparser.adapters.official import OfficialEventFactory
+import pytest
+
+from kueventparser.adapters.base import EventPageError
+from kueventparser.adapters.official import PARSERS, OfficialEventFactory
+from kueventparser.transports import CHUNK_SIZE, MemoryTransport, StreamResponse
+from kueventparser.utils import content_to_soup
 from tests import conftest
 
 
+class StallingTransport(MemoryTransport):
+    """最初の塊を返した後, 読み込みのタイムアウトまで止まって失敗するtransport"""
+
+    def __init__(self, pages):
+        super().__init__(pages)
+        self.timeouts = []
+
+    def stream(self, url, headers=None, chunk_size=CHUNK_SIZE, timeout=None):
+        self.timeouts.append(timeout)
+        r = super().stream(url, headers=headers, chunk_size=chunk_size)
+
+        def chunks():
+            yield next(r.iter_content())
+            time.sleep(timeout or 0)
+            raise IOError("read timed out")
+
+        return StreamResponse(r.url, r.status_code, r.headers, chunks())
+
+
 class TestKUEventManager:
     """ 'obj:kueventparser.events.OfficialEventFactory' のテスト
     """
@@ -21,3 +48,262 @@ class TestKUEventManager:
                                                     "/yasei/events/2017/171030_2140.html")
         # 何故か is が使えないのでクラスの定義から直接判別する.
         assert assert_event == event
+
+    def test_get_event_offline(self, offline):
+        uri = path.join(path.dirname(__file__), "data", "test_event1.xml")
+        assert_event = conftest.make_test_event(uri)
+        event = OfficialEventFactory._get_event(url=assert_event.url)
+        assert assert_event == event
+
+    def test_parsers(self, offline):
+        uri = path.join(path.dirname(__file__), "data", "test_event1.xml")
+        assert_event = conftest.make_test_event(uri)
+        content = conftest.read_data("test_event1.html")
+        for parser in PARSERS:
+            # 文字コードの指定の有無に関わらず同じイベントになる
+            assert OfficialEventFactory._get_event(url=assert_event.url, parser=parser) == assert_event
+            assert OfficialEventFactory._parse_page(assert_event.url, content, None, parser) == assert_event
+        broken = b'<html><body><h1 class="title">title</h1></body></html>'
+        assert all(OfficialEventFactory._parse_page("x", broken, None, parser) is None for parser in PARSERS)
+        # イベント名の無いページ(エラーページ等)はどの解析方法でも同じ例外
+        untitled = b'<html><body><p>not found</p></body></html>'
+        for parser in PARSERS:
+            with pytest.raises(EventPageError):
+                OfficialEventFactory._parse_page("x", untitled, None, parser)
+        with pytest.raises(ValueError):
+            OfficialEventFactory._parse_page(assert_event.url, content, None, "html5")
+
+    def test_generate_all_workers(self, offline):
+        start, end = datetime.date(2017, 10, 1), datetime.date(2017, 10, 31)
+        serial = OfficialEventFactory.generate_all(start, end, max_workers=1)
+        urls = [event.url for event in serial]
+        # 重複無し, 要旨の無いページは除かれる
+        assert len(urls) == len(set(urls))
+        assert not any("/bungaku/" in url for url in urls)
+        # 1スレッドなら毎回同じ順序(カレンダー順)
+        assert urls == [event.url for event in OfficialEventFactory.generate_all(start, end)]
+        parallel = OfficialEventFactory.generate_all(start, end, max_workers=4)
+        assert sorted(urls) == sorted(event.url for event in parallel)
+        ordered = OfficialEventFactory.generate_all(start, end, max_workers=4, ordered=True)
+        assert urls == [event.url for event in ordered]
+
+    def test_generate_all_pipelined(self, offline):
+        from kueventparser.stats import Stats
+        start, end = datetime.date(2017, 10, 1), datetime.date(2017, 10, 31)
+        events = OfficialEventFactory.get_all(start, end, ordered=True)
+        stats = Stats()
+        # 取得は2スレッド, パースは2プロセス
+        pipelined = OfficialEventFactory.get_all(start, end, max_workers=2, ordered=True, parse_workers=2,
+                                                 parser="lxml", stats=stats)
+        assert pipelined == events
+        assert stats.counters["events"] == len(events)
+        assert stats.summary()["stages"]["event.parse"]["count"] == stats.counters["pages"] - 1
+        unordered = OfficialEventFactory.generate_all(start, end, max_workers=2, parse_workers=2)
+        assert sorted(event.url for event in unordered) == sorted(event.url for event in events)
+
+    def test_fields(self, offline):
+        import pickle
+        from kueventparser.events import Event, LazyEvent
+
+        start, end = datetime.date(2017, 10, 1), datetime.date(2017, 10, 31)
+        events = OfficialEventFactory.get_all(start, end, ordered=True)
+        for parser in PARSERS:
+            projected = OfficialEventFactory.get_all(start, end, ordered=True, parser=parser,
+                                                     fields=("title", "url", "start_date"))
+            assert [(e.url, e.start_date, e.end) for e in projected] == [(e.url, e.start_date, e.end) for e in events]
+            assert all(e.location is None and e.description is None for e in projected)
+        with pytest.raises(ValueError):
+            OfficialEventFactory.get_all(start, end, fields=("summary",))
+
+        lazy = OfficialEventFactory.get_all(start, end, ordered=True, lazy=True)
+        assert all(isinstance(e, LazyEvent) and not e.loaded for e in lazy)
+        assert [e.location for e in lazy] == [e.location for e in events]
+        assert not lazy[0].loaded
+        # 参照した時にページを取得し直して取り出す
+        assert lazy[0].description == events[0].description and lazy[0].loaded
+        assert lazy == events
+        # pickleすると普通のEventになる
+        restored = pickle.loads(pickle.dumps(lazy[1]))
+        assert type(restored) is Event and restored == events[1]
+
+    def test_get_many(self, offline):
+        from kueventparser import api
+        from kueventparser.stats import Stats
+
+        urls = [url for url in conftest.fake_pages() if "/events/" in url]
+        stats = Stats()
+        outcomes = api.get_many(urls + urls[::-1] + ["http://example.com/gone"], max_workers=4, stats=stats)
+        # 重複を除き, 入力の順に返す
+        assert [outcome.url for outcome in outcomes] == urls + ["http://example.com/gone"]
+        assert len(offline) == len(urls) + 1
+        for outcome in outcomes[:-1]:
+            if "/bungaku/" in outcome.url:
+                assert outcome.status == "skipped" and outcome.event is None
+            else:
+                assert outcome.ok and outcome.event == OfficialEventFactory.get(outcome.url)
+        assert outcomes[-1].status == "failed" and outcomes[-1].error is not None
+        assert stats.counters["events.failed"] == 1
+        with pytest.raises(ValueError):
+            OfficialEventFactory.get_many(urls, fields=("summary",))
+
+    def test_agenerate_all(self, stand_in_server):
+        from kueventparser import api
+
+        async def main():
+            events = [event async for event in api.agenerate_all(year=2017, month=10)]
+            ordered = await api.aget_all(year=2017, month=10, max_workers=2, ordered=True)
+            return events, ordered
+
+        events, ordered = asyncio.run(main())
+        serial = OfficialEventFactory.get_all(datetime.date(2017, 10, 1), datetime.date(2017, 10, 31))
+        assert sorted(event.url for event in events) == sorted(event.url for event in serial)
+        assert [event.url for event in ordered] == [event.url for event in serial]
+        assert all(event.url.startswith(stand_in_server) for event in events)
+
+    def test_agenerate_all_parse_off_loop(self, stand_in_server, monkeypatch):
+        import threading
+
+        from kueventparser import api
+        from kueventparser.core import prepare
+
+        threads = set()
+        parse_page = OfficialEventFactory._parse_page.__func__
+
+        def recorded(cls, *args, **kwargs):
+            threads.add(threading.current_thread())
+            return parse_page(cls, *args, **kwargs)
+
+        monkeypatch.setattr(OfficialEventFactory, "_parse_page", classmethod(recorded))
+
+        async def main():
+            return await api.aget_all(year=2017, month=10, max_workers=2)
+
+        assert asyncio.run(main())
+        # パースはイベントループのスレッドでは行わない
+        assert threads and threading.main_thread() not in threads
+        for option, value in (("cache_dir", "cache"), ("max_rate", 1.0), ("record", "pages.kuea")):
+            with pytest.raises(ValueError, match=option):
+                prepare('official', 'agenerate_all', year=2017, month=10, **{option: value})
+
+    def test_calendar_error(self, stand_in_server):
+        from kueventparser import api
+        from kueventparser.transports import HTTPError
+
+        pages = conftest.fake_pages()
+        del pages[conftest.CALENDAR_URL]
+        # エラーページを空のカレンダーとして扱わない
+        with pytest.raises(HTTPError):
+            OfficialEventFactory.get_all(datetime.date(2017, 10, 1), datetime.date(2017, 10, 31),
+                                         transport=MemoryTransport(pages))
+
+        async def main():
+            return await api.aget_all(year=2017, month=9)
+
+        with pytest.raises(HTTPError):
+            asyncio.run(main())
+
+    def test_parse_calendar(self):
+        soup = content_to_soup(conftest.read_data("test_calendar1.html"))
+        index = OfficialEventFactory._parse_calendar(soup, 2017, 10)
+        # 1日のイベントに10日台のイベントが混ざらない
+        assert len(index[datetime.date(2017, 10, 1)]) == 1
+        assert "/kokusai/" in index[datetime.date(2017, 10, 1)][0]
+        # 月末も含まれる
+        assert len(index[datetime.date(2017, 10, 31)]) == 2
+        assert index[datetime.date(2017, 10, 2)] == []
+        urls = list(OfficialEventFactory._get_events_urls(datetime.date(2017, 10, 31),
+                                                          datetime.date(2017, 10, 31), soup))
+        assert urls == index[datetime.date(2017, 10, 31)]
+
+    def test_generate_all_multi_month(self):
+        from kueventparser.transports import MemoryTransport
+
+        pages = conftest.fake_pages()
+        november = conftest.CALENDAR_URL.replace("month=10", "month=11")
+        yasei = [url for url in pages if "/yasei/" in url][0]
+        later = yasei.replace("171030_2140", "171120_1000")
+        pages[later] = pages[yasei]
+        # 10月末から続くイベントは11月のカレンダーにも載っている
+        rows = "".join(
+            '<tr><td class="day">{}</td><td class="event_of_day"><a href="{}">e</a></td></tr>'.format(
+                day, yasei if day < 10 else later) for day in range(1, 31))
+        pages[november] = "<table>{}</table>".format(rows).encode()
+        transport = MemoryTransport(pages)
+        events = OfficialEventFactory.get_all(datetime.date(2017, 10, 30), datetime.date(2017, 11, 2),
+                                              max_workers=4, transport=transport)
+        assert {conftest.CALENDAR_URL, november} <= set(transport.requested)
+        # 月をまたいでも各イベントページは一度しか取得しない
+        event_pages = transport.requested[2:]
+        assert len(event_pages) == len(set(event_pages))
+        assert sorted(event.url for event in events) == sorted(set(event_pages) - {
+            url for url in event_pages if "/bungaku/" in url})
+        # 期間外のイベントは取得しない
+        assert not any("171001" in url or "171120" in url for url in event_pages)
+        assert yasei in event_pages
+
+    def test_generate_all_lazy(self):
+        from kueventparser.transports import MemoryTransport
+
+        start, end = datetime.date(2017, 10, 1), datetime.date(2017, 10, 31)
+        transport = MemoryTransport(conftest.fake_pages())
+        events = OfficialEventFactory.generate_all(start, end, transport=transport)
+        # 呼び出しただけでは取得しない
+        assert transport.requested == []
+        next(events)
+        events.close()
+        # カレンダーと最初のイベントページだけ
+        assert len(transport.requested) == 2
+
+        total = len(OfficialEventFactory.get_calendar(2017, 10, transport=transport).urls(start, end))
+        transport = MemoryTransport(conftest.fake_pages())
+        events = OfficialEventFactory.generate_all(start, end, max_workers=2, transport=transport)
+        next(events)
+        events.close()
+        assert len(transport.requested) < total + 1
+
+    def test_stream(self):
+        from kueventparser.stats import Stats
+        from kueventparser.transports import MemoryTransport
+
+        pages = conftest.fake_pages()
+        url = [url for url in pages if "/yasei/" in url][0]
+        # 末尾に大きなマークアップが続くページ
+        pages[url] = pages[url].replace(b"</body>", b"<p>" + b"x" * 10 ** 6 + b"</p></body>")
+        expected = OfficialEventFactory.get(url, transport=MemoryTransport(pages), parser="lxml")
+        for fields in (None, ("title",), ("location",)):
+            stats = Stats()
+            event = OfficialEventFactory.get(url, transport=MemoryTransport(pages), parser="stream",
+                                             fields=fields, stats=stats)
+            assert event == OfficialEventFactory.get(url, transport=MemoryTransport(pages), parser="lxml",
+                                                     fields=fields)
+            # 要るフィールドを読み終えたら残りは受け取らない
+            assert stats.counters["stream.stopped"] == 1
+            assert stats.counters["bytes"] < 10 ** 5
+        assert OfficialEventFactory._parse_page(url, pages[url], None, "stream") == expected
+
+        # 上限を超えたページはそこでやめる. negative cacheには記録しない
+        stats = Stats()
+        assert OfficialEventFactory.get(url, transport=MemoryTransport(pages), parser="stream", max_bytes=300,
+                                        stats=stats) is None
+        assert stats.counters["stream.truncated"] == 1 and stats.counters["bytes"] == 300
+        # 先頭に大きなマークアップがあるページ
+        padded = dict(pages)
+        padded[url] = pages[url].replace(b'<div id="main">', b"<div>" + b"x" * 10 ** 5 + b'</div><div id="main">')
+        assert OfficialEventFactory.get(url, transport=MemoryTransport(padded), parser="stream") == expected
+        stats = Stats()
+        assert OfficialEventFactory.get(url, transport=MemoryTransport(padded), parser="stream", max_parse_time=0,
+                                        stats=stats) is None
+        assert stats.counters["stream.truncated"] == 1 and stats.counters["bytes"] < 10 ** 5
+        # 応答の途中で止まるサーバも `max_parse_time` で諦める
+        stalling = StallingTransport(padded)
+        stats = Stats()
+        assert OfficialEventFactory.get(url, transport=stalling, parser="stream", max_parse_time=0.05,
+                                        stats=stats) is None
+        assert stalling.timeouts == [0.05] and stats.counters["stream.truncated"] == 1
+        with pytest.raises(IOError):
+            OfficialEventFactory.get(url, transport=stalling, parser="stream")
+
+        events = OfficialEventFactory.get_all(datetime.date(2017, 10, 1), datetime.date(2017, 10, 31), ordered=True,
+                                              transport=MemoryTransport(pages), parser="stream", parse_workers=2)
+        assert events == OfficialEventFactory.get_all(datetime.date(2017, 10, 1), datetime.date(2017, 10, 31),
+                                                      ordered=True, transport=MemoryTransport(pages), parser="lxml")
@@ -0,0 +1,166 @@
+""" 'obj:kueventparser.adapters.aggregate' , 'obj:kueventparser.adapters.registry' のテスト
+"""
+import datetime
+import threading
+
+import pytest
+
+from kueventparser import api, core
+from kueventparser.adapters import registry
+from kueventparser.adapters.aggregate import AggregateEventFactory, SourceWarning
+from kueventparser.adapters.base import EventFactoryMixin
+from kueventparser.adapters.official import OfficialEventFactory
+from kueventparser.events import Event
+from kueventparser.stats import Stats
+
+START = datetime.date(2017, 10, 1)
+END = datetime.date(2017, 10, 31)
+
+
+def make_event(url, day=1):
+    return Event(url, url, None, None, datetime.date(2017, 10, day), None, None, None)
+
+
+class DepartmentFactory(EventFactoryMixin):
+    """ `get_all` だけを持つfactory"""
+
+    @classmethod
+    def get_all(cls, start_date, end_date):
+        return [make_event("http://dept.example.com/1", 2), make_event("http://shared.example.com/", 3)]
+
+    @classmethod
+    def get(cls, url):
+        return make_event(url) if url.startswith("http://dept.") else None
+
+
+class SlowFactory(EventFactoryMixin):
+    released = threading.Event()
+
+    @classmethod
+    def generate_all(cls, start_date, end_date, max_workers=1):
+        yield make_event("http://shared.example.com/", 1)
+        cls.released.wait(5)
+        yield make_event("http://slow.example.com/1", 4)
+
+    @classmethod
+    def get_all(cls, start_date, end_date):
+        return list(cls.generate_all(start_date, end_date))
+
+    @classmethod
+    def get(cls, url):
+        return None
+
+
+class BrokenFactory(EventFactoryMixin):
+
+    @classmethod
+    def get_all(cls, start_date, end_date):
+        raise RuntimeError("down")
+
+    @classmethod
+    def get(cls, url):
+        raise RuntimeError("down")
+
+
+@pytest.fixture
+def registered():
+    registry.register("dept", DepartmentFactory)
+    registry.register("broken", "tests.test_aggregate:BrokenFactory")
+    yield
+    registry.unregister("dept")
+    registry.unregister("broken")
+
+
+def test_registry(registered):
+    assert {"official", "dept", "broken"} <= set(registry.names())
+    assert core.select_factory("broken") is BrokenFactory
+    # クラスもそのまま使える
+    assert core.select_factory(DepartmentFactory) is DepartmentFactory
+    with pytest.raises(ValueError):
+        core.select_factory("unknown")
+    with pytest.raises(ValueError):
+        core.select_factory(object)
+    with pytest.raises(ValueError):
+        registry.register("a,b", DepartmentFactory)
+    with pytest.raises(ValueError):
+        registry.register("event", Event)
+
+
+def test_aggregate(registered):
+    factory = core.select_factory("dept, broken")
+    assert factory is AggregateEventFactory.of(DepartmentFactory, BrokenFactory)
+    stats = Stats()
+    # 失敗したfactoryがあっても残りのイベントを返す
+    with pytest.warns(SourceWarning):
+        events = api.get_all("dept,broken", year=2017, month=10, ordered=True, stats=stats)
+    assert [event.url for event in events] == ["http://dept.example.com/1", "http://shared.example.com/"]
+    assert stats.counters["sources.failed"] == 1
+    with pytest.warns(SourceWarning):
+        assert api.get(["broken", "dept"], url="http://dept.example.com/2").url == "http://dept.example.com/2"
+    # 全て失敗すれば例外
+    with pytest.warns(SourceWarning), pytest.raises(RuntimeError):
+        api.get_all(["broken"], year=2017, month=10)
+
+
+def test_aggregate_streams(registered):
+    SlowFactory.released.clear()
+    stats = Stats()
+    events = AggregateEventFactory.of(SlowFactory, "dept").generate_all(START, END, max_workers=2, stats=stats)
+    # 遅いfactoryを待たずに他のfactoryのイベントを返す
+    urls = {next(events).url for _ in range(2)}
+    assert urls == {"http://shared.example.com/", "http://dept.example.com/1"}
+    SlowFactory.released.set()
+    urls |= {event.url for event in events}
+    assert urls == {"http://shared.example.com/", "http://dept.example.com/1", "http://slow.example.com/1"}
+    assert stats.counters["events.duplicate"] == 1
+
+    # 待ちきれないfactoryは諦める
+    SlowFactory.released.clear()
+    factory = AggregateEventFactory.of(SlowFactory, DepartmentFactory, timeout=0.2)
+    with pytest.warns(SourceWarning):
+        urls = {event.url for event in factory.get_all(START, END)}
+    SlowFactory.released.set()
+    assert "http://slow.example.com/1" not in urls and "http://dept.example.com/1" in urls
+
+    # 全て待ちきれなくても, 届いたイベントは返す
+    SlowFactory.released.clear()
+    stats = Stats()
+    factory = AggregateEventFactory.of(SlowFactory, timeout=0.2)
+    with pytest.warns(SourceWarning):
+        events = factory.get_all(START, END, stats=stats)
+    SlowFactory.released.set()
+    assert [event.url for event in events] == ["http://shared.example.com/"]
+    assert stats.counters["sources.failed"] == 1
+
+    # api, CLIからも指定できる
+    SlowFactory.released.clear()
+    with pytest.warns(SourceWarning):
+        events = api.get_all([SlowFactory, DepartmentFactory], year=2017, month=10, timeout=0.2)
+    SlowFactory.released.set()
+    assert "http://slow.example.com/1" not in {event.url for event in events}
+    assert core.select_factory("official,dept", timeout=1.5).timeout == 1.5
+    assert core.select_factory("dept", timeout=1.5) is DepartmentFactory
+
+
+def test_aggregate_timeout_cli(registered, monkeypatch, capsys):
+    import sys
+
+    SlowFactory.released.clear()
+    registry.register("slow", SlowFactory)
+    monkeypatch.setattr(sys, "argv", ["parse_event", "slow,dept", "get_all", "-y", "2017", "-m", "10",
+                                      "--timeout", "0.2", "--format", "jsonl"])
+    try:
+        with pytest.warns(SourceWarning):
+            core.main()
+    finally:
+        SlowFactory.released.set()
+        registry.unregister("slow")
+    out = capsys.readouterr()[0]
+    assert "http://dept.example.com/1" in out and "http://slow.example.com/1" not in out
+
+
+def test_aggregate_official(offline, registered):
+    events = api.get_all("official,dept", year=2017, month=10)
+    official = OfficialEventFactory.get_all(START, END)
+    assert {event.url for event in events} == {event.url for event in official} | {
+        "http://dept.example.com/1", "http://shared.example.com/"}
@@ -0,0 +1,88 @@
+""" 'obj:kueventparser.archive' のテスト
+"""
+import datetime
+
+import pytest
+
+from kueventparser.adapters.official import OfficialEventFactory
+from kueventparser.archive import Archive, ArchiveError, RecordingTransport, ReplayTransport
+from kueventparser.core import prepare
+from kueventparser.transports import MemoryTransport
+from tests import conftest
+
+START = datetime.date(2017, 10, 1)
+END = datetime.date(2017, 10, 31)
+
+
+def record(path):
+    pages = conftest.fake_pages()
+    with RecordingTransport(MemoryTransport(pages), path) as transport:
+        events = list(OfficialEventFactory.generate_all(START, END, transport=transport, ordered=True))
+    return pages, events
+
+
+def test_record_replay(tmpdir):
+    path = str(tmpdir.join("pages.kuea"))
+    pages, events = record(path)
+    with Archive(path) as archive:
+        assert set(archive.urls()) == set(pages)
+        record_ = archive.get(conftest.CALENDAR_URL)
+        assert record_.content == pages[conftest.CALENDAR_URL]
+        assert record_.headers["content-type"] == "text/html; charset=utf-8"
+        assert record_.fetched_at > 0
+
+    transport = ReplayTransport(path)
+    assert transport.get("http://example.com/").status_code == 404
+    replayed = list(OfficialEventFactory.generate_all(START, END, transport=transport, ordered=True))
+    assert replayed == events
+    transport.close()
+
+    # プロセスプールでパースし直しても同じ
+    for max_workers in (1, 2):
+        assert list(OfficialEventFactory.generate_replayed(path, START, END, max_workers=max_workers,
+                                                           ordered=True, parser="lxml")) == events
+
+
+def test_append_and_truncated(tmpdir):
+    path = str(tmpdir.join("pages.kuea"))
+    record(path)
+    record(path)
+    with Archive(path) as archive:
+        count = len(archive)
+        assert count == 2 * len(archive.urls())
+    # 書き込み途中で止まったレコードは読み飛ばす
+    with open(path, "ab") as f:
+        f.write(b"\x00\x00\x00\x10\x00")
+    with Archive(path) as archive:
+        assert len(archive) == count
+
+    not_archive = tmpdir.join("not.kuea")
+    not_archive.write_binary(b"<html></html>")
+    with pytest.raises(ArchiveError):
+        Archive(str(not_archive))
+
+
+def test_prepare_replay(tmpdir):
+    path = str(tmpdir.join("pages.kuea"))
+    record(path)
+    _, method, kwargs = prepare('official', 'generate_all', year=2017, month=10, replay=path)
+    assert method == 'generate_replayed'
+    assert kwargs['archive'] == path and 'transport' not in kwargs
+    _, method, kwargs = prepare('official', 'get', url=conftest.CALENDAR_URL, replay=path)
+    assert isinstance(kwargs['transport'], ReplayTransport)
+    with pytest.raises(ValueError):
+        prepare('official', 'aget', url=conftest.CALENDAR_URL, replay=path)
+
+
+def test_prepare_record_with_cache(tmpdir, offline):
+    path = str(tmpdir.join("pages.kuea"))
+    counts = []
+    for _ in range(2):
+        factory, method, kwargs = prepare('official', 'get_all', year=2017, month=10,
+                                          cache_dir=str(tmpdir.join("cache")), record=path)
+        events = getattr(factory, method)(**kwargs)
+        kwargs['transport'].close()
+        with Archive(path) as archive:
+            counts.append(len(archive))
+    # 2回目はキャッシュから返すので, 記録は増えない
+    assert events and counts[0] == len(set(offline)) and counts[1] == counts[0]
@@ -0,0 +1,95 @@
+""" 'obj:kueventparser.cache' のテスト
+"""
+import datetime
+
+from kueventparser.adapters.official import OfficialEventFactory
+from kueventparser.cache import CachingTransport, HTTPCache
+from kueventparser.transports import BaseTransport, MemoryTransport, Response
+from tests import conftest
+
+
+class ETagTransport(BaseTransport):
+    """ETagを返し, If-None-Matchが一致すれば304を返すtransport"""
+
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, headers=None):
+        headers = headers or {}
+        self.requests.append(headers)
+        if headers.get("If-None-Match") == '"v1"':
+            return Response(url, 304, {"ETag": '"v1"'}, b"")
+        return Response(url, 200, {"ETag": '"v1"', "Content-Type": "text/html"}, b"<html>v1</html>")
+
+
+def test_revalidate(tmpdir):
+    url = "http://www.kyoto-u.ac.jp/ja/social/events_news/a.html"
+    inner = ETagTransport()
+    cache = HTTPCache(str(tmpdir), default_ttl=0)
+    transport = CachingTransport(inner, cache)
+    assert transport.get(url).content == b"<html>v1</html>"
+    # 期限切れなので条件付きGETで再検証される
+    r = transport.get(url)
+    assert r.status_code == 200
+    assert r.content == b"<html>v1</html>"
+    assert inner.requests[1] == {"If-None-Match": '"v1"'}
+    assert (cache.hits, cache.misses, cache.revalidated) == (1, 1, 1)
+    assert cache.hit_rate == 0.5
+
+
+def test_ttl_rules(tmpdir):
+    cache = HTTPCache(str(tmpdir))
+    transport = CachingTransport(ETagTransport(), cache)
+    transport.get(conftest.CALENDAR_URL)
+    # カレンダーは短く, イベントページは長い
+    assert cache.ttl(conftest.CALENDAR_URL) < cache.ttl("http://www.kyoto-u.ac.jp/ja/a.html")
+    assert cache.lookup(conftest.CALENDAR_URL)[1]
+
+
+def test_evict(tmpdir):
+    pages = {"http://example.com/{}".format(i): b"x" * 100 for i in range(5)}
+    cache = HTTPCache(str(tmpdir), max_bytes=250)
+    transport = CachingTransport(MemoryTransport(pages), cache)
+    for url in pages:
+        transport.get(url)
+    assert cache.size() <= 250
+    # 最近使ったものが残る
+    assert cache.lookup("http://example.com/4") is not None
+    assert cache.lookup("http://example.com/0") is None
+
+
+def test_negative_cache(tmpdir):
+    inner = MemoryTransport(conftest.fake_pages())
+    transport = CachingTransport(inner, HTTPCache(str(tmpdir)))
+    start, end = datetime.date(2017, 10, 1), datetime.date(2017, 10, 31)
+    first = OfficialEventFactory.get_all(start, end, transport=transport)
+    fetched = len(inner.requested)
+    second = OfficialEventFactory.get_all(start, end, transport=transport)
+    assert first == second
+    # 2回目は全てキャッシュから返る
+    assert len(inner.requested) == fetched
+    assert any(transport.cache.is_negative(url) for url in inner.requested if "/bungaku/" in url)
+
+
+class UnavailableTransport(MemoryTransport):
+    """最初の `failures` 回はメンテナンス中のページを500で返すtransport"""
+
+    def __init__(self, pages, failures=1):
+        super().__init__(pages)
+        self.failures = failures
+
+    def get(self, url, headers=None):
+        if self.failures:
+            self.failures -= 1
+            return Response(url, 500, {}, b'<html><body><h1 class="title">maintenance</h1></body></html>')
+        return super().get(url, headers=headers)
+
+
+def test_negative_cache_status(tmpdir):
+    url = conftest.make_test_event(conftest.DATA_DIR + "/test_event1.xml").url
+    for parser in ("soup", "stream"):
+        transport = CachingTransport(UnavailableTransport(conftest.fake_pages()), HTTPCache(str(tmpdir.join(parser))))
+        assert OfficialEventFactory.get(url, transport=transport, parser=parser) is None
+        # 200以外はnegative cacheに記録しない
+        assert not transport.cache.is_negative(url)
+        assert OfficialEventFactory.get(url, transport=transport, parser=parser).url == url
@@ -0,0 +1,73 @@
+""" 'obj:kueventparser.core' のテスト
+"""
+import datetime as dt
+
+import pytest
+
+from kueventparser import core
+
+
+def test_select_date():
+    assert core.select_date(year=2019, month=2) == {
+        "start_date": dt.date(2019, 2, 1), "end_date": dt.date(2019, 2, 28)}
+    assert core.select_date(year=2019, month=2, day=3) == {
+        "start_date": dt.date(2019, 2, 3), "end_date": dt.date(2019, 2, 3)}
+    assert core.select_date(start_date=dt.date(2018, 12, 20), end_date=dt.date(2019, 1, 10)) == {
+        "start_date": dt.date(2018, 12, 20), "end_date": dt.date(2019, 1, 10)}
+    with pytest.raises(ValueError):
+        core.select_date(start_date=dt.date(2019, 1, 10), end_date=dt.date(2018, 12, 20))
+
+
+def test_get_many_cli(offline, tmpdir, monkeypatch, capsys):
+    import json
+    import sys
+
+    from tests import conftest
+
+    urls = [url for url in conftest.fake_pages() if "/events/" in url]
+    urls_file = tmpdir.join("urls.txt")
+    urls_file.write("\n".join(["# 再確認するURL", urls[0], "", urls[0]] + urls[1:] + ["http://example.com/gone"]))
+    monkeypatch.setattr(sys, "argv", ["parse_event", "get", "--urls-file", str(urls_file), "-j", "2",
+                                      "--format", "jsonl"])
+    with pytest.raises(SystemExit) as e:
+        core.main()
+    assert e.value.code == 1
+    out, err = capsys.readouterr()
+    records = [json.loads(line) for line in out.splitlines()]
+    # イベント情報の無いページと失敗したURLはstderrに書く
+    assert [record["url"] for record in records] == [url for url in urls if "/bungaku/" not in url]
+    assert "skipped\t" in err and "failed\thttp://example.com/gone" in err
+    assert "1 of {} urls failed".format(len(urls) + 1) in err
+
+
+def test_async_options(stand_in_server):
+    import asyncio
+
+    from kueventparser import api
+    from kueventparser.stats import Stats
+    from tests import conftest
+
+    url = conftest.make_test_event(conftest.DATA_DIR + "/test_event1.xml").url.replace(
+        "http://www.kyoto-u.ac.jp", stand_in_server)
+    stats = Stats()
+
+    async def main():
+        events = await api.aget_all(year=2017, month=10, max_workers=2, ordered=True, parser="lxml", stats=stats,
+                                    fields=("title",), lazy=False)
+        generated = [event async for event in api.agenerate_all(year=2017, month=10, max_workers=2,
+                                                                ordered=True, parser="stream", stats=stats,
+                                                                fields=("title",))]
+        event = await api.aget(url=url, parser="strainer", stats=stats, fields=("title",))
+        return events, generated, event
+
+    events, generated, event = asyncio.run(main())
+    assert events and [e.url for e in events] == [e.url for e in generated]
+    assert all(e.description is None for e in events)
+    assert event.url == url and stats.counters["events"] == len(events) * 2 + 1
+    # 同期版にしか無いオプションは分かるように断る
+    for method in ("aget", "aget_all", "agenerate_all"):
+        for option, value in (("lazy", True), ("max_bytes", 1024), ("max_parse_time", 1.0)):
+            with pytest.raises(ValueError, match=option):
+                core.prepare("official", method, url=url, **{option: value})
+    with pytest.raises(ValueError, match="parse_workers"):
+        api.aget_all(year=2017, month=10, parse_workers=0)
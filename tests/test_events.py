@@ -0,0 +1,50 @@
+""" 'obj:kueventparser.events' のテスト
+"""
+import pickle
+from os import path
+
+import pytest
+
+from kueventparser.events import Event
+from tests import conftest
+
+
+def _event():
+    return conftest.make_test_event(path.join(path.dirname(__file__), "data", "test_event1.xml"))
+
+
+def test_dict_round_trip():
+    event = _event()
+    assert Event(**event.dict()) == event
+    with pytest.raises(AttributeError):
+        event.extra = 1
+
+
+def test_hash():
+    event = _event()
+    same = Event(**event.dict())
+    other = Event(**dict(event.dict(), url="http://example.com/other.html"))
+    assert len({event, same, other}) == 2
+    assert {event: 1}[same] == 1
+
+
+def test_pickle():
+    event = _event()
+    assert pickle.loads(pickle.dumps(event)) == event
+
+
+def test_plain_strings():
+    event = _event()
+    # bs4の文字列は木を参照し続けるので, ただのstrにしておく
+    assert all(type(getattr(event, key)) is str for key in ("title", "url", "location", "description"))
+    assert Event(**event.dict()).location is event.location
+
+
+def test_order():
+    import datetime as dt
+    early = Event("a", "a", "", "", dt.date(2019, 2, 1), None, dt.time(18), None)
+    late = Event("b", "b", "", "", dt.date(2019, 2, 2), None, dt.time(9), None)
+    # 時刻だけでなく日付も見て並べる
+    assert sorted([late, early]) == [early, late]
+    assert late.start_datetime.utcoffset() == dt.timedelta(hours=9)
+    assert early.end_datetime == early.start_datetime.replace(hour=23, minute=59, second=59, microsecond=999999)
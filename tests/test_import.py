@@ -0,0 +1,35 @@
+""" `import kueventparser` とCLIの起動が重い依存を読み込まないかのテスト
+"""
+import subprocess
+import sys
+
+# 読み込みに時間のかかる依存. 使う時まで読み込まない
+HEAVY_MODULES = ('bs4', 'lxml', 'requests', 'pytz', 'asyncio', 'kueventparser.adapters.official')
+
+
+def _loaded(code: str):
+    """新しいインタプリタで `code` を実行し, 読み込まれた `HEAVY_MODULES` を返す"""
+    code += "\nimport sys\nprint('loaded:', *(m for m in {!r} if m in sys.modules))".format(HEAVY_MODULES)
+    result = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    return result.stdout.splitlines()[-1].split()[1:]
+
+
+def test_lazy_dependencies():
+    for module in ('kueventparser', 'kueventparser.core', 'kueventparser.api'):
+        assert _loaded('import ' + module) == [], module
+    # `--help` や引数の誤りでは依存を読み込まない
+    code = ("import sys\nsys.argv = ['parse_event', 'get_all', '--help']\nfrom kueventparser.core import main\n"
+            "try:\n    main()\nexcept SystemExit:\n    pass")
+    assert _loaded(code) == []
+    # 使う時に読み込む
+    assert 'bs4' in _loaded("from kueventparser.core import select_factory\nselect_factory('official')")
+
+
+def test_lazy_api():
+    import kueventparser
+    from kueventparser import api
+
+    assert kueventparser.get_all is api.get_all
+    assert kueventparser.api is api
+    assert 'generate_all' in dir(kueventparser)
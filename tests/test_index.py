@@ -0,0 +1,42 @@
+""" 'obj:kueventparser.index' のテスト
+"""
+import datetime
+import pickle
+
+from kueventparser.events import Event
+from kueventparser.index import CalendarIndex, EventIndex
+
+
+def test_calendar_index():
+    d = datetime.date
+    index = CalendarIndex({d(2019, 2, 1): ["a", "b"], d(2019, 2, 2): ["b", "c"]})
+    index.update(CalendarIndex({d(2019, 3, 1): ["c", "d"]}))
+    assert index.urls() == ["a", "b", "c", "d"]
+    assert index.urls(d(2019, 2, 2), d(2019, 2, 28)) == ["b", "c"]
+    assert index.slice(d(2019, 2, 2), d(2019, 3, 1)).urls() == ["b", "c", "d"]
+    assert list(index) == [d(2019, 2, 1), d(2019, 2, 2), d(2019, 3, 1)]
+    assert pickle.loads(pickle.dumps(index)) == index
+
+
+def test_event_index():
+    d, t = datetime.date, datetime.time
+    # 2/1 10:00-12:00, 2/1-2/3 9:00-17:00, 2/2 終日
+    a = Event("a", "a", "", "", d(2019, 2, 1), d(2019, 2, 1), t(10), t(12))
+    b = Event("b", "b", "", "", d(2019, 2, 1), d(2019, 2, 3), t(9), t(17))
+    c = Event("c", "c", "", "", d(2019, 2, 2), None, None, None)
+    index = EventIndex([c, a, b])
+    assert list(index) == [b, a, c]
+    assert index.on(d(2019, 2, 2)) == [b, c]
+    assert index.at(datetime.datetime(2019, 2, 1, 13)) == [b]
+    assert index.at(datetime.datetime(2019, 2, 1, 11)) == [b, a]
+    # awareな日時は日本時間に直す(2/1 11:00 JST)
+    assert index.at(datetime.datetime(2019, 2, 1, 2, tzinfo=datetime.timezone.utc)) == [b, a]
+    assert index.overlapping(d(2019, 2, 3), d(2019, 2, 28)) == [b]
+    # 同じURLは置き換える
+    moved = Event("b", "b", "", "", d(2019, 3, 1), d(2019, 3, 1), t(9), t(17))
+    index.add(moved)
+    assert len(index) == 3 and moved in index and b not in index
+    assert index.overlapping(d(2019, 2, 3), d(2019, 2, 28)) == []
+    index.remove(a)
+    assert list(index) == [c, moved]
+    assert list(pickle.loads(pickle.dumps(index))) == [c, moved]
@@ -0,0 +1,107 @@
+""" 'obj:kueventparser.memo' のテスト
+"""
+import datetime
+
+import pytest
+
+from kueventparser import api
+from kueventparser.memo import ResultCache
+from kueventparser.stats import Stats
+from tests import conftest
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_result_cache():
+    clock = Clock()
+    memo = ResultCache(ttl=10, max_entries=2, clock=clock)
+    memo.put("a", [1])
+    memo.put("b", [2])
+    assert memo.get("a") == [1]
+    # "b" が最も長く使われていない
+    memo.put("c", [3])
+    assert "b" not in memo and "a" in memo and "c" in memo
+    assert memo.evictions == 1
+    clock.now = 10
+    assert memo.get("a") is None
+    assert memo.summary() == {'entries': 1, 'hits': 1, 'misses': 1, 'evictions': 1}
+    with pytest.raises(ValueError):
+        ResultCache(max_entries=0)
+
+
+def test_memo(offline):
+    memo = ResultCache()
+    stats = Stats()
+    events = api.get_all(year=2017, month=10, memo=memo, stats=stats)
+    requested = len(offline)
+    assert events
+
+    # 2回目は取得しない. 返したものを書き換えても保持しているものは変わらない
+    events[0].title = "changed"
+    events.pop()
+    again = api.get_all(start_date=datetime.date(2017, 10, 1), end_date=datetime.date(2017, 10, 31),
+                        memo=memo, stats=stats)
+    assert len(offline) == requested
+    assert len(again) == len(events) + 1 and again[0].title != "changed"
+    assert stats.counters['memo.hits'] == 1 and stats.counters['memo.misses'] == 1
+
+    # 取り出すフィールドが違えば別の結果
+    api.get_all(year=2017, month=10, memo=memo, fields=("title",))
+    assert len(offline) > requested and len(memo) == 2
+    # 解析方法や上限が違っても別の結果
+    requested = len(offline)
+    api.get_all(year=2017, month=10, memo=memo, parser="stream", max_bytes=1024)
+    assert len(offline) > requested and len(memo) == 3
+    api.get_all(year=2017, month=10, memo=memo, parser="stream", max_bytes=2048)
+    assert len(memo) == 4
+    api.invalidate(memo=memo, year=2017, month=10)
+    assert len(memo) == 0
+    api.get_all(year=2017, month=10, memo=memo)
+    api.get_all(year=2017, month=10, memo=memo, fields=("title",))
+
+    url = conftest.make_test_event(conftest.DATA_DIR + "/test_event1.xml").url
+    event = api.get(url=url, memo=memo)
+    assert api.get(url=url, memo=memo) == event
+    assert len(memo) == 3
+
+    # URLを指定すれば, そのURLとそのURLのイベントを含む期間の結果を捨てる
+    assert api.invalidate(memo=memo, url=url) == 3
+    api.get_all(year=2017, month=10, memo=memo)
+    assert api.invalidate(memo=memo, year=2017, month=9) == 0
+    assert api.invalidate('official', memo=memo, date=datetime.date(2017, 10, 15)) == 1
+    assert len(memo) == 0
+
+
+def test_memo_ordered(offline):
+    memo = ResultCache()
+    stats = Stats()
+    api.get_all(year=2017, month=10, memo=memo, max_workers=4, stats=stats)
+    # 順序を保たない結果を, 順序を求める呼び出しには返さない
+    ordered = api.get_all(year=2017, month=10, memo=memo, max_workers=4, ordered=True, stats=stats)
+    assert stats.counters['memo.misses'] == 2 and len(memo) == 2
+    assert [event.url for event in ordered] == [event.url for event in api.get_all(year=2017, month=10)]
+
+
+def test_memo_skipped(offline):
+    memo = ResultCache()
+    # lazy はメモ化しない
+    api.get_all(year=2017, month=10, memo=memo, lazy=True)
+    assert len(memo) == 0
+
+
+def test_memo_error():
+    from kueventparser.transports import HTTPError, MemoryTransport
+
+    memo = ResultCache()
+    pages = conftest.fake_pages()
+    del pages[conftest.CALENDAR_URL]
+    # 取得できなかった月は保持しない
+    with pytest.raises(HTTPError):
+        api.get_all(year=2017, month=10, memo=memo, transport=MemoryTransport(pages))
+    assert len(memo) == 0
@@ -0,0 +1,165 @@
+""" 'obj:kueventparser.ratelimit' のテスト
+"""
+import threading
+import time
+
+from kueventparser.ratelimit import RateLimitedTransport, RateLimiter, TokenBucket, parse_retry_after
+from kueventparser.stats import Stats
+from kueventparser.transports import (BaseTransport, HTTPTransport, Response, get_default_transport,
+                                      set_default_transport)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, burst=2, clock=clock)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    # 3つ目からは補充を待つ
+    assert bucket.reserve() == 0.5
+    assert bucket.reserve() == 1.0
+    clock.now += 1.0
+    assert bucket.reserve() == 0.5
+
+
+def test_aimd():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=4.0, max_rate=8.0, concurrency=4, max_concurrency=8, target_latency=1.0,
+                          clock=clock, sleep=clock.sleep)
+    host = limiter.host("http://www.kyoto-u.ac.jp/ja")
+    assert limiter.host("http://www.kyoto-u.ac.jp/en") is host
+    # 応答が速い間は増やす
+    for _ in range(20):
+        host.acquire()
+        host.release(0.1)
+    assert host.concurrency > 4 and host.rate > 4.0
+    assert host.rate <= 8.0 and host.concurrency <= 8
+    # 429で半分に減らす
+    rate, concurrency = host.rate, host.concurrency
+    host.acquire()
+    host.release(0.1, throttled=True, retry_after=30)
+    assert host.rate == rate / 2 and host.concurrency == concurrency / 2
+    # Retry-Afterまで待つ
+    began = clock.now
+    host.acquire()
+    assert clock.now - began >= 30
+    host.release(5.0)
+    assert host.rate == rate / 4
+    assert limiter.snapshot() == {"www.kyoto-u.ac.jp": host.snapshot()}
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("120") == 120.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", now=1445412420.0) == 60.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", now=1445412540.0) == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+class ThrottlingTransport(BaseTransport):
+    """最初の `throttled` 回は429を返す"""
+
+    def __init__(self, throttled, retry_after="1"):
+        self.throttled = throttled
+        self.retry_after = retry_after
+        self.requested = 0
+
+    def get(self, url, headers=None):
+        self.requested += 1
+        if self.requested <= self.throttled:
+            return Response(url, 429, {"Retry-After": self.retry_after}, b"")
+        return Response(url, 200, {}, b"ok")
+
+
+def test_retry_after():
+    slept = []
+    stats = Stats()
+    transport = RateLimitedTransport(ThrottlingTransport(2), RateLimiter(sleep=slept.append), stats=stats,
+                                     retries=3)
+    r = transport.get("http://example.com/")
+    assert r.status_code == 200
+    assert transport.transport.requested == 3
+    assert stats.counters["ratelimit.throttled"] == 2
+    assert 0.9 < max(slept) <= 1.0
+    snapshot = transport.limiter.snapshot()["example.com"]
+    assert stats.gauges == {"ratelimit.rate": snapshot["rate"], "ratelimit.concurrency": snapshot["concurrency"]}
+    assert "ratelimit.rate" in stats.format()
+    # 送り直しても429なら最後のレスポンスを返す
+    transport = RateLimitedTransport(ThrottlingTransport(5, "0"), RateLimiter(), retries=1)
+    assert transport.get("http://example.com/").status_code == 429
+
+
+def test_throttling_server():
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from kueventparser.utils import imap_bounded
+
+    active = []
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            # 同時に3つ以上来たら429を返す
+            with lock:
+                active.append(self.path)
+                throttled = len(active) > 2
+            time.sleep(0.01)
+            body = b"busy" if throttled else b"ok"
+            self.send_response(429 if throttled else 200)
+            if throttled:
+                self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            with lock:
+                active.remove(self.path)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = "http://127.0.0.1:{}".format(server.server_address[1])
+    stats = Stats()
+    limiter = RateLimiter(rate=200.0, max_rate=200.0, concurrency=8, max_concurrency=8)
+    try:
+        with RateLimitedTransport(HTTPTransport(pool_size=8, retries=0), limiter, stats=stats,
+                                  retries=8) as transport:
+            responses = list(imap_bounded(transport.get, ["{}/{}".format(base, i) for i in range(40)],
+                                          max_workers=8))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert all(r.status_code == 200 for r in responses)
+    assert stats.counters["ratelimit.throttled"] > 0
+    # 429を受けて同時リクエスト数を減らしている
+    assert limiter.snapshot()["127.0.0.1:{}".format(server.server_address[1])]["concurrency"] < 8
+
+
+def test_opt_in():
+    from kueventparser.core import prepare
+
+    # デフォルトでは流量を制限しない(max_workers をそのまま使う)
+    set_default_transport(None)
+    try:
+        assert isinstance(get_default_transport(), HTTPTransport)
+        _, _, kwargs = prepare('official', 'get_all', year=2017, month=10, max_workers=8, stats=Stats())
+        assert 'transport' not in kwargs
+        _, _, kwargs = prepare('official', 'get_all', year=2017, month=10, max_rate=2.0)
+        assert isinstance(kwargs['transport'], RateLimitedTransport)
+        assert kwargs['transport'].limiter.max_rate == 2.0
+    finally:
+        set_default_transport(None)
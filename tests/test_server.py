@@ -0,0 +1,166 @@
+""" 'obj:kueventparser.server' のテスト
+"""
+import datetime
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from kueventparser.adapters.official import OfficialEventFactory
+from kueventparser.server import EventServer, EventStore
+from kueventparser.transports import MemoryTransport
+from kueventparser.writers import event_to_record
+from tests import conftest
+
+START = datetime.date(2017, 10, 1)
+END = datetime.date(2017, 10, 31)
+
+
+@pytest.fixture
+def served():
+    """ `fake_pages` のイベントを配信するサーバ
+
+    Returns:
+        tuple: (サーバのURL, transport)
+    """
+    transport = MemoryTransport(conftest.fake_pages())
+    server = EventServer(EventStore(OfficialEventFactory, transport=transport), port=0, quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:{}".format(server.server_address[1]), transport
+    server.shutdown()
+    server.server_close()
+
+
+def request(url, etag=None):
+    headers = {"If-None-Match": etag} if etag else {}
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as r:
+            return r.status, r.headers, r.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def test_events(served):
+    base, transport = served
+    events = sorted(OfficialEventFactory.get_all(START, END, transport=MemoryTransport(conftest.fake_pages())))
+    status, headers, body = request(base + "/events?from=2017-10-01&to=2017-10-31")
+    assert status == 200
+    assert json.loads(body.decode("utf-8")) == [event_to_record(event) for event in events]
+    fetched = len(transport.requested)
+
+    # 2回目は保持しているものを返し, ETagが一致すれば304
+    status, headers_, body = request(base + "/events?from=2017-10-01&to=2017-10-31", headers["ETag"])
+    assert status == 304 and body == b"" and headers_["ETag"] == headers["ETag"]
+    # 期間を絞っても取得し直さない
+    status, _, body = request(base + "/events?from=2017-10-30&to=2017-10-30")
+    assert status == 200
+    assert all(record["start_date"] <= "2017-10-30" for record in json.loads(body.decode("utf-8")))
+    status, _, body = request(base + "/event?url=" + events[0].url)
+    assert status == 200 and json.loads(body.decode("utf-8")) == event_to_record(events[0])
+    assert len(transport.requested) == fetched
+
+    status, headers, body = request(base + "/calendar.ics?from=2017-10-01&to=2017-10-31")
+    assert status == 200 and headers["Content-Type"].startswith("text/calendar")
+    assert body.startswith(b"BEGIN:VCALENDAR\r\n") and body.count(b"BEGIN:VEVENT") == len(events)
+    assert request(base + "/calendar.ics?from=2017-10-01&to=2017-10-31", headers["ETag"])[0] == 304
+
+    stats = json.loads(request(base + "/stats")[2].decode("utf-8"))
+    assert stats["months"] == 1 and stats["misses"] == 1 and stats["hits"] >= 3
+
+
+def test_errors(served):
+    base, _ = served
+    assert request(base + "/event")[0] == 400
+    assert request(base + "/events?from=2017-13-01")[0] == 400
+    assert request(base + "/events?from=2017-10-31&to=2017-10-01")[0] == 400
+    assert request(base + "/events?from=2010-01-01&to=2017-10-01")[0] == 400
+    assert request(base + "/nothing")[0] == 404
+    # 行事カレンダーが取得できない月は保持しない
+    assert request(base + "/events?from=2017-09-01&to=2017-09-30")[0] == 502
+    assert json.loads(request(base + "/stats")[2].decode("utf-8"))["months"] == 0
+    broken = next(url for url in conftest.fake_pages() if "/bungaku/" in url)
+    status, _, body = request(base + "/event?url=" + broken)
+    assert status == 404 and "error" in json.loads(body.decode("utf-8"))
+    # 京大HP以外のURLは取得しない
+    for url in ("http://127.0.0.1:1/secret", "file:///etc/passwd", "http://www.kyoto-u.ac.jp.example.com/"):
+        status, _, body = request(base + "/event?url=" + url)
+        assert status == 400 and "www.kyoto-u.ac.jp" in json.loads(body.decode("utf-8"))["error"]
+
+
+def test_store_single_flight():
+    transport = MemoryTransport(conftest.fake_pages())
+    now = [0.0]
+    store = EventStore(OfficialEventFactory, ttl=10, clock=lambda: now[0], transport=transport, max_workers=2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.month(2017, 10))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 同時に要求されても行事カレンダーは1回だけ取得する
+    assert transport.requested.count(conftest.CALENDAR_URL) == 1
+    assert all(result is results[0] for result in results)
+    # 期限が切れたら取得し直す
+    now[0] = 11
+    store.month(2017, 10)
+    assert transport.requested.count(conftest.CALENDAR_URL) == 2
+
+
+def test_store_bounded():
+    transport = MemoryTransport(conftest.fake_pages())
+    now = [0.0]
+    store = EventStore(OfficialEventFactory, ttl=10, clock=lambda: now[0], max_events=2, transport=transport)
+    urls = [event.url for event in store.month(2017, 10)]
+    assert len(urls) > 2 and store.summary()["events"] == 2
+    # 最も長く使われていないものから捨てる
+    store.event(urls[-2])
+    store.event(urls[0])
+    assert list(store._events) == [urls[-2], urls[0]]
+    # イベント情報の無いURLは保持しない
+    broken = next(url for url in conftest.fake_pages() if "/bungaku/" in url)
+    assert store.event(broken) is None and broken not in store._events
+    # 期限切れのものから捨てる
+    now[0] = 5
+    store.event(urls[1])
+    store.event(urls[0])
+    assert list(store._events) == [urls[1], urls[0]]
+    now[0] = 11
+    store.event(urls[-1])
+    assert list(store._events) == [urls[1], urls[-1]]
+    with pytest.raises(ValueError):
+        EventStore(OfficialEventFactory, max_events=0)
+
+
+def test_store_load_failure():
+    class Failing(MemoryTransport):
+        def get(self, url, headers=None):
+            raise ConnectionError("down")
+
+    store = EventStore(OfficialEventFactory, transport=Failing({}))
+    url = conftest.make_test_event(conftest.DATA_DIR + "/test_event1.xml").url
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            store.event(url)
+    assert store._loading == {} and store.summary()["events"] == 0
+
+
+def test_store_months_bounded():
+    pages = conftest.fake_pages()
+    november = conftest.CALENDAR_URL.replace("month=10", "month=11")
+    pages[november] = b"<html><body><table></table></body></html>"
+    store = EventStore(OfficialEventFactory, max_months=1, transport=MemoryTransport(pages))
+
+    class Loading(dict):
+        def pop(self, key, default=None):
+            # 取得中の印は保持した後に消す
+            assert key in store._months
+            return super().pop(key, default)
+
+    store._loading = Loading()
+    assert store.month(2017, 10)
+    assert store.month(2017, 11) == []
+    assert list(store._months) == [(2017, 11)] and store._loading == {}
+    with pytest.raises(ValueError):
+        EventStore(OfficialEventFactory, max_months=0)
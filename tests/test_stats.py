@@ -0,0 +1,55 @@
+""" 'obj:kueventparser.stats' のテスト
+"""
+import datetime
+
+from kueventparser.adapters.official import OfficialEventFactory
+from kueventparser.cache import CachingTransport, HTTPCache
+from kueventparser.stats import NULL_STATS, Histogram, Stats
+from kueventparser.transports import MemoryTransport
+from tests import conftest
+
+
+def test_histogram():
+    histogram = Histogram()
+    for seconds in (0.001, 0.002, 0.004, 0.1):
+        histogram.add(seconds)
+    summary = histogram.summary()
+    assert summary['count'] == 4
+    assert summary['min'] == 0.001
+    assert summary['max'] == 0.1
+    assert summary['p50'] <= summary['p90'] <= summary['max']
+    assert Histogram().summary()['mean'] == 0.0
+
+
+def test_generate_all_stats(tmpdir):
+    pages = conftest.fake_pages()
+    started = []
+    stats = Stats(on_start=started.append)
+    transport = CachingTransport(MemoryTransport(pages), HTTPCache(str(tmpdir)))
+    events = list(OfficialEventFactory.generate_all(datetime.date(2017, 10, 1), datetime.date(2017, 10, 31),
+                                                    transport=transport, stats=stats))
+    summary = stats.summary()
+    counters = summary['counters']
+    assert counters['events'] == len(events)
+    assert counters['pages'] == counters['events'] + counters['events.none'] + 1
+    assert counters['bytes'] > 0
+    assert 'cache.hits' not in counters
+    assert summary['stages']['event.fetch']['count'] == counters['pages'] - 1
+    assert summary['stages']['event.strings']['count'] == counters['events']
+    assert set(started) == {'calendar.fetch', 'calendar.parse', 'calendar.index',
+                            'event.fetch', 'event.parse', 'event.strings'}
+    assert 'event.parse' in stats.format()
+
+    # 2回目はカレンダーがキャッシュから返り, イベント情報の無いページは取得しない
+    stats = Stats()
+    list(OfficialEventFactory.generate_all(datetime.date(2017, 10, 1), datetime.date(2017, 10, 31),
+                                           transport=transport, stats=stats))
+    assert stats.counters['cache.hits'] == stats.counters['pages']
+    assert stats.counters['events.none'] == counters['events.none']
+
+
+def test_null_stats(offline):
+    event = OfficialEventFactory.get(url=conftest.make_test_event(
+        conftest.DATA_DIR + "/test_event1.xml").url, stats=NULL_STATS)
+    assert event is not None
+    assert NULL_STATS.summary() == {'counters': {}, 'gauges': {}, 'stages': {}}
@@ -0,0 +1,66 @@
+""" 'obj:kueventparser.sync' のテスト
+"""
+from kueventparser import api
+from kueventparser.sync import ADDED, CHANGED, REMOVED, StateStore
+from kueventparser.transports import MemoryTransport
+from tests import conftest
+
+
+def test_sync(tmpdir):
+    state = str(tmpdir.join("state.sqlite3"))
+    pages = conftest.fake_pages()
+    transport = MemoryTransport(pages)
+
+    def sync(**kwargs):
+        transport.requested.clear()
+        return list(api.sync(state=state, year=2017, month=10, transport=transport, **kwargs))
+
+    first = sync()
+    assert first and all(delta.kind == ADDED for delta in first)
+    with StateStore(state) as store:
+        assert len(store.events()) == len(first)
+
+    # 確認済みのページは取得しない
+    assert sync() == []
+    assert transport.requested == [conftest.CALENDAR_URL]
+
+    # ページを確認し直しても本文が同じなら差分は無い
+    assert sync(recheck=0) == []
+    assert len(transport.requested) > 1
+
+    changed = [url for url in pages if "/rigaku/" in url][0]
+    pages[changed] = pages[changed].replace("田中二郎".encode(), "山田太郎".encode())
+    removed = [url for url in pages if "/sougou/" in url][0]
+    pages[conftest.CALENDAR_URL] = pages[conftest.CALENDAR_URL].replace(removed.encode(), b"")
+    deltas = sync(recheck=0)
+    assert {(delta.kind, delta.url) for delta in deltas} == {(CHANGED, changed), (REMOVED, removed)}
+    assert [d.event.title for d in deltas if d.kind == CHANGED][0].startswith("山田太郎")
+
+
+def test_sync_calendar_error(tmpdir):
+    import datetime
+
+    import pytest
+
+    from kueventparser.stats import Stats
+    from kueventparser.transports import HTTPError
+
+    state = str(tmpdir.join("state.sqlite3"))
+    pages = conftest.fake_pages()
+    november = conftest.CALENDAR_URL.replace("month=10", "month=11")
+    pages[november] = b"<html><body><table></table></body></html>"
+    transport = MemoryTransport(pages)
+    added = list(api.sync(state=state, year=2017, month=10, transport=transport))
+    assert added and all(delta.kind == ADDED for delta in added)
+
+    # 行事カレンダーのエラーページを空のカレンダーとして扱わない
+    del pages[conftest.CALENDAR_URL]
+    with pytest.raises(HTTPError):
+        list(api.sync(state=state, year=2017, month=10, transport=transport, recheck=0))
+    # 一部の月だけ取得できなければ, その月のイベントは削除しない
+    stats = Stats()
+    assert list(api.sync(state=state, start_date=datetime.date(2017, 10, 1), end_date=datetime.date(2017, 11, 30),
+                         transport=transport, recheck=0, stats=stats)) == []
+    assert stats.counters["calendar.failed"] == 1
+    with StateStore(state) as store:
+        assert len(store.events()) == len(added)
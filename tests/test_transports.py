@@ -0,0 +1,149 @@
+""" 'obj:kueventparser.transports' のテスト
+"""
+import asyncio
+import gzip
+
+from kueventparser.transports import AsyncHTTPTransport, Response, decode_content
+from tests import conftest
+
+
+def test_response_encoding():
+    r = Response("http://example.com", 200, {"Content-Type": "text/html; charset=UTF-8"}, b"")
+    assert r.encoding == "utf-8"
+    assert Response("http://example.com", 200, {}, b"").encoding is None
+
+
+def test_decode_content():
+    assert decode_content(gzip.compress(b"abc"), "gzip") == b"abc"
+    assert decode_content(b"abc", None) == b"abc"
+
+
+def test_async_transport(stand_in_server):
+    async def main():
+        async with AsyncHTTPTransport(limit=4) as transport:
+            calendar = conftest.CALENDAR_URL.replace("http://www.kyoto-u.ac.jp", stand_in_server)
+            responses = await asyncio.gather(*[transport.get(calendar) for _ in range(8)])
+            missing = await transport.get(stand_in_server + "/missing")
+        return responses, missing
+
+    responses, missing = asyncio.run(main())
+    assert all(r.status_code == 200 for r in responses)
+    assert len({r.content for r in responses}) == 1
+    assert missing.status_code == 404
+
+
+def test_async_transport_protocol():
+    ok = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+    # 要求毎の応答. Noneなら応答せずに接続を切る(サーバ側で切れたkeep-aliveの接続)
+    replies = [
+        b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n",
+        b"HTTP/1.1 100 Continue\r\n\r\n" + ok,
+        None,
+        ok,
+        ok,
+    ]
+    connections = []
+
+    async def handle(reader, writer):
+        connections.append(writer)
+        while replies:
+            try:
+                await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:
+                break
+            reply = replies.pop(0)
+            if reply is None:
+                break
+            writer.write(reply)
+            await writer.drain()
+        writer.close()
+
+    transport = AsyncHTTPTransport(backoff_factor=0)
+
+    async def main(count):
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        url = "http://127.0.0.1:{}/".format(server.sockets[0].getsockname()[1])
+        try:
+            return [await transport.get(url) for _ in range(count)]
+        finally:
+            server.close()
+
+    # 503はリトライし, 100 Continueは読み飛ばす. 切れていた接続は新しい接続でやり直す
+    responses = asyncio.run(main(2))
+    assert [(r.status_code, r.content) for r in responses] == [(200, b"ok")] * 2
+    assert len(connections) == 2
+    # 別のイベントループでも使える(前のループの接続は使わない)
+    assert asyncio.run(main(1))[0].content == b"ok"
+    assert len(connections) == 3 and replies == []
+
+
+def test_stream(stand_in_server):
+    from kueventparser.transports import HTTPTransport, MemoryTransport
+
+    calendar = conftest.CALENDAR_URL.replace("http://www.kyoto-u.ac.jp", stand_in_server)
+    with HTTPTransport() as transport:
+        content = transport.get(calendar).content
+        with transport.stream(calendar, chunk_size=1024) as r:
+            assert r.status_code == 200 and r.encoding == "utf-8"
+            chunks = r.iter_content()
+            assert next(chunks) == content[:1024]
+        # 読み終わる前に閉じても次のリクエストに使える
+        assert transport.get(calendar).content == content
+    # `get` しかないtransportは全体を分けて返す
+    content = conftest.fake_pages()[conftest.CALENDAR_URL]
+    r = MemoryTransport(conftest.fake_pages()).stream(conftest.CALENDAR_URL, chunk_size=1000)
+    assert b"".join(r.iter_content()) == content
+    assert MemoryTransport({}).stream("http://example.com/").status_code == 404
+
+
+def test_http_transport_retry():
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from kueventparser.transports import HTTPTransport
+
+    requests_count = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            requests_count.append(self.path)
+            # 最初の2回は503を返す
+            status = 503 if len(requests_count) <= 2 else 200
+            body = gzip.compress(b"<html>ok</html>")
+            self.send_response(status)
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with HTTPTransport(retries=3, backoff_factor=0) as transport:
+            r = transport.get("http://127.0.0.1:{}/".format(server.server_address[1]))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert r.status_code == 200
+    assert r.content == b"<html>ok</html>"
+    assert len(requests_count) == 3
+
+
+def test_memory_transport_factory(offline):
+    import datetime
+
+    from kueventparser.adapters.official import OfficialEventFactory
+    from kueventparser.transports import MemoryTransport
+
+    transport = MemoryTransport(conftest.fake_pages())
+    events = OfficialEventFactory.get_all(datetime.date(2017, 10, 1), datetime.date(2017, 10, 31),
+                                          transport=transport)
+    assert events
+    assert transport.requested[0] == conftest.CALENDAR_URL
+    # デフォルトのtransportは使われない
+    assert offline == []
@@ -41,6 +41,58 @@ def test_parse_date():
     assert utils.parse_str_to_date(case_in_3) == case_out
 
 
+def test_parse_invalid():
+    import pytest
+    with pytest.raises(ValueError):
+        utils.parse_str_to_time("未定")
+    with pytest.raises(ValueError):
+        utils.parse_str_to_date("未定")
+    # 長い数字の列等でも線形時間で終わる
+    with pytest.raises(ValueError):
+        utils.parse_str_to_time("1" * 100000 + "時")
+    with pytest.raises(ValueError):
+        utils.parse_str_to_date("2019年1月" * 20000)
+
+
+def test_parse_many():
+    import datetime as dt
+    times = utils.parse_times_many(["12時10分～12時50分", "未定", "12時10分～12時50分"])
+    assert times[0] == times[2] == utils.parse_str_to_time("12時10分～12時50分")
+    assert times[1] is None
+    # 結果の辞書は呼び出し毎に別のもの
+    assert times[0] is not times[2]
+    dates = utils.parse_dates_many(["2019年08月06日 火曜日", None])
+    assert dates == [{"start": dt.date(2019, 8, 6), "end": dt.date(2019, 8, 6)}, None]
+
+
+def test_imap_pipelined():
+    import threading
+
+    import pytest
+    fetched = []
+    lock = threading.Lock()
+
+    def fetch(n):
+        with lock:
+            fetched.append(n)
+        return n
+
+    results = utils.imap_pipelined(fetch, abs, range(-100, 0), fetch_workers=2, parse_workers=2, ordered=True,
+                                   queue_size=2)
+    assert next(results) == 100
+    # パースを待っている間, 取得はキューとワーカーの分しか先に進まない
+    assert len(fetched) < 50
+    results.close()
+    assert list(utils.imap_pipelined(fetch, abs, range(-10, 0), parse_workers=2, ordered=True)) == \
+        list(range(10, 0, -1))
+
+    def fail(n):
+        raise KeyError(n)
+
+    with pytest.raises(KeyError):
+        list(utils.imap_pipelined(fail, abs, range(3), parse_workers=1))
+
+
 def test_url_to_soup():
     """url_to_soup のテスト
 
@@ -55,3 +107,10 @@ def test_url_to_soup():
     with open(uri, encoding="utf-8") as f:
         soup = BeautifulSoup(f, "html.parser")
     assert soup.title == utils.url_to_soup(url).title
+
+
+def test_months_between():
+    import datetime as dt
+    assert utils.months_between(dt.date(2018, 11, 30), dt.date(2019, 2, 1)) == [
+        (2018, 11), (2018, 12), (2019, 1), (2019, 2)]
+    assert utils.months_between(dt.date(2019, 2, 1), dt.date(2019, 2, 28)) == [(2019, 2)]
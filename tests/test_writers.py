@@ -0,0 +1,70 @@
+""" 'obj:kueventparser.writers' のテスト
+"""
+import csv
+import io
+import json
+from os import path
+
+import pytest
+
+from kueventparser import writers
+from tests import conftest
+
+
+def _event():
+    return conftest.make_test_event(path.join(path.dirname(__file__), "data", "test_event1.xml"))
+
+
+def _write(format, events):
+    stream = io.StringIO()
+    with writers.get_writer(format, stream) as writer:
+        for event in events:
+            writer.write(event)
+    return stream.getvalue()
+
+
+def test_jsonl():
+    event = _event()
+    lines = _write("jsonl", [event, None, event]).splitlines()
+    assert len(lines) == 2
+    record = json.loads(lines[0])
+    assert record["title"] == event.title
+    assert record["start_date"] == "2017-10-30"
+    assert record["end_date"] == "2018-01-15"
+    # pytzのLMT(+09:19)ではなく日本時間
+    assert record["start"] == "09:00:00+09:00"
+    assert record["end"] == "21:30:00+09:00"
+
+
+def test_csv():
+    event = _event()
+    rows = list(csv.DictReader(io.StringIO(_write("csv", [event]))))
+    assert rows == [{key: value or "" for key, value in writers.event_to_record(event).items()}]
+
+
+def test_fields():
+    event = _event()
+    stream = io.StringIO()
+    with writers.get_writer("csv", stream, fields=("title", "start_date")) as writer:
+        writer.write(event)
+    assert list(csv.DictReader(io.StringIO(stream.getvalue()))) == [
+        {"title": event.title, "start_date": "2017-10-30"}]
+
+
+def test_ics():
+    event = _event()
+    text = _write("ics", [event])
+    assert text.startswith("BEGIN:VCALENDAR\r\n") and text.endswith("END:VCALENDAR\r\n")
+    assert "DTSTART:20171030T000000Z\r\n" in text
+    assert "DTEND:20180115T123000Z\r\n" in text
+    assert all(len(line.encode("utf-8")) <= 75 for line in text.split("\r\n"))
+    # 折り返しを戻すと元の文字列になる
+    unfolded = text.replace("\r\n ", "")
+    assert "SUMMARY:" + event.title + "\r\n" in unfolded
+
+
+def test_text():
+    event = _event()
+    assert _write("text", [event, None]) == "{}\nNone\n".format(event.title)
+    with pytest.raises(ValueError):
+        writers.get_writer("xml", io.StringIO())